@@ -0,0 +1,257 @@
+"""
+End-to-end load test of the API.
+
+Runs the Flask app of main.py in-process on a local storage engine, with
+tokens signed by a locally generated key set, and reports per-endpoint
+latency percentiles, throughput and datastore calls.
+
+    python -m benchmarks.loadtest --engine memory --mix read --requests 5000
+    python -m benchmarks.loadtest --record requests.jsonl --requests 2000
+    python -m benchmarks.loadtest --replay requests.jsonl --report out.json
+
+A recording can be replayed against any engine as long as the seeding
+arguments (--seed, --users, --tasks, --lists, --max-list-size) match.
+"""
+import argparse
+import contextvars
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+from benchmarks import mixes
+from benchmarks.local_auth import LocalSigner
+from benchmarks.seed import seed
+
+ENGINE_CALLS = ('get', 'get_multi', 'put', 'put_multi', 'delete',
+                'delete_multi', 'query', 'count')
+
+
+class CountingEngine:
+    """
+    Proxy of a storage engine counting the calls made in the current
+    context, so that calls can be attributed to the request being served,
+    including the reads it runs in models.model.read_pool.
+    """
+
+    def __init__(self, engine):
+        self._engine = engine
+        self._counts = contextvars.ContextVar('counts', default=None)
+
+    def __getattr__(self, name):
+        attr = getattr(self._engine, name)
+        if name not in ENGINE_CALLS:
+            return attr
+
+        def counted(*args, **kwargs):
+            counts = self._counts.get()
+            if counts is not None:
+                counts[name] += 1
+            return attr(*args, **kwargs)
+        return counted
+
+    def start(self):
+        self._counts.set(defaultdict(int))
+
+    def stop(self):
+        counts = self._counts.get()
+        self._counts.set(None)
+        return counts
+
+
+def percentile(sorted_values, p):
+    """
+    Nearest-rank percentile of an ascending list.
+    """
+    if not sorted_values:
+        return 0.0
+    rank = max(1, -(-len(sorted_values) * p // 100))
+    return sorted_values[int(rank) - 1]
+
+
+def run(app, dataset, requests, concurrency, engine):
+    """
+    Replay the requests with concurrency worker threads. Requests of a user
+    are always sent by the same worker and in order.
+
+    Returns
+        samples : list
+            (endpoint, seconds, status code, engine call counts) tuples
+        elapsed : float
+            wall-clock seconds of the run
+    """
+    queues = [[] for _ in range(concurrency)]
+    for req in requests:
+        queues[req['user'] % concurrency].append(req)
+    samples = []
+    lock = threading.Lock()
+
+    def worker(queue):
+        client = app.test_client()
+        local = []
+        for req in queue:
+            headers = {"Accept": "application/json"}
+            if req['auth']:
+                headers["Authorization"] = \
+                    "Bearer " + dataset[req['user']]['token']
+            headers.update(req.get('headers', {}))
+            url = mixes.resolve(req, dataset)
+            engine.start()
+            start = time.perf_counter()
+            res = client.open(url, method=req['method'], headers=headers,
+                              json=mixes.resolve_body(req, dataset),
+                              data=req.get('data'))
+            # Streamed responses are produced while they are read.
+            res.get_data()
+            res.close()
+            seconds = time.perf_counter() - start
+            local.append((req['endpoint'], seconds, res.status_code,
+                          engine.stop()))
+        with lock:
+            samples.extend(local)
+
+    threads = [threading.Thread(target=worker, args=(queue,))
+               for queue in queues]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return samples, time.perf_counter() - start
+
+
+def summarize(samples, elapsed):
+    """
+    Aggregate samples into per-endpoint statistics.
+    """
+    by_endpoint = defaultdict(list)
+    for sample in samples:
+        by_endpoint[sample[0]].append(sample)
+    by_endpoint['ALL'] = samples
+    endpoints = {}
+    for endpoint, group in sorted(by_endpoint.items()):
+        latencies = sorted(s[1] * 1000 for s in group)
+        statuses = defaultdict(int)
+        calls = defaultdict(int)
+        for _, _, status, counts in group:
+            statuses[str(status)] += 1
+            for name, n in counts.items():
+                calls[name] += n
+        endpoints[endpoint] = {
+            "requests": len(group),
+            "throughput_rps": len(group) / elapsed if elapsed else 0.0,
+            "p50_ms": percentile(latencies, 50),
+            "p95_ms": percentile(latencies, 95),
+            "p99_ms": percentile(latencies, 99),
+            "mean_ms": sum(latencies) / len(latencies),
+            "status": dict(statuses),
+            "datastore_calls_per_request": {
+                name: calls[name] / len(group) for name in sorted(calls)},
+            "datastore_calls_total_per_request":
+                sum(calls.values()) / len(group)
+        }
+    return endpoints
+
+
+def print_report(endpoints):
+    header = (f"{'endpoint':<32}{'reqs':>7}{'rps':>9}{'p50 ms':>9}"
+              f"{'p95 ms':>9}{'p99 ms':>9}{'ds/req':>8}  status")
+    print(header)
+    print("-" * len(header))
+    for endpoint, stats in endpoints.items():
+        status = " ".join(f"{code}:{n}"
+                          for code, n in sorted(stats['status'].items()))
+        print(f"{endpoint:<32}{stats['requests']:>7}"
+              f"{stats['throughput_rps']:>9.1f}{stats['p50_ms']:>9.2f}"
+              f"{stats['p95_ms']:>9.2f}{stats['p99_ms']:>9.2f}"
+              f"{stats['datastore_calls_total_per_request']:>8.2f}  {status}")
+
+
+def build_app(engine_name, sqlite_path):
+    """
+    Import the app with a local storage engine and local token signing.
+    """
+    from config.config import Config
+    Config.STORAGE_ENGINE = engine_name
+    Config.SQLITE_PATH = sqlite_path
+    import main
+    import models.model as model
+    from validations import auth
+    from validations.jwks import file_fetcher
+
+    signer = LocalSigner(Config.AUTH0_DOMAIN, Config.AUTH0_CLIENT_ID)
+    jwks_path = os.path.join(tempfile.mkdtemp(), "jwks.json")
+    signer.write_jwks(jwks_path)
+    auth.jwks_store.set_fetcher(file_fetcher(jwks_path))
+
+    # Count the calls that miss the entity cache.
+    model.engine.engine = CountingEngine(model.engine.engine)
+    return main.app, model, signer
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--engine", choices=["memory", "sqlite"],
+                        default="memory")
+    parser.add_argument("--sqlite-path", default=None,
+                        help="database of the sqlite engine (default: temp)")
+    parser.add_argument("--mix", choices=sorted(mixes.MIXES), default="read")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--tasks", type=int, default=50,
+                        help="tasks per user")
+    parser.add_argument("--lists", type=int, default=5,
+                        help="lists per user")
+    parser.add_argument("--max-list-size", type=int, default=20)
+    parser.add_argument("--record", help="save the generated requests")
+    parser.add_argument("--replay", help="replay recorded requests")
+    parser.add_argument("--report", help="write the report as JSON")
+    args = parser.parse_args(argv)
+
+    sqlite_path = args.sqlite_path or \
+        os.path.join(tempfile.mkdtemp(), "loadtest.db")
+    app, model, signer = build_app(args.engine, sqlite_path)
+    rng = random.Random(args.seed)
+
+    started = time.perf_counter()
+    dataset = seed(app.test_client(), signer, model.add_user,
+                   users=args.users, tasks_per_user=args.tasks,
+                   lists_per_user=args.lists,
+                   max_list_size=args.max_list_size, rng=rng)
+    print(f"Seeded {args.users} users in "
+          f"{time.perf_counter() - started:.1f}s")
+
+    if args.replay:
+        requests = mixes.load(args.replay)
+    else:
+        requests = mixes.generate(dataset, args.mix, args.requests, rng)
+    if args.record:
+        mixes.save(requests, args.record)
+
+    model.engine.clear()
+    samples, elapsed = run(app, dataset, requests, args.concurrency,
+                           model.engine.engine)
+    endpoints = summarize(samples, elapsed)
+    print_report(endpoints)
+    cache = model.engine.stats()
+    print(f"Entity cache hit ratio {cache['hit_ratio']:.1%} "
+          f"({cache['local']['hits']} local hits, "
+          f"{cache['local']['misses']} misses)")
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump({
+                "created": datetime.now(timezone.utc).isoformat(),
+                "arguments": vars(args),
+                "elapsed_s": elapsed,
+                "endpoints": endpoints,
+                "entity_cache": cache
+            }, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
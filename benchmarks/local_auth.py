@@ -0,0 +1,56 @@
+import base64
+import json
+import time
+import rsa
+from jose import jwt
+
+KID = "loadtest"
+
+
+def _b64(number):
+    data = number.to_bytes((number.bit_length() + 7) // 8, "big")
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode()
+
+
+class LocalSigner:
+    """
+    A locally generated RS256 key pair standing in for Auth0. It publishes
+    a JWKS document and signs id tokens the app accepts.
+    """
+
+    def __init__(self, domain, audience, bits=2048):
+        self.issuer = "https://" + domain + "/"
+        self.audience = audience
+        public_key, private_key = rsa.newkeys(bits)
+        self._pem = private_key.save_pkcs1().decode()
+        self.jwks = {"keys": [{
+            "kty": "RSA",
+            "kid": KID,
+            "use": "sig",
+            "alg": "RS256",
+            "n": _b64(public_key.n),
+            "e": _b64(public_key.e)
+        }]}
+
+    def write_jwks(self, path):
+        """
+        Write the JWKS document to path, to be served by
+        validations.jwks.file_fetcher.
+        """
+        with open(path, "w") as f:
+            json.dump(self.jwks, f)
+
+    def token(self, sub, lifetime=3600):
+        """
+        Return a signed id token of the sub.
+        """
+        now = int(time.time())
+        claims = {
+            "sub": sub,
+            "aud": self.audience,
+            "iss": self.issuer,
+            "iat": now,
+            "exp": now + lifetime
+        }
+        return jwt.encode(claims, self._pem, algorithm="RS256",
+                          headers={"kid": KID})
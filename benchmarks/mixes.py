@@ -0,0 +1,314 @@
+import json
+import random
+from datetime import timedelta
+from benchmarks.seed import BASE_DATE
+
+# Weights of the endpoints in each request mix. Every route of the
+# blueprints is covered by the 'uniform' mix.
+MIXES = {
+    "read": {
+        "GET /tasks": 20,
+        "GET /tasks/<id>": 25,
+        "GET /lists": 10,
+        "GET /lists (public)": 15,
+        "GET /lists/<id>": 15,
+        "GET /lists/<id> (public)": 10,
+        "GET /lists/<id>/tasks": 5,
+        "PATCH /tasks/<id>": 3,
+        "POST /tasks": 2,
+    },
+    "write": {
+        "POST /tasks": 20,
+        "PATCH /tasks/<id>": 15,
+        "PUT /tasks/<id>": 5,
+        "DELETE /tasks/<id>": 5,
+        "POST /lists": 5,
+        "PATCH /lists/<id>": 5,
+        "PUT /lists/<id>": 3,
+        "DELETE /lists/<id>": 1,
+        "PATCH /lists/<id>/tasks/<id>": 15,
+        "DELETE /lists/<id>/tasks/<id>": 10,
+        "GET /tasks": 10,
+        "GET /tasks/<id>": 6,
+        "POST /tasks:batch": 5,
+        "PATCH /lists/<id>/tasks": 3,
+        "DELETE /lists/<id>/tasks": 2,
+    },
+    "uniform": {endpoint: 1 for endpoint in [
+        "POST /tasks", "GET /tasks", "GET /tasks/<id>", "PATCH /tasks/<id>",
+        "PUT /tasks/<id>", "DELETE /tasks/<id>", "POST /lists", "GET /lists",
+        "GET /lists (public)", "GET /lists/<id>", "GET /lists/<id> (public)",
+        "PATCH /lists/<id>", "PUT /lists/<id>", "DELETE /lists/<id>",
+        "PATCH /lists/<id>/tasks/<id>", "DELETE /lists/<id>/tasks/<id>",
+        "GET /users", "GET /users/<id>", "POST /tasks:batch",
+        "PATCH /lists/<id>/tasks", "DELETE /lists/<id>/tasks",
+        "GET /lists/<id>/tasks", "GET /sync", "GET /tasks (filtered)",
+        "GET /lists/<id> (expand)", "GET /export", "POST /import",
+        "GET /jobs/<id>",
+    ]},
+}
+
+
+class _UserState:
+    """
+    What a user's data looks like after the requests generated so far, so
+    that every generated request is valid when replayed in order.
+    """
+
+    def __init__(self, user):
+        self.tasks = list(range(len(user['tasks'])))
+        self.lists = list(range(len(user['lists'])))
+        index = {task_id: i for i, task_id in enumerate(user['tasks'])}
+        self.members = {}
+        self.list_of = {}
+        for j, list_id in enumerate(user['lists']):
+            self.members[j] = [index[t] for t in user['members'][list_id]]
+            for i in self.members[j]:
+                self.list_of[i] = j
+        self.names = {j: user['list_names'][list_id]
+                      for j, list_id in enumerate(user['lists'])}
+        self.public = [user['lists'].index(l) for l in user['public']]
+        self.jobs = list(range(len(user.get('jobs', []))))
+        self.created = 0
+
+    def free_tasks(self):
+        return [i for i in self.tasks if i not in self.list_of]
+
+    def delete_task(self, i):
+        self.tasks.remove(i)
+        j = self.list_of.pop(i, None)
+        if j is not None:
+            self.members[j].remove(i)
+
+    def delete_list(self, j):
+        for i in self.members.pop(j):
+            del self.list_of[i]
+            self.tasks.remove(i)
+        self.lists.remove(j)
+        if j in self.public:
+            self.public.remove(j)
+
+
+def generate(dataset, mix="read", count=1000, rng=None):
+    """
+    Generate a replayable sequence of requests against seeded data.
+    Requests reference seeded entities by their user and position in the
+    dataset, so a recording can be replayed against any freshly seeded
+    backend with the same seed.
+
+    Parameters
+        dataset : list
+            the dataset returned by benchmarks.seed.seed
+        mix : str
+            name of a mix in MIXES
+        count : int
+            number of requests
+        rng : random.Random
+            source of randomness
+    Returns
+        requests : list
+            dicts of 'endpoint', 'method', 'path', 'user', 'auth' and
+            optionally 'task', 'list', 'job', 'json', 'headers' and 'data'.
+    """
+    rng = rng or random.Random(0)
+    weights = MIXES[mix]
+    endpoints = list(weights)
+    states = [_UserState(user) for user in dataset]
+    requests = []
+    while len(requests) < count:
+        u = rng.randrange(len(dataset))
+        endpoint = rng.choices(endpoints, [weights[e] for e in endpoints])[0]
+        req = _make(endpoint, u, states, rng)
+        if req is not None:
+            requests.append(req)
+    return requests
+
+def _due_date(rng):
+    return (BASE_DATE + timedelta(days=rng.randint(-60, 60))).isoformat()
+
+def _make(endpoint, u, states, rng):
+    """
+    Build a request of the endpoint for user u, or None if the user has no
+    entity the request could target.
+    """
+    state = states[u]
+    req = {"endpoint": endpoint, "method": endpoint.split()[0],
+           "user": u, "auth": True}
+
+    if endpoint == "POST /tasks":
+        req.update(path="/tasks", json={
+            "name": "new task", "description": "created by the load test",
+            "due_date": _due_date(rng)})
+    elif endpoint == "GET /tasks":
+        req.update(path="/tasks")
+    elif endpoint == "GET /tasks (filtered)":
+        due_after = BASE_DATE + timedelta(days=rng.randint(-60, 60))
+        req.update(path="/tasks?completed=false&sort=due_date"
+                        "&fields=name,due_date,completed"
+                        f"&due_after={due_after.isoformat()}"
+                        f"&due_before={(due_after + timedelta(days=7)).isoformat()}")
+    elif endpoint == "GET /sync":
+        req.update(path="/sync")
+    elif endpoint == "GET /export":
+        req.update(path="/export", headers={"Accept": "application/x-ndjson"})
+    elif endpoint == "POST /import":
+        # A new list with a few tasks, as written by GET /export. The
+        # imported entities are not targeted by later requests.
+        state.created += 1
+        records = [{"kind": "lists", "id": 1,
+                    "name": f"imported list {state.created}",
+                    "description": "imported", "public": False}]
+        records += [{"kind": "tasks", "name": "imported task",
+                     "description": "imported by the load test",
+                     "due_date": _due_date(rng), "task_list": {"id": 1}}
+                    for _ in range(5)]
+        req.update(path="/import",
+                   headers={"Content-Type": "application/x-ndjson"},
+                   data="".join(json.dumps(r) + "\n" for r in records))
+    elif endpoint == "GET /jobs/<id>":
+        if not state.jobs:
+            return None
+        req.update(path="/jobs/{job}", job=rng.choice(state.jobs))
+    elif endpoint == "POST /tasks:batch":
+        operations = [{"op": "create", "task": {
+            "name": "batched task", "description": "created in a batch",
+            "due_date": _due_date(rng)}} for _ in range(5)]
+        # Updated tasks are referenced by position like 'task' and resolved
+        # by resolve().
+        for i in rng.sample(state.tasks, min(5, len(state.tasks))):
+            operations.append({"op": "update", "task_ref": i,
+                               "task": {"completed": rng.random() < 0.5}})
+        req.update(path="/tasks:batch", json={"operations": operations})
+    elif endpoint == "GET /users":
+        req.update(path="/users", auth=False)
+    elif endpoint == "GET /users/<id>":
+        req.update(path="/users/{sub}", auth=False)
+    elif endpoint == "POST /lists":
+        state.created += 1
+        req.update(path="/lists", json={
+            "name": f"new list {state.created}", "description": "created",
+            "public": rng.random() < 0.3})
+    elif endpoint == "GET /lists":
+        req.update(path="/lists")
+    elif endpoint == "GET /lists (public)":
+        req.update(path="/lists", auth=False)
+    elif endpoint in ("GET /tasks/<id>", "PATCH /tasks/<id>",
+                      "PUT /tasks/<id>", "DELETE /tasks/<id>"):
+        if not state.tasks:
+            return None
+        i = rng.choice(state.tasks)
+        req.update(path="/tasks/{task}", task=i)
+        if endpoint == "PATCH /tasks/<id>":
+            req["json"] = {"completed": rng.random() < 0.5}
+        elif endpoint == "PUT /tasks/<id>":
+            req["json"] = {"name": "replaced task", "description": "put",
+                           "due_date": _due_date(rng),
+                           "completed": rng.random() < 0.5}
+        elif endpoint == "DELETE /tasks/<id>":
+            state.delete_task(i)
+    elif endpoint == "GET /lists/<id> (public)":
+        if not state.public:
+            return None
+        req.update(path="/lists/{list}", list=rng.choice(state.public),
+                   auth=False)
+    elif endpoint == "GET /lists/<id> (expand)":
+        if not state.lists:
+            return None
+        req.update(path="/lists/{list}?expand=tasks",
+                   list=rng.choice(state.lists))
+    elif endpoint == "GET /lists/<id>/tasks":
+        if not state.lists:
+            return None
+        req.update(path="/lists/{list}/tasks", list=rng.choice(state.lists))
+    elif endpoint in ("GET /lists/<id>", "PATCH /lists/<id>",
+                      "PUT /lists/<id>", "DELETE /lists/<id>"):
+        if not state.lists:
+            return None
+        j = rng.choice(state.lists)
+        req.update(path="/lists/{list}", list=j)
+        if endpoint == "PATCH /lists/<id>":
+            req["json"] = {"description": f"patched {rng.random()}"}
+        elif endpoint == "PUT /lists/<id>":
+            req["json"] = {"name": state.names[j], "description": "put",
+                           "public": j in state.public}
+        elif endpoint == "DELETE /lists/<id>":
+            state.delete_list(j)
+    elif endpoint == "PATCH /lists/<id>/tasks/<id>":
+        free = state.free_tasks()
+        if not free or not state.lists:
+            return None
+        i, j = rng.choice(free), rng.choice(state.lists)
+        state.list_of[i] = j
+        state.members[j].append(i)
+        req.update(path="/lists/{list}/tasks/{task}", list=j, task=i)
+    elif endpoint == "DELETE /lists/<id>/tasks/<id>":
+        if not state.list_of:
+            return None
+        i = rng.choice(sorted(state.list_of))
+        j = state.list_of.pop(i)
+        state.members[j].remove(i)
+        req.update(path="/lists/{list}/tasks/{task}", list=j, task=i)
+    elif endpoint == "PATCH /lists/<id>/tasks":
+        free = state.free_tasks()
+        if not free or not state.lists:
+            return None
+        j = rng.choice(state.lists)
+        refs = rng.sample(free, min(5, len(free)))
+        for i in refs:
+            state.list_of[i] = j
+            state.members[j].append(i)
+        req.update(path="/lists/{list}/tasks", list=j, task_refs=refs)
+    elif endpoint == "DELETE /lists/<id>/tasks":
+        lists = [j for j in state.lists if state.members[j]]
+        if not lists:
+            return None
+        j = rng.choice(lists)
+        refs = rng.sample(state.members[j], min(5, len(state.members[j])))
+        for i in refs:
+            del state.list_of[i]
+            state.members[j].remove(i)
+        req.update(path="/lists/{list}/tasks", list=j, task_refs=refs)
+    else:
+        raise ValueError(f"Unknown endpoint {endpoint!r}.")
+    return req
+
+def resolve_body(req, dataset):
+    """
+    Return the json body of a generated request against the seeded dataset.
+    """
+    tasks = dataset[req['user']]['tasks']
+    if 'task_refs' in req:
+        return {'task_ids': [tasks[i] for i in req['task_refs']]}
+    body = req.get('json')
+    if not body or 'operations' not in body:
+        return body
+    operations = []
+    for op in body['operations']:
+        op = dict(op)
+        if 'task_ref' in op:
+            op['id'] = tasks[op.pop('task_ref')]
+        operations.append(op)
+    return {'operations': operations}
+
+def resolve(req, dataset):
+    """
+    Return the url of a generated request against the seeded dataset.
+    """
+    user = dataset[req['user']]
+    values = {'sub': user['sub']}
+    if 'task' in req:
+        values['task'] = user['tasks'][req['task']]
+    if 'list' in req:
+        values['list'] = user['lists'][req['list']]
+    if 'job' in req:
+        values['job'] = user['jobs'][req['job']]
+    return req['path'].format(**values)
+
+def save(requests, path):
+    with open(path, "w") as f:
+        for req in requests:
+            f.write(json.dumps(req) + "\n")
+
+def load(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
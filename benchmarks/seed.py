@@ -0,0 +1,124 @@
+import json
+import random
+import time
+from datetime import date, timedelta
+from constants.constants import ASYNC_DELETE_THRESHOLD
+
+# Due dates are spread around a fixed day so that seeded data is the same
+# from run to run.
+BASE_DATE = date(2024, 1, 1)
+
+
+def seed(client, signer, add_user, users=10, tasks_per_user=50,
+         lists_per_user=5, max_list_size=20, public_ratio=0.3,
+         jobs_per_user=1, rng=None):
+    """
+    Seed synthetic data through the app's own endpoints, so that the data
+    has exactly the shape the API produces.
+
+    Parameters
+        client : flask.testing.FlaskClient
+            test client of the app
+        signer : benchmarks.local_auth.LocalSigner
+            signs the users' tokens
+        add_user : callable
+            models.model.add_user
+        users : int
+            number of users
+        tasks_per_user : int
+            number of tasks of each user
+        lists_per_user : int
+            number of lists of each user
+        max_list_size : int
+            largest number of tasks added to a list. List sizes vary from
+            empty to max_list_size.
+        public_ratio : float
+            share of public lists
+        jobs_per_user : int
+            number of finished background jobs of each user. Each one
+            deletes an imported list that is too large to delete in the
+            request.
+        rng : random.Random
+            source of randomness
+    Returns
+        dataset : list
+            one dict per user with 'sub', 'token', 'tasks' (task ids),
+            'lists' (list ids), 'list_names', 'public' (ids of public lists),
+            'members' (list id -> task ids) and 'jobs' (job ids).
+    """
+    rng = rng or random.Random(0)
+    dataset = []
+    for u in range(users):
+        sub = f"loadtest-user-{u}"
+        add_user({'user_id': sub, 'name': f"Load Test User {u}"})
+        token = signer.token(sub)
+        headers = {"Authorization": "Bearer " + token,
+                   "Accept": "application/json"}
+        user = {'sub': sub, 'token': token, 'tasks': [], 'lists': [],
+                'list_names': {}, 'public': [], 'members': {}, 'jobs': []}
+
+        for t in range(tasks_per_user):
+            due_date = BASE_DATE + timedelta(days=rng.randint(-60, 60))
+            res = _check(client.post("/tasks", headers=headers, json={
+                "name": f"task {t}",
+                "description": "x" * rng.randint(10, 200),
+                "due_date": due_date.isoformat()
+            }))
+            user['tasks'].append(res['id'])
+
+        free = list(user['tasks'])
+        rng.shuffle(free)
+        for l in range(lists_per_user):
+            public = rng.random() < public_ratio
+            name = f"list {l}"
+            res = _check(client.post("/lists", headers=headers, json={
+                "name": name,
+                "description": "seeded list",
+                "public": public
+            }))
+            list_id = res['id']
+            user['lists'].append(list_id)
+            user['list_names'][list_id] = name
+            if public:
+                user['public'].append(list_id)
+            size = min(len(free), rng.randint(0, max_list_size))
+            members = [free.pop() for _ in range(size)]
+            for task_id in members:
+                _check(client.patch(f"/lists/{list_id}/tasks/{task_id}",
+                                    headers=headers))
+            user['members'][list_id] = members
+
+        for j in range(jobs_per_user):
+            user['jobs'].append(_seed_job(client, headers, f"job list {j}"))
+        dataset.append(user)
+    return dataset
+
+def _seed_job(client, headers, name):
+    """
+    Add a list, import more than ASYNC_DELETE_THRESHOLD tasks into it, delete
+    it and wait for the background job deleting its tasks. Returns the job's
+    id.
+    """
+    list_id = _check(client.post("/lists", headers=headers, json={
+        "name": name, "description": "deleted by a job", "public": False
+    }))['id']
+    records = [{"kind": "tasks", "name": f"task {t}", "description": "x",
+                "due_date": BASE_DATE.isoformat(),
+                "task_list": {"id": list_id}}
+               for t in range(ASYNC_DELETE_THRESHOLD + 1)]
+    _check(client.post("/import", data="".join(
+        json.dumps(r) + "\n" for r in records), headers=dict(
+            headers, **{"Content-Type": "application/x-ndjson"})))
+    job = _check(client.delete(f"/lists/{list_id}", headers=headers))
+    while job['status'] in ('pending', 'running'):
+        time.sleep(0.01)
+        job = _check(client.get(f"/jobs/{job['id']}", headers=headers))
+    if job['status'] != 'done':
+        raise RuntimeError(f"Seeding job {job['id']} {job['status']}.")
+    return job['id']
+
+def _check(res):
+    if res.status_code >= 300:
+        raise RuntimeError(f"Seeding failed with {res.status_code}: "
+                           f"{res.get_data(as_text=True)}")
+    return res.get_json()
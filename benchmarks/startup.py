@@ -0,0 +1,163 @@
+"""
+Cold start report of the app.
+
+Imports main.py in a new interpreter with -X importtime, then times the
+/_ah/warmup request and a first request, and reports the import time of
+main.py by package and its slowest modules. Tokens are verified against a
+locally generated key set, as in benchmarks.loadtest.
+
+    python -m benchmarks.startup
+    python -m benchmarks.startup --engine datastore --top 20
+    python -m benchmarks.startup --report startup.json
+
+Run it after adding a dependency or a module-level client, and keep heavy
+imports out of the import of main.py (see main.create_app).
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def child(engine):
+    """
+    Import the app and make its first requests. Runs in the interpreter
+    started by measure() and prints the timings as JSON.
+    """
+    from config.config import Config
+    if engine != 'datastore':
+        Config.STORAGE_ENGINE = engine
+        Config.SQLITE_PATH = os.path.join(tempfile.mkdtemp(), "startup.db")
+    start = time.perf_counter()
+    import main
+    timings = {"import_ms": (time.perf_counter() - start) * 1000}
+
+    # Imported after main, so that main's imports are all in its own tree.
+    from validations import auth
+    from validations.jwks import file_fetcher
+    from benchmarks.local_auth import LocalSigner
+    signer = LocalSigner(Config.AUTH0_DOMAIN, Config.AUTH0_CLIENT_ID)
+    jwks_path = os.path.join(tempfile.mkdtemp(), "jwks.json")
+    signer.write_jwks(jwks_path)
+    auth.jwks_store.set_fetcher(file_fetcher(jwks_path))
+
+    client = main.app.test_client()
+    for name, url in (("warmup", "/_ah/warmup"), ("first_request", "/lists")):
+        start = time.perf_counter()
+        res = client.get(url, headers={"Accept": "application/json"})
+        timings[name + "_ms"] = (time.perf_counter() - start) * 1000
+        timings[name + "_status"] = res.status_code
+    print(json.dumps(timings))
+
+def parse_importtime(stderr, module="main"):
+    """
+    Return the (name, self_us, cumulative_us) of the module and of every
+    module it imported from the -X importtime output.
+
+    Modules are printed after the modules they import, indented by their
+    depth, so the tree of the module is the run of deeper lines before it.
+    """
+    lines = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        # "import time: <self> | <cumulative> | <indent><name>"
+        head, cumulative_us, name = line.split("|", 2)
+        self_us = head.split(":", 1)[1]
+        name = name[1:]
+        depth = (len(name) - len(name.lstrip())) // 2
+        lines.append((depth, name.strip(), int(self_us), int(cumulative_us)))
+    for i, (depth, name, _, _) in enumerate(lines):
+        if name == module and depth == 0:
+            tree = [lines[i]]
+            for line in reversed(lines[:i]):
+                if line[0] == 0:
+                    break
+                tree.append(line)
+            return [(name, self_us, cumulative_us)
+                    for _, name, self_us, cumulative_us in tree]
+    raise ValueError(f"{module} not found in the importtime output")
+
+def measure(engine):
+    """
+    Run child() in a new interpreter with -X importtime.
+
+    Returns
+        timings : dict
+            milliseconds of the import, the warmup and the first request
+        modules : list
+            (name, self_us, cumulative_us) of the modules imported by main
+    """
+    res = subprocess.run(
+        [sys.executable, "-X", "importtime", "-m", "benchmarks.startup",
+         "--child", "--engine", engine],
+        cwd=ROOT, capture_output=True, text=True)
+    if res.returncode != 0:
+        raise RuntimeError(f"Starting the app failed:\n{res.stderr[-2000:]}")
+    timings = json.loads(res.stdout.strip().splitlines()[-1])
+    return timings, parse_importtime(res.stderr)
+
+def by_package(modules):
+    """
+    Return the self time in milliseconds and the number of modules of each
+    top-level package, slowest first.
+    """
+    packages = defaultdict(lambda: [0.0, 0])
+    for name, self_us, _ in modules:
+        package = packages[name.split(".")[0]]
+        package[0] += self_us / 1000
+        package[1] += 1
+    return sorted(((name, ms, count) for name, (ms, count)
+                   in packages.items()), key=lambda p: -p[1])
+
+def print_report(timings, modules, top):
+    print(f"{'import main':<24}{timings['import_ms']:>9.1f} ms")
+    for name in ("warmup", "first_request"):
+        print(f"{name.replace('_', ' '):<24}{timings[name + '_ms']:>9.1f} ms"
+              f"  ({timings[name + '_status']})")
+    print(f"\n{'package':<32}{'self ms':>9}{'modules':>9}")
+    for name, ms, count in by_package(modules)[:top]:
+        print(f"{name:<32}{ms:>9.1f}{count:>9}")
+    print(f"\n{'module':<48}{'self ms':>9}{'cumul ms':>10}")
+    for name, self_us, cumulative_us in sorted(modules,
+                                               key=lambda m: -m[1])[:top]:
+        print(f"{name:<48}{self_us / 1000:>9.1f}{cumulative_us / 1000:>10.1f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--engine", choices=["memory", "sqlite", "datastore"],
+                        default="memory")
+    parser.add_argument("--top", type=int, default=15,
+                        help="packages and modules listed")
+    parser.add_argument("--report", help="write the report as JSON")
+    parser.add_argument("--child", action="store_true",
+                        help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+    if args.child:
+        child(args.engine)
+        return
+
+    timings, modules = measure(args.engine)
+    print_report(timings, modules, args.top)
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump({
+                "arguments": vars(args),
+                "timings": timings,
+                "packages": [{"name": name, "self_ms": ms, "modules": count}
+                             for name, ms, count in by_package(modules)],
+                "modules": [{"name": name, "self_ms": self_us / 1000,
+                             "cumulative_ms": cumulative_us / 1000}
+                            for name, self_us, cumulative_us in modules]
+            }, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,35 @@
+from flask import Blueprint, current_app, request, make_response, g
+from flask import stream_with_context
+import models.model as model
+from validations.auth import requires_auth
+from helper.ndjson import ndjson_stream
+
+
+export_api = Blueprint('export_api', __name__)
+
+@export_api.get('/export')
+@requires_auth
+def export_get():
+    """
+    Stream every task list and task of the user as NDJSON: one JSON object
+    per line with the entity's 'kind' ('lists' or 'tasks'), 'id' and
+    properties. Lists come first. The stream is gzipped if the request
+    accepts the gzip encoding. Requires a valid authorization token.
+    """
+    if 'application/x-ndjson' not in request.accept_mimetypes:
+        return make_response({
+            "code": "not_acceptable",
+            "description": "The accept header does not support application/x-ndjson."
+        }, 406)
+    user_id = g.user_id
+    gzipped = 'gzip' in request.accept_encodings
+    records = (dict(model.format_task(entity) if kind == "tasks" else entity,
+                    kind=kind, id=entity.key.id)
+               for kind, entity in model.export_user_data(user_id))
+    res = current_app.response_class(
+        stream_with_context(ndjson_stream(records, gzipped)),
+        mimetype='application/x-ndjson')
+    if gzipped:
+        res.headers['Content-Encoding'] = 'gzip'
+    res.vary.add('Accept-Encoding')
+    return res
@@ -0,0 +1,36 @@
+from flask import Blueprint, request, make_response, g
+import models.model as model
+from validations.auth import requires_auth
+from validations.exception import accept_json
+from helper.ndjson import iter_ndjson
+
+
+import_api = Blueprint('import_api', __name__)
+
+@import_api.post('/import')
+@accept_json
+@requires_auth
+def import_post():
+    """
+    Import task lists and tasks from an NDJSON body, e.g. the output of
+    GET /export. The body is parsed as it is read and can be gzipped with
+    'Content-Encoding: gzip'. Records are validated like POST /lists and
+    POST /tasks and written in batches (see model.import_records).
+
+    The response contains the number of 'inserted' lists and tasks, and the
+    'errors' of the 'rejected' lines with their line number.
+    """
+    if request.mimetype != 'application/x-ndjson':
+        return make_response({
+            "code": "unsupported_media_type",
+            "description": "The content-type is not application/x-ndjson."
+        }, 415)
+    encoding = request.headers.get('Content-Encoding', 'identity').lower()
+    if encoding not in ('identity', 'gzip'):
+        return make_response({
+            "code": "unsupported_content_encoding",
+            "description": "The content-encoding must be gzip or identity."
+        }, 415)
+    records = iter_ndjson(request.stream, gzipped=encoding == 'gzip')
+    summary = model.import_records(records, g.user_id)
+    return make_response(summary, 200)
@@ -0,0 +1,22 @@
+from flask import Blueprint, request, make_response, g
+import models.model as model
+from validations.auth import requires_auth
+from validations.exception import accept_json
+
+
+job_api = Blueprint('job_api', __name__)
+
+@job_api.get('/jobs/<int:job_id>')
+@accept_json
+@requires_auth
+def job_get_by_id(job_id):
+    """
+    Return a background job of the job_id, e.g. the deletion of a large
+    list. 'status' is one of pending, running, done and failed, and
+    'processed' counts the items done out of 'total'. Only the user who
+    started the job can view it.
+    """
+    job = model.get_job_by_id(job_id, g.user_id)
+    job['id'] = job.key.id
+    job['self'] = request.url
+    return make_response(job, 200)
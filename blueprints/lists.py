@@ -1,8 +1,15 @@
-from flask import Blueprint, request, make_response, session
+from urllib.parse import urlencode
+from flask import Blueprint, request, make_response, g
 import models.model as model
 from validations.auth import requires_auth
 from validations.exception import accept_json
-from helper.pagination import add_pagination
+from helper.pagination import add_pagination, get_page_args
+from helper.pagination import get_fields, select_fields
+from constants.constants import LIST_FIELDS, LIST_REQUIRED_PROPERTIES
+from helper.response_cache import cache_public
+from helper.conditional import entity_etag, not_modified, make_entity_response
+from helper.conditional import collection_etag
+from validations.request import BadRequest
 
 
 list_api = Blueprint('list_api', __name__)
@@ -12,66 +19,110 @@ list_api = Blueprint('list_api', __name__)
 @requires_auth
 def list_post():
     """
-    Add a task list entity to the datastore. Initialize 'owner' and
-    'tasks' property of the task. Response contains 'id' of the datastore
+    Add a task list entity to the datastore. Initialize 'owner' property
+    of the task list. Response contains 'id' of the datastore
     and 'self' link of the entity. Requires a valid authorization token.
     """
     
-    task_list_property = request.get_json()  
+    body = request.get_json()
+    # Only the list's own properties are taken from the body: its tasks are
+    # added with PATCH /lists/:list_id/tasks.
+    task_list_property = {p: body[p] for p in LIST_REQUIRED_PROPERTIES
+                          if p in body} if isinstance(body, dict) else {}
 
-    # Initializae owner and tasks
-    task_list_property['owner'] = session['user_id']
-    task_list_property['tasks'] = []
+    # Initializae owner
+    task_list_property['owner'] = g.user_id
 
     task_list = model.add_task_list(task_list_property)
     id = task_list.key.id
     task_list['id'] = id
     task_list['self'] = request.url + '/' + str(id)
-    session.pop('user_id')
-    return make_response(task_list, 201)
+    return make_entity_response(task_list, 201)
 
 @list_api.get('/lists')
 @accept_json
+@cache_public("lists")
 @requires_auth
 @add_pagination
 def list_get():
     """
     Response contains a list of task list collections of the owner if the
     authorization token is valid. If the token is invalid, the response
-    will contains any public task lists.
+    will contains any public task lists. Responses without a token are
+    cached (see helper.response_cache).
 
     'total' in the response is the total number of entities in the datastore.
     'lists' in the response will contain the number of task lists at most the
-    PAGE_LIMIT number set in config.config.
+    'limit' query parameter (PAGE_LIMIT by default). 'next' link contains a
+    cursor of the next page. 'fields' selects the properties of the lists
+    in the response, e.g. 'fields=name,public'.
     """
-    offset = request.args.get('offset')
-    if not offset: offset = 0
-    else: offset = int(offset)
-    user_id = session['user_id'] if 'user_id' in session else None
-    task_lists, total = model.get_task_lists(offset, user_id)
+    page = get_page_args()
+    fields = get_fields(LIST_FIELDS)
+    user_id = g.get('user_id')
+    task_lists, total, next_cursor = model.get_task_lists(user_id, **page)
+    page['next_cursor'] = next_cursor
     for task_list in task_lists:
         id = task_list.key.id
         task_list['id'] = id
         task_list['self'] = request.base_url + '/' + str(id)
-    res = {'lists': task_lists, 'total': total}
-    if 'user_id' in session: session.pop('user_id')
-    return res, offset
+        select_fields(task_list, fields)
+    res = {'lists': task_lists}
+    if total is not None:
+        res['total'] = total
+    return res, page
 
 @list_api.get('/lists/<int:list_id>')
 @accept_json
+@cache_public("list:{list_id}")
 @requires_auth
 def list_get_by_id(list_id):
     """
     The response contain a data of a list of the list_id. If the list is 
     public, it will return even if the authorization token is invalid or
-    the user is not the owner.
+    the user is not the owner. A request with an If-None-Match matching
+    the list's ETag gets 304 Not Modified.
+
+    'expand=tasks' adds the list's 'tasks', up to MAX_PAGE_LIMIT of them.
+    The owner of the list gets whole tasks, read with one get_multi; others
+    only get their 'id', 'name' and 'self' link, as in
+    GET /lists/:list_id/tasks. If the list has more, 'tasks_next' links to
+    the next page of GET /lists/:list_id/tasks.
     """
-    user_id = session['user_id'] if 'user_id' in session else None
-    list = model.get_task_list_by_id(list_id, user_id)
+    expand = request.args.get('expand')
+    if expand not in (None, 'tasks'):
+        raise BadRequest({
+            "code": "invalid_expand",
+            "description": "Only the tasks of a list can be expanded."
+        }, 400)
+    user_id = g.get('user_id')
+    if expand is None:
+        list = model.get_task_list_by_id(list_id, user_id)
+        etag = entity_etag(list)
+    else:
+        list, tasks, next_cursor = model.get_task_list_with_tasks(list_id,
+                                                                  user_id)
+        etag = collection_etag({'list': [list], 'tasks': tasks,
+                                'tasks_next': next_cursor})
+    unmodified = not_modified(etag)
+    if unmodified is not None:
+        return unmodified
     list['id'] = list.key.id
     list['self'] = request.url
-    if 'user_id' in session: session.pop('user_id')
-    return make_response(list, 200)
+    if expand is not None:
+        owner = user_id is not None and list['owner'] == user_id
+        for task in tasks:
+            if owner:
+                model.format_task(task)
+            task['id'] = task.key.id
+            task['self'] = request.url_root + 'tasks/' + str(task.key.id)
+        list['tasks'] = tasks
+        if next_cursor:
+            list['tasks_next'] = request.url_root + \
+                f'lists/{list_id}/tasks?' + urlencode({'cursor': next_cursor})
+    res = make_response(list, 200)
+    res.set_etag(etag)
+    return res
 
 @list_api.route('/lists/<int:list_id>', methods=['PATCH', 'PUT'])
 @accept_json
@@ -79,24 +130,35 @@ def list_get_by_id(list_id):
 def list_patch_put(list_id):
     """
     Update a list entity and return the updated one. If the request is
-    PUT, it requires all required properties in the request.
+    PUT, it requires all required properties in the request. With an
+    If-Match header, the list is only updated if it matches the list's
+    ETag, otherwise the response is 412 Precondition Failed.
     """
     task_list_property = request.get_json()
-    user_id = session['user_id']
-    task_list = model.update_task_list(list_id, task_list_property, user_id)
+    user_id = g.user_id
+    task_list = model.update_task_list(list_id, task_list_property, user_id,
+                                       request.if_match)
     task_list['id'] = task_list.key.id
     task_list['self'] = request.url
-    session.pop('user_id')
-    return make_response(task_list, 200)
+    return make_entity_response(task_list, 200)
 
 @list_api.route('/lists/<int:list_id>', methods=['DELETE'])
 @requires_auth
 def list_delete(list_id):
     """
-    Delete a list entity and its tasks.
+    Delete a list entity and its tasks. Large lists are deleted by a
+    background job: the response is 202 Accepted with the job, which can be
+    polled at its 'self' link. It can be made conditional with an
+    If-Match header.
     """
-    user_id = session['user_id']
-    model.delete_task_list(list_id, user_id)
+    user_id = g.user_id
+    job = model.delete_task_list(list_id, user_id, request.if_match)
+    if job is not None:
+        job['id'] = job.key.id
+        job['self'] = request.url_root + 'jobs/' + str(job.key.id)
+        res = make_response(job, 202)
+        res.headers['Location'] = job['self']
+        return res
     return make_response('', 204)
 
 @list_api.route('/lists/<int:list_id>/tasks/<int:task_id>', methods=['PATCH'])
@@ -108,28 +170,7 @@ def list_task_patch(list_id, task_id):
     Both the task and the list have to be owned by the user.
     If a task is already in a list, it cannot be added to the list.
     """
-    user_id = session['user_id']
-    task = model.get_task_by_id(task_id, user_id)
-    task_list = model.get_task_list_by_id(list_id, user_id)
-    # Check if task's task_list field is not empty.
-    if task['task_list'] != {}:
-        return make_response({
-            "code": "task_list_not_empty",
-            "description": "The task is already added to a list"
-        }, 403)
-    
-    # Update task and list
-    task_list['tasks'].append({
-        'id': task_id,
-        'name': task['name']
-    })
-    task["task_list"] = {
-        'id': list_id,
-        'name': task_list["name"]
-    }       
-    model.update_entity_rel(task)
-    model.update_entity_rel(task_list)
-    session.pop('user_id')
+    model.add_list_task(list_id, task_id, g.user_id)
     return make_response('', 204)
 
 @list_api.route('/lists/<int:list_id>/tasks/<int:task_id>', methods=['DELETE'])
@@ -142,30 +183,51 @@ def list_task_delete(list_id, task_id):
     If the task isn't in any lists, it cannot be removed from the list.
     If the task is in a different list, it cannot be removed from the list.
     """
-    user_id = session['user_id']
-    task = model.get_task_by_id(task_id, user_id)
-    task_list = model.get_task_list_by_id(list_id, user_id)
-    # Check if task's task_list is empty.
-    if task['task_list'] == {}:
-        return make_response({
-            "code": "task_list_empty",
-            "description": "The task is not in any lists."
-        }, 403)
-    # Check if list_id is the same as the one from task's task_list.
-    task_list_id = task['task_list']['id']
-    if list_id != task_list_id:
-        return make_response({
-            "code": "list_id_not_matching",
-            "description": "The task is not in the list."
-        }, 403)
-
-    # Update task and list
-    for t in task_list["tasks"]:
-        if t["id"] == task_id:
-            task_list["tasks"].remove(t)
-            break
-    task["task_list"] = {}
-    model.update_entity_rel(task)
-    model.update_entity_rel(task_list)     
+    model.remove_list_task(list_id, task_id, g.user_id)
     return make_response('', 204)
-        
\ No newline at end of file
+
+@list_api.get('/lists/<int:list_id>/tasks')
+@accept_json
+@cache_public("list:{list_id}")
+@requires_auth
+@add_pagination
+def list_tasks_get(list_id):
+    """
+    Response contains a page of the tasks of the list with their 'id',
+    'name' and 'self' link. Like the list itself, the tasks of a public
+    list can be viewed by anyone.
+
+    'total' in the response is the number of tasks in the list. 'next' link
+    contains a cursor of the next page.
+    """
+    page = get_page_args()
+    user_id = g.get('user_id')
+    tasks, total, next_cursor = model.get_list_tasks(list_id, user_id, **page)
+    page['next_cursor'] = next_cursor
+    for task in tasks:
+        task['self'] = request.url_root + 'tasks/' + str(task['id'])
+    res = {'tasks': tasks}
+    if total is not None:
+        res['total'] = total
+    return res, page
+
+@list_api.route('/lists/<int:list_id>/tasks', methods=['PATCH', 'DELETE'])
+@accept_json
+@requires_auth
+def list_tasks_patch_delete(list_id):
+    """
+    Add (PATCH) or remove (DELETE) many tasks of a list in one request.
+    The request body contains the ids of the tasks in 'task_ids'.
+
+    The response contains a result of each task id in 'results' with the
+    status code the single-task route would have returned, e.g. 403 if a
+    task is already in a list.
+    """
+    body = request.get_json()
+    task_ids = body.get('task_ids') if isinstance(body, dict) else None
+    user_id = g.user_id
+    if request.method == 'PATCH':
+        results = model.add_tasks_to_list(list_id, task_ids, user_id)
+    else:
+        results = model.remove_tasks_from_list(list_id, task_ids, user_id)
+    return make_response({'results': results}, 200)
@@ -0,0 +1,43 @@
+from urllib.parse import urlencode
+from flask import Blueprint, request, make_response, g
+import models.model as model
+from validations.auth import requires_auth
+from validations.exception import accept_json
+from helper.pagination import get_sync_args
+
+
+sync_api = Blueprint('sync_api', __name__)
+
+@sync_api.get('/sync')
+@accept_json
+@requires_auth
+def sync_get():
+    """
+    Return the user's tasks and lists changed since the 'since' sync token,
+    and the 'deleted' tasks and lists as their 'kind' and 'id'. Without a
+    token, it returns every task and list of the user.
+
+    'token' in the response is the 'since' of the next sync. If 'more' is
+    true, there are more changes and the 'next' link fetches them. Changes
+    can be returned twice, so clients should apply them idempotently.
+    """
+    args = get_sync_args()
+    changes, token, more = model.get_changes(g.user_id, **args)
+    for kind in ("tasks", "lists"):
+        for entity in changes[kind]:
+            if kind == "tasks":
+                model.format_task(entity)
+            entity['id'] = entity.key.id
+            entity['self'] = request.url_root + kind + '/' + str(entity.key.id)
+    res = {
+        'tasks': changes['tasks'],
+        'lists': changes['lists'],
+        'deleted': [{'kind': tombstone['kind'], 'id': tombstone['id']}
+                    for tombstone in changes.get('tombstones', [])],
+        'token': token,
+        'more': more
+    }
+    if more:
+        res['next'] = request.base_url + '?' + urlencode(
+            dict(request.args, since=token))
+    return make_response(res, 200)
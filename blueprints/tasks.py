@@ -1,8 +1,11 @@
-from flask import Blueprint, request, make_response, session
+from flask import Blueprint, request, make_response, g
 import models.model as model
 from validations.auth import requires_auth
 from validations.exception import accept_json
-from helper.pagination import add_pagination
+from helper.pagination import add_pagination, get_page_args, get_task_filters
+from helper.pagination import get_fields, select_fields, get_ids
+from constants.constants import TASK_FIELDS
+from helper.conditional import entity_etag, not_modified, make_entity_response
 
 task_api = Blueprint('task_api', __name__)
 
@@ -17,15 +20,37 @@ def task_post():
     a valid authorization token.
     """
     task_property = request.get_json()
-    task_property['owner'] = session['user_id']
+    task_property['owner'] = g.user_id
     task_property['completed'] = False
     task_property['task_list'] = {}
-    task = model.add_task(task_property)
+    task = model.format_task(model.add_task(task_property))
     id = task.key.id
     task['id'] = id
     task['self'] = request.url + '/' + str(id)
-    session.pop('user_id')
-    return make_response(task, 201)
+    return make_entity_response(task, 201)
+
+@task_api.post('/tasks:batch')
+@accept_json
+@requires_auth
+def task_batch():
+    """
+    Create, update and delete tasks in one request. The request body
+    contains a list of 'operations':
+        {"op": "create", "task": {...}}
+        {"op": "update", "id": <task_id>, "task": {...}}
+        {"op": "delete", "id": <task_id>}
+    The response contains a result of each operation in 'results' with
+    the status code the single-task route would have returned.
+    """
+    body = request.get_json()
+    operations = body.get('operations') if isinstance(body, dict) else None
+    results = model.batch_tasks(operations, g.user_id)
+    for result in results:
+        if 'task' in result:
+            task = model.format_task(result['task'])
+            task['id'] = task.key.id
+            task['self'] = request.url_root + 'tasks/' + str(task.key.id)
+    return make_response({'results': results}, 200)
 
 @task_api.get('/tasks')
 @accept_json
@@ -36,19 +61,41 @@ def task_get():
     Return a collection of tasks. If the authorization token is valid,
     it returns the owner's tasks. Otherwise, it will return an error message.
 
-    'total' contains the total number of the tasks in datasotre.
+    Tasks can be filtered by 'completed', 'due_after' and 'due_before'
+    (inclusive dates) and 'list_id', and sorted by 'sort=due_date' or
+    'sort=name'. Tasks filtered by due date are sorted by due date.
+    'fields' selects the properties of the tasks in the response, e.g.
+    'fields=name,due_date,completed'.
+
+    'ids' returns the tasks of the ids instead, e.g. 'ids=1,2,3', with one
+    get_multi. Ids that do not exist or are not the owner's tasks are
+    listed in 'missing'.
+
+    'total' contains the number of the tasks matching the filters.
+    'next' link contains a cursor of the next page. Page size can be set by
+    the 'limit' query parameter up to MAX_PAGE_LIMIT.
     """
-    offset = request.args.get('offset')
-    if not offset: offset = 0
-    else: offset = int(offset)
-    user_id = session['user_id']
-    tasks, total = model.get_tasks(offset, user_id)    
+    page = get_page_args()
+    fields = get_fields(TASK_FIELDS)
+    ids = get_ids()
+    user_id = g.user_id
+    res = {}
+    if ids is not None:
+        tasks, res['missing'] = model.get_tasks_by_ids(ids, user_id)
+    else:
+        tasks, total, next_cursor = model.get_tasks(user_id, **page,
+                                                    **get_task_filters(),
+                                                    fields=fields)
+        page['next_cursor'] = next_cursor
+        if total is not None:
+            res['total'] = total
     for task in tasks:
+        model.format_task(task)
         task['id'] = task.key.id
         task['self'] = request.base_url + '/' + str(task.key.id)
-    res = {'tasks': tasks, 'total': total}
-    session.pop('user_id')
-    return res, offset
+        select_fields(task, fields)
+    res['tasks'] = tasks
+    return res, page
 
 @task_api.get('/tasks/<int:task_id>')
 @accept_json
@@ -56,12 +103,17 @@ def task_get():
 def task_get_by_id(task_id):
     """
     Return a task of the task_id. It requires a valid authorization token.
+    The response has an ETag, and a request with a matching If-None-Match
+    gets 304 Not Modified.
     """
-    task = model.get_task_by_id(task_id, session['user_id'])
+    task = model.get_task_by_id(task_id, g.user_id)
+    unmodified = not_modified(entity_etag(task))
+    if unmodified is not None:
+        return unmodified
+    model.format_task(task)
     task['id'] = task.key.id
     task['self'] = request.url
-    session.pop('user_id')
-    return make_response(task, 200)
+    return make_entity_response(task, 200)
 
 @task_api.route('/tasks/<int:task_id>', methods=['PATCH', 'PUT'])
 @accept_json
@@ -71,23 +123,26 @@ def task_patch_put(task_id):
     Update a task entity. It requires a valid authorization token, and
     only the owner can update the task. User can update the task properties
     stored in datastore except the 'task_list' and 'owner' properties.
+    With an If-Match header, the task is only updated if it matches the
+    task's ETag, otherwise the response is 412 Precondition Failed.
     """
     task_property = request.get_json()
-    user_id = session['user_id']
-    task = model.update_task(task_id, task_property, user_id)
+    user_id = g.user_id
+    task = model.update_task(task_id, task_property, user_id,
+                             request.if_match)
+    model.format_task(task)
     task['id'] = task.key.id
     task['self'] = request.url
-    session.pop('user_id')
-    return make_response(task, 200)
+    return make_entity_response(task, 200)
 
 @task_api.route('/tasks/<int:task_id>', methods=['DELETE'])
 @requires_auth
 def task_delete(task_id):
     """
     Delete a task entity. If it is in a task list, remove it from the list
-    before deleted. Only the owner can perform this action.
+    before deleted. Only the owner can perform this action. Like updates,
+    it can be made conditional with an If-Match header.
     """
-    user_id = session['user_id']
-    model.delete_task(task_id, user_id)
-    session.pop('user_id')
+    user_id = g.user_id
+    model.delete_task(task_id, user_id, request.if_match)
     return make_response('', 204)
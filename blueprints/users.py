@@ -13,14 +13,14 @@ def user_get():
     """
     users =  model.get_users()
     for user in users:
-        user['id'] = user.key.id
-        user['self'] = request.url + '/' + str(user.key.id)    
+        user['id'] = user.key.id_or_name
+        user['self'] = request.url + '/' + str(user.key.id_or_name)
     return make_response({
         'total': len(users),
         'users': users
     }, 200)
 
-@user_api.get('/users/<int:user_id>')
+@user_api.get('/users/<user_id>')
 @accept_json
 def user_get_by_id(user_id):
     """
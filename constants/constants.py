@@ -8,3 +8,106 @@ TASK_REQUIRED_PROPERTIES = ["name",
 LIST_REQUIRED_PROPERTIES = ["name",
                             "description",
                             "public"]
+
+# Properties a client can select with the 'fields' query parameter.
+TASK_FIELDS = TASK_REQUIRED_PROPERTIES + ["completed", "task_list", "owner",
+                                          "version", "updated_at", "id",
+                                          "self"]
+LIST_FIELDS = LIST_REQUIRED_PROPERTIES + ["owner", "version", "updated_at",
+                                          "id", "self"]
+
+# Seconds the Auth0 key set is cached, the minimum interval between
+# refreshes triggered by an unknown 'kid', and the fetch timeout.
+JWKS_CACHE_TTL = 600
+JWKS_MIN_REFRESH_INTERVAL = 30
+JWKS_FETCH_TIMEOUT = 5
+
+# Maximum number of verified bearer tokens kept by the token cache.
+TOKEN_CACHE_SIZE = 10000
+
+# Seconds a user id found in datastore is remembered by the auth check.
+USER_CACHE_TTL = 60
+USER_CACHE_SIZE = 10000
+
+# Maximum number of entities in a single datastore batch call.
+DATASTORE_BATCH_LIMIT = 500
+
+# Largest page size a client can request with the 'limit' query parameter.
+MAX_PAGE_LIMIT = 100
+
+# Datastore calls a request may make before it is logged, and the number
+# of single-key gets of a kind in a request flagged as a missing get_multi.
+RPC_BUDGET = 10
+RPC_REPEATED_GET_THRESHOLD = 2
+
+# Maximum number of operations in a POST /tasks:batch request.
+MAX_BATCH_OPERATIONS = 300
+
+# Maximum number of task ids in a PATCH/DELETE /lists/:id/tasks request.
+# Each task writes the task and its membership entity in one transaction,
+# which has to stay within DATASTORE_BATCH_LIMIT mutations.
+MAX_LIST_TASK_IDS = 250
+
+# Lists with more tasks than this are deleted by a background job, and the
+# number of background worker threads. Smaller lists are deleted in one
+# transaction of 3 mutations per task (task, membership and tombstone),
+# which has to stay within DATASTORE_BATCH_LIMIT mutations.
+ASYNC_DELETE_THRESHOLD = 100
+BACKGROUND_WORKERS = 2
+
+# Entity cache (see models.entity_cache): number of entities kept in
+# process, and seconds an entity is kept in the local and the shared tier.
+# Other instances see a write after at most ENTITY_CACHE_LOCAL_TTL seconds.
+# A written key is not cached in the shared tier for
+# ENTITY_CACHE_INVALIDATION_TTL seconds, longer than a read takes (see
+# REQUEST_DEADLINE), so that reads made before the write cannot cache it.
+ENTITY_CACHE_SIZE = 10000
+ENTITY_CACHE_LOCAL_TTL = 5
+ENTITY_CACHE_TTL = 300
+ENTITY_CACHE_INVALIDATION_TTL = 15
+
+# Socket timeout in seconds of the shared cache server, seconds calls skip
+# the server after an error, and number of failed invalidations kept to be
+# sent again.
+SHARED_CACHE_TIMEOUT = 0.5
+SHARED_CACHE_RETRY_INTERVAL = 30
+SHARED_CACHE_MAX_PENDING = 10000
+
+# Cache of anonymous public list responses (see helper.response_cache):
+# number of responses kept in process, seconds a response is kept in the
+# local and the shared tier, and max-age of the Cache-Control header.
+PUBLIC_CACHE_SIZE = 1000
+PUBLIC_CACHE_LOCAL_TTL = 5
+PUBLIC_CACHE_TTL = 60
+PUBLIC_CACHE_MAX_AGE = 10
+
+# Seconds between the logs of the token and entity cache counters of an
+# instance.
+CACHE_STATS_INTERVAL = 300
+
+# Delta sync (GET /sync): default number of changes of each kind in a
+# response, seconds a sync token stays behind the clock so that writes
+# committed late are not missed, and days tombstones of deleted entities
+# are kept. Older sync tokens are rejected.
+SYNC_PAGE_LIMIT = 100
+SYNC_SETTLE_TIME = 5
+SYNC_TOMBSTONE_DAYS = 30
+
+# Export (GET /export): entities fetched by each query of the export, and
+# bytes of NDJSON buffered before a chunk of the response is sent.
+EXPORT_BATCH_SIZE = 500
+EXPORT_CHUNK_SIZE = 64 * 1024
+
+# Import (POST /import): records written per batch, bytes read from the
+# request body at a time, and the longest accepted NDJSON line. Each list
+# is written with its name claim and each task with its membership, so a
+# batch stays within DATASTORE_BATCH_LIMIT mutations.
+IMPORT_BATCH_SIZE = 250
+IMPORT_READ_SIZE = 64 * 1024
+IMPORT_MAX_LINE_LENGTH = 64 * 1024
+
+# Concurrent reads (see models.model.fetch_all): threads shared by the
+# independent reads of all requests, and seconds a request may spend on
+# them before it fails with 504 Gateway Timeout.
+READ_POOL_WORKERS = 16
+REQUEST_DEADLINE = 10
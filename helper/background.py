@@ -0,0 +1,17 @@
+from concurrent.futures import ThreadPoolExecutor
+from constants.constants import BACKGROUND_WORKERS
+
+# In-process stand-in for a task queue. Work submitted here runs outside of
+# any request, so it must not use flask.request or flask.session.
+executor = ThreadPoolExecutor(max_workers=BACKGROUND_WORKERS,
+                              thread_name_prefix="background")
+
+
+def submit(func, *args):
+    """
+    Run func(*args) on a background worker thread.
+
+    Returns
+        future : concurrent.futures.Future
+    """
+    return executor.submit(func, *args)
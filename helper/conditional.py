@@ -0,0 +1,48 @@
+import hashlib
+import json
+from flask import request, make_response
+
+
+def entity_etag(entity):
+    """
+    Return the strong ETag of an entity: its id and its 'version', which
+    is incremented by every write of the entity (see models.model).
+    """
+    return f"{entity.key.id_or_name}.{entity.get('version', 0)}"
+
+def collection_etag(res):
+    """
+    Return the strong ETag of a collection response from the keys and
+    versions of its entities and its other values, e.g. 'total' and the
+    page links, without serializing the entities. Entities without a
+    version, e.g. the tasks of a list, are hashed with their properties.
+    """
+    parts = []
+    for name, value in sorted(res.items()):
+        if isinstance(value, list):
+            value = [[list(item.key.flat_path),
+                      item['version'] if 'version' in item
+                      else sorted(item.items())]
+                     if hasattr(item, 'key') else item
+                     for item in value]
+        parts.append([name, value])
+    return hashlib.sha1(json.dumps(parts, default=str).encode()).hexdigest()
+
+def not_modified(etag):
+    """
+    Return a 304 Not Modified response if the request's If-None-Match
+    matches the etag, otherwise None.
+    """
+    if not request.if_none_match.contains_weak(etag):
+        return None
+    res = make_response('', 304)
+    res.set_etag(etag)
+    return res
+
+def make_entity_response(entity, status_code):
+    """
+    Return the response of an entity with its ETag.
+    """
+    res = make_response(entity, status_code)
+    res.set_etag(entity_etag(entity))
+    return res
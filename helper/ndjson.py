@@ -0,0 +1,129 @@
+import json
+import zlib
+from datetime import datetime
+from constants.constants import EXPORT_CHUNK_SIZE
+from constants.constants import IMPORT_READ_SIZE, IMPORT_MAX_LINE_LENGTH
+
+
+def _default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def ndjson_stream(records, gzipped=False, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Serialize records as newline-delimited JSON, one record per line, in
+    chunks of about chunk_size bytes. Records are consumed lazily, so only
+    one chunk is held in memory however many records there are. Datetimes
+    are written in ISO 8601 so that they keep their microseconds.
+
+    Parameters
+        records : iterable
+            dicts to serialize
+        gzipped : bool
+            compress the stream with gzip. Each chunk is flushed, so the
+            client can decompress what it has received so far.
+        chunk_size : int
+            bytes of serialized records buffered before a chunk is yielded
+    Returns
+        chunks : generator
+            bytes of the stream
+    """
+    compressor = zlib.compressobj(wbits=31) if gzipped else None
+    lines = []
+    size = 0
+    for record in records:
+        line = json.dumps(record, default=_default).encode() + b"\n"
+        lines.append(line)
+        size += len(line)
+        if size >= chunk_size:
+            data = b"".join(lines)
+            lines, size = [], 0
+            if compressor is not None:
+                data = compressor.compress(data) + \
+                    compressor.flush(zlib.Z_SYNC_FLUSH)
+            yield data
+    data = b"".join(lines)
+    if compressor is not None:
+        data = compressor.compress(data) + compressor.flush()
+    if data:
+        yield data
+
+def _read_chunks(stream, gzipped, read_size):
+    """
+    Yield the bytes of a stream, decompressed if gzipped. Each read and
+    each decompressed piece is at most read_size bytes.
+    """
+    decompressor = zlib.decompressobj(wbits=31) if gzipped else None
+    while True:
+        data = stream.read(read_size)
+        if not data:
+            break
+        if decompressor is None:
+            yield data
+            continue
+        while data:
+            yield decompressor.decompress(data, read_size)
+            data = decompressor.unconsumed_tail
+    if decompressor is not None:
+        yield decompressor.flush()
+
+def iter_ndjson(stream, gzipped=False, read_size=IMPORT_READ_SIZE,
+                max_line_length=IMPORT_MAX_LINE_LENGTH):
+    """
+    Parse newline-delimited JSON from a file-like stream as it is read, so
+    the whole body is never held in memory. Blank lines are skipped.
+
+    Parameters
+        stream : file-like
+            binary stream, e.g. flask.request.stream
+        gzipped : bool
+            the stream is compressed with gzip
+        read_size : int
+            bytes read from the stream at a time
+        max_line_length : int
+            lines longer than this are not parsed
+    Returns
+        records : generator
+            (line number, value) pairs. value is None if the line is not
+            valid JSON or too long, or if the gzip stream is corrupted.
+    """
+    buffer = b""
+    number = 0
+    skipping = False
+    chunks = _read_chunks(stream, gzipped, read_size)
+    while True:
+        try:
+            data = next(chunks, None)
+        except zlib.error:
+            # The rest of a corrupted gzip stream cannot be read.
+            yield number + 1, None
+            return
+        if data is None:
+            break
+        buffer += data
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            number += 1
+            if skipping:
+                skipping = False
+                yield number, None
+            elif line.strip():
+                yield number, _parse_line(line, max_line_length)
+        # Drop the start of a line that is already too long.
+        if len(buffer) > max_line_length:
+            buffer = b""
+            skipping = True
+    if skipping:
+        yield number + 1, None
+    elif buffer.strip():
+        yield number + 1, _parse_line(buffer, max_line_length)
+
+def _parse_line(line, max_line_length):
+    if len(line) > max_line_length:
+        return None
+    try:
+        return json.loads(line)
+    except ValueError:
+        return None
@@ -1,21 +1,228 @@
+from datetime import datetime, timezone
 from functools import wraps
-from constants.constants import PAGE_LIMIT
+from urllib.parse import urlencode
+from constants.constants import PAGE_LIMIT, MAX_PAGE_LIMIT, SYNC_PAGE_LIMIT
 from flask import request, make_response
+from validations.request import BadRequest
+from helper.conditional import collection_etag, not_modified
+
+
+def get_page_args():
+    """
+    Parse the pagination arguments of a get a collection request.
+
+    - limit: the number of entities in a page. Default is PAGE_LIMIT and it
+      cannot exceed MAX_PAGE_LIMIT.
+    - cursor: an opaque token from a 'next' link.
+    - offset: position of the first entity. Kept for compatibility, it is
+      ignored when a cursor is given.
+    - include_total: 'false' skips counting the entities of the collection.
+
+    Returns
+        page : dict
+            'limit', 'offset', 'cursor' and 'include_total' of the requested
+            page.
+    """
+    limit = _parse_int('limit', PAGE_LIMIT)
+    if not 1 <= limit <= MAX_PAGE_LIMIT:
+        raise BadRequest({
+            "code": "invalid_limit",
+            "description": f"The limit must be between 1 and {MAX_PAGE_LIMIT}."
+        }, 400)
+    offset = _parse_int('offset', 0)
+    if offset < 0:
+        raise BadRequest({
+            "code": "invalid_offset",
+            "description": "The offset cannot be negative."
+        }, 400)
+    cursor = request.args.get('cursor') or None
+    if cursor is not None:
+        offset = 0
+    include_total = request.args.get('include_total', 'true').lower()
+    if include_total not in ('true', 'false'):
+        raise BadRequest({
+            "code": "invalid_include_total",
+            "description": "Cannot parse the include_total value."
+        }, 400)
+    return {'limit': limit, 'offset': offset, 'cursor': cursor,
+            'include_total': include_total == 'true'}
+
+def get_task_filters():
+    """
+    Parse the filter and sort arguments of a GET /tasks request.
+
+    - completed: 'true' or 'false'.
+    - due_after, due_before: dates in the format of Y-M-D. Both are
+      inclusive.
+    - list_id: the id of a task list.
+    - sort: 'due_date' or 'name'.
+
+    Returns
+        filters : dict
+            'completed', 'due_after', 'due_before', 'list_id' and 'sort' of
+            the request. None if not given.
+    """
+    completed = request.args.get('completed')
+    if completed is not None:
+        if completed.lower() not in ('true', 'false'):
+            raise BadRequest({
+                "code": "invalid_completed",
+                "description": "Cannot parse the completed value."
+            }, 400)
+        completed = completed.lower() == 'true'
+    sort = request.args.get('sort') or None
+    if sort not in (None, 'due_date', 'name'):
+        raise BadRequest({
+            "code": "invalid_sort",
+            "description": "The sort must be due_date or name."
+        }, 400)
+    return {'completed': completed,
+            'due_after': _parse_date('due_after'),
+            'due_before': _parse_date('due_before'),
+            'list_id': _parse_int('list_id', None),
+            'sort': sort}
+
+def _parse_date(name):
+    value = request.args.get(name)
+    if not value:
+        return None
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').replace(tzinfo=timezone.utc)
+    except ValueError:
+        raise BadRequest({
+            "code": f"invalid_{name}",
+            "description": f"Cannot parse the {name} value."
+        }, 400)
+
+def get_ids():
+    """
+    Parse the 'ids' query parameter, a comma-separated list of at most
+    MAX_PAGE_LIMIT datastore ids, e.g. 'ids=1,2,3'.
+
+    Returns
+        ids : list
+            the ids without duplicates in the order of the request, or None
+            if there is no 'ids' parameter.
+    """
+    value = request.args.get('ids')
+    if value is None:
+        return None
+    try:
+        ids = list(dict.fromkeys(int(id) for id in value.split(',')))
+    except ValueError:
+        raise BadRequest({
+            "code": "invalid_ids",
+            "description": "Cannot parse the ids value."
+        }, 400)
+    if len(ids) > MAX_PAGE_LIMIT:
+        raise BadRequest({
+            "code": "too_many_ids",
+            "description": f"A request cannot exceed {MAX_PAGE_LIMIT} ids."
+        }, 400)
+    return ids
+
+def get_fields(allowed):
+    """
+    Parse the 'fields' query parameter, a comma-separated list of the
+    properties to return, e.g. 'fields=name,due_date,completed'.
+
+    Parameters
+        allowed : list
+            the properties that can be selected
+    Returns
+        fields : list
+            the selected properties, or None to return all of them.
+    """
+    value = request.args.get('fields')
+    if not value:
+        return None
+    fields = list(dict.fromkeys(f.strip() for f in value.split(',')))
+    if not all(f in allowed for f in fields):
+        raise BadRequest({
+            "code": "invalid_fields",
+            "description": f"The fields must be among {', '.join(allowed)}."
+        }, 400)
+    return fields
+
+def select_fields(entity, fields):
+    """
+    Remove the properties of an entity that are not in fields, unless
+    fields is None. 'id' and 'self' are always kept, and so is the key.
+    """
+    if fields is not None:
+        for name in list(entity):
+            if name not in fields and name not in ('id', 'self'):
+                del entity[name]
+    return entity
+
+def get_sync_args():
+    """
+    Parse the arguments of a GET /sync request.
+
+    - since: the sync token of the previous sync. Omitted on the first sync.
+    - limit: the number of changes of each kind. Default is SYNC_PAGE_LIMIT
+      and it cannot exceed MAX_PAGE_LIMIT.
+
+    Returns
+        args : dict
+            'since' and 'limit' of the request.
+    """
+    limit = _parse_int('limit', SYNC_PAGE_LIMIT)
+    if not 1 <= limit <= MAX_PAGE_LIMIT:
+        raise BadRequest({
+            "code": "invalid_limit",
+            "description": f"The limit must be between 1 and {MAX_PAGE_LIMIT}."
+        }, 400)
+    return {'since': request.args.get('since') or None, 'limit': limit}
+
+def _parse_int(name, default):
+    value = request.args.get(name)
+    if not value:
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        raise BadRequest({
+            "code": f"invalid_{name}",
+            "description": f"Cannot parse the {name} value."
+        }, 400)
+
+def _page_url(page, **args):
+    # Keep the other arguments of the request, e.g. filters.
+    args = dict({name: value for name, value in request.args.items()
+                 if name not in ('limit', 'offset', 'cursor', 'include_total')},
+                **args)
+    if page['limit'] != PAGE_LIMIT:
+        args['limit'] = page['limit']
+    if not page['include_total']:
+        args['include_total'] = 'false'
+    return request.base_url + "?" + urlencode(args)
 
 def add_pagination(func):
     """
     Add next and prev url for get a collection requests.
+
+    The decorated function returns the response body and the page dict
+    from get_page_args() with the 'next_cursor' of the page. 'next' links
+    always carry a cursor. 'prev' links are only available to offset
+    requests because cursors only move forward.
+
+    The response has an ETag of the page, and a request with a matching
+    If-None-Match gets 304 Not Modified without serializing the page.
     """
     @wraps(func)
     def decorated(*args, **kwargs):
-        res, offset = func(*args, **kwargs)
-        prev_offset = offset - PAGE_LIMIT
-        next_offset = offset + PAGE_LIMIT
-        if prev_offset >= 0:
-            prev = request.base_url + "?offset=" + str(prev_offset)
-            res['prev'] = prev
-        if next_offset < res['total']:
-            next = request.base_url + "?offset=" + str(next_offset)
-            res['next'] = next       
-        return make_response(res, 200)
-    return decorated
\ No newline at end of file
+        res, page = func(*args, **kwargs)
+        if page['cursor'] is None and page['offset'] > 0:
+            prev_offset = max(page['offset'] - page['limit'], 0)
+            res['prev'] = _page_url(page, offset=prev_offset)
+        if page.get('next_cursor'):
+            res['next'] = _page_url(page, cursor=page['next_cursor'])
+        etag = collection_etag(res)
+        unmodified = not_modified(etag)
+        if unmodified is not None:
+            return unmodified
+        res = make_response(res, 200)
+        res.set_etag(etag)
+        return res
+    return decorated
@@ -0,0 +1,143 @@
+import hashlib
+import threading
+import uuid
+from functools import wraps
+from flask import current_app, make_response, request
+from helper.cache import TTLCache
+from helper.shared_cache import create_shared_cache
+from helper.conditional import not_modified
+from models.entity_cache import uncached_reads
+from constants.constants import PUBLIC_CACHE_SIZE, PUBLIC_CACHE_LOCAL_TTL
+from constants.constants import PUBLIC_CACHE_TTL, PUBLIC_CACHE_MAX_AGE
+from config.config import Config
+
+
+class PublicResponseCache:
+    """
+    Cache of the serialized responses of anonymous requests to public
+    resources, in process and in the optional shared cache.
+
+    Responses are grouped in scopes, e.g. 'lists' for the public feed and
+    'list:1234' for a list and its tasks. Every scope has a generation, a
+    random token in the cache key of its responses, and a scope is
+    invalidated by dropping its generation. Generations are kept in the
+    shared cache if there is one, so that every instance sees an
+    invalidation at once.
+    """
+
+    def __init__(self, shared=None, maxsize=PUBLIC_CACHE_SIZE,
+                 local_ttl=PUBLIC_CACHE_LOCAL_TTL, shared_ttl=PUBLIC_CACHE_TTL):
+        self._shared = shared
+        self._shared_ttl = shared_ttl
+        self._local = TTLCache(maxsize, local_ttl)
+        self._generations = TTLCache(maxsize, shared_ttl)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _generation(self, scope):
+        key = "public-generation:" + scope
+        if self._shared is not None:
+            generation = self._shared.get(key)
+            if generation is None:
+                generation = uuid.uuid4().hex.encode()
+                self._shared.set(key, generation, self._shared_ttl)
+            return generation.decode()
+        generation = self._generations.get(key)
+        if generation is None:
+            generation = uuid.uuid4().hex
+            self._generations.set(key, generation)
+        return generation
+
+    def get(self, scope, url):
+        """
+        Return the cache key of the url in the scope, and the cached
+        response, its ETag and body separated by a newline, or None.
+        """
+        key = "public-response:" + hashlib.sha1(
+            f"{self._generation(scope)} {url}".encode()).hexdigest()
+        body = self._local.get(key)
+        if body is None and self._shared is not None:
+            body = self._shared.get(key)
+            if body is not None:
+                self._local.set(key, body)
+        with self._lock:
+            if body is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return key, body
+
+    def set(self, key, body):
+        self._local.set(key, body)
+        if self._shared is not None:
+            self._shared.set(key, body, self._shared_ttl)
+
+    def invalidate(self, *scopes):
+        for scope in scopes:
+            key = "public-generation:" + scope
+            self._generations.delete(key)
+            if self._shared is not None:
+                self._shared.delete(key)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0
+            }
+
+
+public_cache = PublicResponseCache(
+    create_shared_cache(getattr(Config, 'SHARED_CACHE_URL', None)))
+
+
+def cache_public(scope):
+    """
+    Serve anonymous requests of the route from public_cache. The scope is
+    formatted with the arguments of the route, e.g. 'list:{list_id}'. Only
+    200 responses are cached, with their ETag, so that a cached response
+    also answers If-None-Match with 304 Not Modified.
+
+    A response is rendered from uncached reads before it is stored: the
+    local tier of the entity cache can lag the writes of other instances,
+    and a stale response would be served by every instance from the shared
+    tier.
+
+    Anonymous 200 responses can be stored by any cache for
+    PUBLIC_CACHE_MAX_AGE seconds. Responses to requests with an
+    Authorization header are private.
+    """
+    def decorator(func):
+        @wraps(func)
+        def decorated(*args, **kwargs):
+            if 'Authorization' in request.headers:
+                res = make_response(func(*args, **kwargs))
+                res.headers['Cache-Control'] = 'private, no-cache'
+            else:
+                key, cached = public_cache.get(scope.format(**kwargs),
+                                               request.url)
+                if cached is not None:
+                    etag, body = cached.split(b"\n", 1)
+                    etag = etag.decode()
+                    res = not_modified(etag)
+                    if res is None:
+                        res = current_app.response_class(
+                            body, mimetype='application/json')
+                        res.set_etag(etag)
+                else:
+                    with uncached_reads():
+                        res = make_response(func(*args, **kwargs))
+                    etag, _ = res.get_etag()
+                    if res.status_code == 200 and etag:
+                        public_cache.set(key, etag.encode() + b"\n"
+                                         + res.get_data())
+                if res.status_code in (200, 304):
+                    res.headers['Cache-Control'] = \
+                        f'public, max-age={PUBLIC_CACHE_MAX_AGE}'
+            res.vary.update(['Authorization', 'Accept'])
+            return res
+        return decorated
+    return decorator
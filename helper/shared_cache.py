@@ -0,0 +1,307 @@
+import logging
+import socket
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import urlparse
+from constants.constants import SHARED_CACHE_TIMEOUT
+from constants.constants import SHARED_CACHE_RETRY_INTERVAL
+from constants.constants import SHARED_CACHE_MAX_PENDING
+
+logger = logging.getLogger(__name__)
+
+
+class SharedCacheError(OSError):
+    """
+    Raised when the shared cache server returns an unexpected reply.
+    Network errors are raised as the OSError of the socket.
+    """
+
+
+class _Client:
+    """
+    Base of the shared cache clients. Each thread keeps its own connection
+    to the server, and a connection is dropped after any error so that the
+    next call reconnects.
+    """
+    default_port = None
+
+    def __init__(self, host, port=None, timeout=SHARED_CACHE_TIMEOUT):
+        self._address = (host, port or self.default_port)
+        self._timeout = timeout
+        self._local = threading.local()
+
+    def _call(self, request, read_reply):
+        stream = getattr(self._local, 'stream', None)
+        try:
+            if stream is None:
+                sock = socket.create_connection(self._address, self._timeout)
+                stream = self._local.stream = sock.makefile('rwb')
+                sock.close()
+            stream.write(request)
+            stream.flush()
+            return read_reply(stream)
+        except (OSError, ValueError) as err:
+            self._local.stream = None
+            if stream is not None:
+                stream.close()
+            if isinstance(err, ValueError):
+                raise SharedCacheError(f"Malformed reply: {err}") from err
+            raise
+
+    @staticmethod
+    def _readline(stream):
+        line = stream.readline()
+        if not line.endswith(b"\r\n"):
+            raise SharedCacheError("Connection closed by the cache server.")
+        return line[:-2]
+
+
+class MemcachedClient(_Client):
+    """
+    Client of the memcached text protocol with get, set, add and delete.
+    """
+    default_port = 11211
+
+    def get(self, key):
+        """
+        Return the bytes stored under the key, or None.
+        """
+        def read_reply(stream):
+            value = None
+            line = self._readline(stream)
+            if line.startswith(b"VALUE "):
+                size = int(line.split()[3])
+                value = stream.read(size + 2)[:-2]
+                line = self._readline(stream)
+            if line != b"END":
+                raise SharedCacheError(line.decode(errors='replace'))
+            return value
+        return self._call(b"get %s\r\n" % key.encode(), read_reply)
+
+    def set(self, key, value, ttl):
+        """
+        Store the bytes under the key for ttl seconds.
+        """
+        def read_reply(stream):
+            line = self._readline(stream)
+            if line != b"STORED":
+                raise SharedCacheError(line.decode(errors='replace'))
+        self._call(b"set %s 0 %d %d\r\n%s\r\n"
+                   % (key.encode(), ttl, len(value), value), read_reply)
+
+    def add(self, key, value, ttl):
+        """
+        Store the bytes under the key for ttl seconds unless the key exists.
+        Returns True if the value was stored.
+        """
+        def read_reply(stream):
+            line = self._readline(stream)
+            if line not in (b"STORED", b"NOT_STORED"):
+                raise SharedCacheError(line.decode(errors='replace'))
+            return line == b"STORED"
+        return self._call(b"add %s 0 %d %d\r\n%s\r\n"
+                          % (key.encode(), ttl, len(value), value), read_reply)
+
+    def delete(self, key):
+        def read_reply(stream):
+            line = self._readline(stream)
+            if line not in (b"DELETED", b"NOT_FOUND"):
+                raise SharedCacheError(line.decode(errors='replace'))
+        self._call(b"delete %s\r\n" % key.encode(), read_reply)
+
+
+class RedisClient(_Client):
+    """
+    Client of the Redis protocol (RESP) with GET, SET EX, SET NX and DEL.
+    """
+    default_port = 6379
+
+    @staticmethod
+    def _command(*args):
+        request = b"*%d\r\n" % len(args)
+        for arg in args:
+            if isinstance(arg, str):
+                arg = arg.encode()
+            request += b"$%d\r\n%s\r\n" % (len(arg), arg)
+        return request
+
+    def _read_reply(self, stream):
+        line = self._readline(stream)
+        if line.startswith(b"-"):
+            raise SharedCacheError(line[1:].decode(errors='replace'))
+        if line.startswith(b"$"):
+            size = int(line[1:])
+            if size < 0:
+                return None
+            return stream.read(size + 2)[:-2]
+        return line[1:]
+
+    def get(self, key):
+        """
+        Return the bytes stored under the key, or None.
+        """
+        return self._call(self._command("GET", key), self._read_reply)
+
+    def set(self, key, value, ttl):
+        """
+        Store the bytes under the key for ttl seconds.
+        """
+        self._call(self._command("SET", key, value, "EX", str(ttl)),
+                   self._read_reply)
+
+    def add(self, key, value, ttl):
+        """
+        Store the bytes under the key for ttl seconds unless the key exists.
+        Returns True if the value was stored.
+        """
+        return self._call(self._command("SET", key, value, "EX", str(ttl),
+                                        "NX"), self._read_reply) is not None
+
+    def delete(self, key):
+        self._call(self._command("DEL", key), self._read_reply)
+
+
+class SharedCache:
+    """
+    Front of a shared cache client for callers that must keep working when
+    the server is down. Errors are logged and counted, a failed get returns
+    None and a failed add stores nothing. After an error, calls skip the
+    server for SHARED_CACHE_RETRY_INTERVAL seconds.
+
+    Invalidations (invalidate and delete) are never dropped: a failed one is
+    sent again before the next call that reaches the server, and until then
+    gets and adds skip the server, so that a value whose invalidation was
+    lost is neither read nor kept. If more than max_pending invalidations
+    are waiting, they are dropped and the server is skipped until every
+    value this instance stored before has expired.
+    """
+
+    def __init__(self, client, retry_interval=SHARED_CACHE_RETRY_INTERVAL,
+                 max_pending=SHARED_CACHE_MAX_PENDING):
+        self._client = client
+        self._retry_interval = retry_interval
+        self._max_pending = max_pending
+        self._lock = threading.Lock()
+        self._retry_at = 0
+        # Failed invalidations by key, in order: (method, *args).
+        self._pending = OrderedDict()
+        self._max_ttl = 0
+        self._skip_until = 0
+        self.errors = 0
+
+    def _failed(self, method, err):
+        with self._lock:
+            self.errors += 1
+            self._retry_at = time.monotonic() + self._retry_interval
+        logger.warning("Shared cache %s failed: %s", method, err)
+
+    def _flush(self):
+        """
+        Send the pending invalidations. Returns True if none is left.
+        """
+        with self._lock:
+            if not self._pending:
+                return True
+            if time.monotonic() < self._retry_at:
+                return False
+            pending = list(self._pending.items())
+        for key, (method, *args) in pending:
+            try:
+                getattr(self._client, method)(key, *args)
+            except OSError as err:
+                self._failed(method, err)
+                return False
+            with self._lock:
+                if self._pending.get(key) == (method, *args):
+                    del self._pending[key]
+        return True
+
+    def _readable(self):
+        return time.monotonic() >= max(self._retry_at, self._skip_until) \
+            and self._flush()
+
+    def _invalidate(self, key, method, *args):
+        if self._flush():
+            try:
+                getattr(self._client, method)(key, *args)
+                return
+            except OSError as err:
+                self._failed(method, err)
+        with self._lock:
+            self._pending.pop(key, None)
+            self._pending[key] = (method, *args)
+            if len(self._pending) > self._max_pending:
+                logger.warning("Dropped %d shared cache invalidations, "
+                               "skipping the server for %d seconds",
+                               len(self._pending), self._max_ttl)
+                self._pending.clear()
+                self._skip_until = time.monotonic() + self._max_ttl
+
+    def get(self, key):
+        if not self._readable():
+            return None
+        try:
+            return self._client.get(key)
+        except OSError as err:
+            self._failed('get', err)
+            return None
+
+    def set(self, key, value, ttl):
+        self._max_ttl = max(self._max_ttl, ttl)
+        if not self._readable():
+            return
+        try:
+            self._client.set(key, value, ttl)
+        except OSError as err:
+            self._failed('set', err)
+
+    def add(self, key, value, ttl):
+        """
+        Store the value unless the key exists. Returns True if it was stored.
+        """
+        self._max_ttl = max(self._max_ttl, ttl)
+        if not self._readable():
+            return False
+        try:
+            return self._client.add(key, value, ttl)
+        except OSError as err:
+            self._failed('add', err)
+            return False
+
+    def invalidate(self, key, marker, ttl):
+        """
+        Replace the value of the key by a marker for ttl seconds, so that
+        add cannot store a value read before the invalidation.
+        """
+        self._invalidate(key, 'set', marker, ttl)
+
+    def delete(self, key):
+        self._invalidate(key, 'delete')
+
+
+CLIENTS = {'memcached': MemcachedClient, 'redis': RedisClient}
+
+
+def create_shared_cache(url, timeout=SHARED_CACHE_TIMEOUT):
+    """
+    Create the client of a shared cache server, e.g.
+    'memcached://localhost:11211' or 'redis://localhost:6379'.
+
+    Parameters
+        url : str
+            url of the server. None disables the shared cache.
+        timeout : float
+            socket timeout in seconds
+    Returns
+        cache : SharedCache
+            the client behind a SharedCache, or None.
+    """
+    if not url:
+        return None
+    parsed = urlparse(url)
+    if parsed.scheme not in CLIENTS:
+        raise ValueError(f"Unknown shared cache {url!r}, expected a "
+                         f"{' or '.join(CLIENTS)} url.")
+    return SharedCache(CLIENTS[parsed.scheme](parsed.hostname or 'localhost',
+                                              parsed.port, timeout))
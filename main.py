@@ -1,45 +1,54 @@
 import json
-from flask import Flask, session
+import logging
+import threading
+import time
+from flask import Blueprint, Flask, current_app, session
 from flask import  redirect, render_template, url_for, make_response
 from urllib.parse import quote_plus, urlencode
-from authlib.integrations.flask_client import OAuth
 from blueprints.tasks import task_api
 from blueprints.lists import list_api
 from blueprints.users import user_api
+from blueprints.jobs import job_api
+from blueprints.sync import sync_api
+from blueprints.export import export_api
+from blueprints.imports import import_api
 from validations.request import BadRequest, handle_bad_request
 from validations.exception import RequestException, handle_request_exception
 from validations.auth import AuthError, handle_auth_error
-from models.model import add_user
+from validations import auth
+from models.model import add_user, migrate_user_keys, backfill_list_names
+from models.model import migrate_list_tasks, backfill_updated_at
+from models.model import prune_tombstones, migrate_due_dates, index_yaml
+from models.model import start_request_deadline, warm_up
+from models import instrumentation
+import models.model as model
+from constants.constants import CACHE_STATS_INTERVAL
 from config.config import Config
 
+# Without a handler, only warnings would reach the instance's logs.
+logger = logging.getLogger(__name__)
 
-app = Flask(__name__)
-app.secret_key = Config.APP_SECRET_KEY
-app.register_blueprint(task_api)
-app.register_blueprint(list_api)
-app.register_blueprint(user_api)
-app.register_error_handler(BadRequest, handle_bad_request)
-app.register_error_handler(RequestException, handle_request_exception)
-app.register_error_handler(AuthError, handle_auth_error)
+# Login pages and the warmup handler of App Engine.
+pages = Blueprint('pages', __name__)
+
+# Maintenance commands, e.g. 'flask --app main migrate-users'.
+commands = Blueprint('commands', __name__, cli_group=None)
 
 #############################################################################
 # General HTTP error handlers                                               #
 #############################################################################
-@app.errorhandler(404)
 def page_not_found(err):
     return make_response({
         "code": "page_not_found",
         "description": "the page is not found."
     }, 404)
       
-@app.errorhandler(405)
 def method_not_allowed(err):
     return make_response({
         "code": "method_not_allowed",
         "description": "This endpoint does not support the request method."
     }, 405)
 
-@app.errorhandler(415)
 def unsupported_media_type(err):
     return make_response({
         "code": "unsupported_media_type",
@@ -61,31 +70,40 @@ def unsupported_media_type(err):
 #    datastore.                                                            #
 ############################################################################
 
-oauth = OAuth(app)
-oauth.register(
-    "auth0",
-    client_id=Config.AUTH0_CLIENT_ID,
-    client_secret=Config.AUTH0_CLIENT_SECRET,
-    client_kwargs={
-        "scope": "openid profile email",
-    },
-    server_metadata_url=f'https://{Config.AUTH0_DOMAIN}/.well-known/openid-configuration'
-)
-
-@app.route('/')
+def auth0_client():
+    """
+    Return the Auth0 client of the login pages. authlib is imported and the
+    client registered on first use, so that API requests never pay for them.
+    """
+    client = current_app.extensions.get('auth0')
+    if client is None:
+        from authlib.integrations.flask_client import OAuth
+        oauth = OAuth(current_app)
+        client = current_app.extensions['auth0'] = oauth.register(
+            "auth0",
+            client_id=Config.AUTH0_CLIENT_ID,
+            client_secret=Config.AUTH0_CLIENT_SECRET,
+            client_kwargs={
+                "scope": "openid profile email",
+            },
+            server_metadata_url=f'https://{Config.AUTH0_DOMAIN}/.well-known/openid-configuration'
+        )
+    return client
+
+@pages.route('/')
 def index():
     return render_template("index.html", session=session.get('user'),
                            pretty=json.dumps(session.get('user'), indent=4))
 
-@app.route("/login")
+@pages.route("/login")
 def login():
-    return oauth.auth0.authorize_redirect(
-        redirect_uri = url_for("callback", _external=True)
+    return auth0_client().authorize_redirect(
+        redirect_uri = url_for("pages.callback", _external=True)
     )
 
-@app.route("/callback", methods=["GET", "POST"])
+@pages.route("/callback", methods=["GET", "POST"])
 def callback():
-    token = oauth.auth0.authorize_access_token()
+    token = auth0_client().authorize_access_token()
     session["user"] = token
     user_id = token["userinfo"]["sub"]
     name = token["userinfo"]["name"]
@@ -96,7 +114,7 @@ def callback():
     add_user(user_info)  # Add the user to datastore
     return redirect("/")
 
-@app.route("/logout")
+@pages.route("/logout")
 def logout():
     session.clear()
     return redirect(
@@ -104,7 +122,7 @@ def logout():
         + "/v2/logout?"
         + urlencode(
           {
-              "returnTo": url_for("index", _external=True),
+              "returnTo": url_for("pages.index", _external=True),
               "client_id": Config.AUTH0_CLIENT_ID,
           },
           quote_via = quote_plus,
@@ -112,5 +130,143 @@ def logout():
     )
 
 ############################ END CITED CODE ################################
+
+#############################################################################
+# Warmup                                                                    #
+#############################################################################
+@pages.route('/_ah/warmup')
+def warmup():
+    """
+    Warm up a new instance before App Engine sends it traffic: fetch Auth0's
+    signing keys, import jose, and open the connections to the datastore and
+    the shared cache. Returns the milliseconds taken by each step.
+    """
+    timings = {}
+    for name, step in (("auth", auth.warm_up), ("datastore", warm_up)):
+        start = time.perf_counter()
+        step()
+        timings[name] = round((time.perf_counter() - start) * 1000, 1)
+    logger.info("Warmed up in %s ms", timings)
+    return make_response(timings, 200)
+
+#############################################################################
+# Cache statistics                                                          #
+#############################################################################
+_stats_lock = threading.Lock()
+_stats_logged_at = time.monotonic()
+
+def log_cache_stats(response):
+    """
+    Log the counters of the verified token cache and the entity cache every
+    CACHE_STATS_INTERVAL seconds. They count from the start of the instance.
+    """
+    global _stats_logged_at
+    now = time.monotonic()
+    with _stats_lock:
+        if now - _stats_logged_at < CACHE_STATS_INTERVAL:
+            return response
+        _stats_logged_at = now
+    logger.info("Cache stats: %s", json.dumps({
+        "tokens": auth.token_cache.stats(),
+        "entities": model.engine.stats()
+    }))
+    return response
+
+#############################################################################
+# Maintenance commands                                                      #
+#############################################################################
+@commands.cli.command("migrate-users")
+def migrate_users():
+    """
+    Re-key user entities stored under numeric ids by their user_id.
+    """
+    print(f"Migrated {migrate_user_keys()} user(s).")
+
+@commands.cli.command("backfill-list-names")
+def backfill_names():
+    """
+    Claim the names of lists created before list names were claimed.
+    """
+    print(f"Claimed {backfill_list_names()} list name(s).")
+
+@commands.cli.command("migrate-list-tasks")
+def migrate_members():
+    """
+    Move the tasks embedded in lists to 'list_tasks' membership entities.
+    """
+    print(f"Migrated {migrate_list_tasks()} list(s).")
+
+@commands.cli.command("backfill-updated-at")
+def backfill_stamps():
+    """
+    Stamp 'updated_at' on tasks and lists created before delta sync.
+    """
+    print(f"Stamped {backfill_updated_at()} entities.")
+
+@commands.cli.command("prune-tombstones")
+def prune_deleted():
+    """
+    Delete the tombstones of entities deleted more than SYNC_TOMBSTONE_DAYS
+    ago.
+    """
+    print(f"Pruned {prune_tombstones()} tombstone(s).")
+
+@commands.cli.command("migrate-due-dates")
+def migrate_dates():
+    """
+    Convert the 'due_date' strings of tasks to datetimes.
+    """
+    print(f"Migrated {migrate_due_dates()} task(s).")
+
+@commands.cli.command("generate-indexes")
+def generate_indexes():
+    """
+    Write the datastore composite indexes of the app's queries to index.yaml.
+    """
+    with open("index.yaml", "w") as f:
+        f.write(index_yaml())
+    print("Wrote index.yaml.")
+
+#############################################################################
+# App                                                                       #
+#############################################################################
+def create_app():
+    """
+    Create the app with its blueprints, error handlers and maintenance
+    commands. Clients are created on first use (see auth0_client and
+    models.storage.datastore_engine), so that a new instance serves sooner;
+    /_ah/warmup creates them before the first request.
+    """
+    start = time.perf_counter()
+    app = Flask(__name__)
+    # app.logger is this module's logger. Flask gives it a handler unless
+    # the server has configured logging, so its INFO records are logged
+    # without changing the root logger of the process.
+    app.logger.setLevel(logging.INFO)
+    app.secret_key = Config.APP_SECRET_KEY
+    app.register_blueprint(task_api)
+    app.register_blueprint(list_api)
+    app.register_blueprint(user_api)
+    app.register_blueprint(job_api)
+    app.register_blueprint(sync_api)
+    app.register_blueprint(export_api)
+    app.register_blueprint(import_api)
+    app.register_blueprint(pages)
+    app.register_blueprint(commands)
+    app.register_error_handler(BadRequest, handle_bad_request)
+    app.register_error_handler(RequestException, handle_request_exception)
+    app.register_error_handler(AuthError, handle_auth_error)
+    app.register_error_handler(404, page_not_found)
+    app.register_error_handler(405, method_not_allowed)
+    app.register_error_handler(415, unsupported_media_type)
+    instrumentation.init_app(app)
+    app.before_request(start_request_deadline)
+    app.after_request(log_cache_stats)
+    logger.info("Created the app in %.1f ms",
+                (time.perf_counter() - start) * 1000)
+    return app
+
+app = create_app()
+
 if __name__ == '__main__':
     app.run(host='127.0.0.1', port=8080, debug=True)
@@ -0,0 +1,246 @@
+import contextvars
+import copy
+import hashlib
+import json
+import threading
+from contextlib import contextmanager
+from helper.cache import TTLCache
+from models.instrumentation import current_stats
+from models.storage.base import encode_value, decode_value
+from constants.constants import ENTITY_CACHE_SIZE, ENTITY_CACHE_LOCAL_TTL
+from constants.constants import ENTITY_CACHE_TTL
+from constants.constants import ENTITY_CACHE_INVALIDATION_TTL
+
+# True in uncached_reads(). A context variable, so that reads fanned out by
+# models.model.fetch_all see it too.
+_uncached = contextvars.ContextVar('uncached_reads', default=False)
+
+# Stored in the shared tier in place of a written entity, see _invalidate.
+INVALIDATED = b"-"
+
+
+@contextmanager
+def uncached_reads():
+    """
+    Read entities from the engine rather than from the cache in the block,
+    e.g. to render a response that is cached itself. The entities read
+    still fill the cache.
+    """
+    token = _uncached.set(True)
+    try:
+        yield
+    finally:
+        _uncached.reset(token)
+
+class CachedEngine:
+    """
+    Proxy of a storage engine with a read-through cache of entities by key.
+
+    get and get_multi are served from a bounded in-process LRU cache, then
+    from an optional shared cache (see helper.shared_cache), and only then
+    from the engine. put, put_multi, delete and delete_multi invalidate the
+    keys in both tiers, so every write of the app invalidates the cache.
+
+    The shared tier keeps instances coherent: a write on one instance is
+    seen by the others once their local copy expires, after at most
+    ENTITY_CACHE_LOCAL_TTL seconds. A write replaces the shared entry by a
+    marker for ENTITY_CACHE_INVALIDATION_TTL seconds, and reads only fill
+    the shared tier if the key is absent, so that an instance that read the
+    entity before the write cannot put it back. Reads in a transaction
+    bypass the cache, and those in uncached_reads() are made from the
+    engine.
+    """
+
+    def __init__(self, engine, shared=None, maxsize=ENTITY_CACHE_SIZE,
+                 local_ttl=ENTITY_CACHE_LOCAL_TTL, shared_ttl=ENTITY_CACHE_TTL,
+                 invalidation_ttl=ENTITY_CACHE_INVALIDATION_TTL):
+        self.engine = engine
+        self._shared = shared
+        self._shared_ttl = shared_ttl
+        self._invalidation_ttl = invalidation_ttl
+        self._local = TTLCache(maxsize, local_ttl)
+        self._lock = threading.Lock()
+        self._thread = threading.local()
+        # Incremented by every invalidation. A read only fills the cache if
+        # no write happened while it was reading, so that it cannot cache
+        # an entity older than the write.
+        self._generation = 0
+        self.shared_hits = 0
+        self.shared_misses = 0
+
+    def __getattr__(self, name):
+        return getattr(self.engine, name)
+
+    @staticmethod
+    def _shared_key(key):
+        path = json.dumps(key.flat_path, default=str).encode()
+        return "entity:" + hashlib.sha1(path).hexdigest()
+
+    def in_transaction(self):
+        """
+        Return True if the current thread is in a transaction.
+        """
+        return getattr(self._thread, 'depth', 0) > 0
+
+    def _entity(self, key, value):
+        exclude_from_indexes, props = value
+        entity = self.engine.entity(key, exclude_from_indexes)
+        entity.update(copy.deepcopy(props))
+        return entity
+
+    def _lookup(self, key):
+        """
+        Return the cached entity of the key from the local, then the shared
+        tier, or None.
+        """
+        value = self._local.get(key.flat_path)
+        if value is not None or self._shared is None:
+            return value
+        data = self._shared.get(self._shared_key(key))
+        with self._lock:
+            if data is None or data == INVALIDATED:
+                self.shared_misses += 1
+                return None
+            self.shared_hits += 1
+        value = tuple(json.loads(data, object_hook=decode_value))
+        self._local.set(key.flat_path, value)
+        return value
+
+    def _fill(self, entities, generation):
+        with self._lock:
+            if generation != self._generation:
+                return
+        for entity in entities:
+            value = (list(entity.exclude_from_indexes),
+                     copy.deepcopy(dict(entity)))
+            self._local.set(entity.key.flat_path, value)
+            if self._shared is None:
+                continue
+            try:
+                data = json.dumps(value, default=encode_value).encode()
+            except (TypeError, ValueError):
+                # Only kept locally, e.g. an entity with a key property.
+                continue
+            self._shared.add(self._shared_key(entity.key), data,
+                             self._shared_ttl)
+
+    def _invalidate(self, keys):
+        with self._lock:
+            self._generation += 1
+        written = getattr(self._thread, 'written', None)
+        for key in keys:
+            self._local.delete(key.flat_path)
+            if self._shared is not None:
+                self._shared.invalidate(self._shared_key(key), INVALIDATED,
+                                        self._invalidation_ttl)
+            if written is not None:
+                written.append(key)
+
+    @staticmethod
+    def _record(hits, misses):
+        stats = current_stats()
+        if stats is not None:
+            stats.record_cache(hits, misses)
+
+    def get(self, key):
+        if self.in_transaction():
+            return self.engine.get(key)
+        value = None if _uncached.get() else self._lookup(key)
+        if value is not None:
+            self._record(1, 0)
+            return self._entity(key, value)
+        self._record(0, 1)
+        generation = self._generation
+        entity = self.engine.get(key)
+        if entity is not None:
+            self._fill([entity], generation)
+        return entity
+
+    def get_multi(self, keys):
+        keys = list(keys)
+        if self.in_transaction():
+            return self.engine.get_multi(keys)
+        entities = []
+        missing = []
+        for key in keys:
+            value = None if _uncached.get() else self._lookup(key)
+            if value is None:
+                missing.append(key)
+            else:
+                entities.append(self._entity(key, value))
+        self._record(len(entities), len(missing))
+        if missing:
+            generation = self._generation
+            fetched = self.engine.get_multi(missing)
+            self._fill(fetched, generation)
+            entities.extend(fetched)
+        return entities
+
+    def put(self, entity):
+        self.engine.put(entity)
+        self._invalidate([entity.key])
+
+    def put_multi(self, entities):
+        entities = list(entities)
+        self.engine.put_multi(entities)
+        self._invalidate([entity.key for entity in entities])
+
+    def delete(self, key):
+        self.engine.delete(key)
+        self._invalidate([key])
+
+    def delete_multi(self, keys):
+        keys = list(keys)
+        self.engine.delete_multi(keys)
+        self._invalidate(keys)
+
+    @contextmanager
+    def transaction(self):
+        """
+        Run the engine's transaction. Keys written in the transaction are
+        invalidated again when it ends, in case a concurrent read cached
+        them before the commit.
+        """
+        depth = getattr(self._thread, 'depth', 0)
+        if depth == 0:
+            self._thread.written = []
+        self._thread.depth = depth + 1
+        try:
+            with self.engine.transaction():
+                yield
+        finally:
+            self._thread.depth = depth
+            if depth == 0:
+                written, self._thread.written = self._thread.written, None
+                self._invalidate(written)
+
+    def clear(self):
+        """
+        Drop the local tier and reset the counters.
+        """
+        self._local.clear()
+        with self._lock:
+            self.shared_hits = self.shared_misses = 0
+
+    def stats(self):
+        """
+        Returns hit and miss counters of the local and the shared tier, and
+        the hit ratio of the cache as a whole.
+        """
+        local = self._local.stats()
+        with self._lock:
+            shared_lookups = self.shared_hits + self.shared_misses
+            shared = {
+                "hits": self.shared_hits,
+                "misses": self.shared_misses,
+                "errors": self._shared.errors,
+                "hit_ratio": self.shared_hits / shared_lookups
+                             if shared_lookups else 0.0
+            } if self._shared is not None else None
+        lookups = local["hits"] + local["misses"]
+        hits = local["hits"] + (shared["hits"] if shared else 0)
+        return {
+            "hit_ratio": hits / lookups if lookups else 0.0,
+            "local": local,
+            "shared": shared
+        }
@@ -0,0 +1,155 @@
+import logging
+import threading
+import time
+from collections import Counter
+from flask import g, has_app_context, request
+from constants.constants import RPC_BUDGET, RPC_REPEATED_GET_THRESHOLD
+
+logger = logging.getLogger(__name__)
+
+# Category of every engine call that reaches the datastore.
+CATEGORIES = {
+    'get': 'read',
+    'get_multi': 'read',
+    'put': 'write',
+    'put_multi': 'write',
+    'delete': 'write',
+    'delete_multi': 'write',
+    'query': 'query',
+    'count': 'query',
+}
+
+# Irregular plurals of the Server-Timing descriptions.
+PLURALS = {'query': 'queries', 'miss': 'misses'}
+
+
+class RequestStats:
+    """
+    Datastore calls made while serving a request: the number and total
+    duration of reads, writes and queries, the keys of single-key gets, and
+    the hits and misses of the entity cache (see models.entity_cache).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.calls = Counter()
+        self.durations = Counter()
+        self.gets = []
+        self.cache = Counter()
+
+    def record(self, category, seconds, key=None):
+        with self._lock:
+            self.calls[category] += 1
+            self.durations[category] += seconds
+            if key is not None:
+                self.gets.append(key)
+
+    def record_cache(self, hits, misses):
+        with self._lock:
+            self.cache['hits'] += hits
+            self.cache['misses'] += misses
+
+    @property
+    def total(self):
+        return sum(self.calls.values())
+
+    def repeated_gets(self):
+        """
+        Return the kinds fetched by RPC_REPEATED_GET_THRESHOLD or more
+        single-key gets, with the number of gets. These should have been
+        a single get_multi.
+        """
+        kinds = Counter(key.kind for key in self.gets)
+        return {kind: n for kind, n in kinds.items()
+                if n >= RPC_REPEATED_GET_THRESHOLD}
+
+    def server_timing(self):
+        """
+        Return the value of the Server-Timing header.
+        """
+        metrics = []
+        for category in ('read', 'write', 'query'):
+            n = self.calls[category]
+            if n:
+                metrics.append(
+                    f'ds-{category};dur={self.durations[category] * 1000:.2f}'
+                    f';desc="{_count(n, category)}"')
+        if self.cache['hits'] or self.cache['misses']:
+            metrics.append(f'cache;desc="{_count(self.cache["hits"], "hit")}, '
+                           f'{_count(self.cache["misses"], "miss")}"')
+        return ", ".join(metrics)
+
+
+def _count(n, noun):
+    return f"{n} {noun if n == 1 else PLURALS.get(noun, noun + 's')}"
+
+
+def current_stats():
+    """
+    Return the RequestStats of the current request, or None outside of a
+    request or before init_app's hook has run.
+    """
+    if not has_app_context():
+        return None
+    return g.get('rpc_stats')
+
+
+class InstrumentedEngine:
+    """
+    Proxy of a storage engine timing every datastore call and recording it
+    in the current request's RequestStats.
+    """
+
+    def __init__(self, engine):
+        self._engine = engine
+
+    @property
+    def engine(self):
+        return self._engine
+
+    def __getattr__(self, name):
+        attr = getattr(self._engine, name)
+        category = CATEGORIES.get(name)
+        if category is None:
+            return attr
+
+        def timed(*args, **kwargs):
+            stats = current_stats()
+            if stats is None:
+                return attr(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return attr(*args, **kwargs)
+            finally:
+                key = args[0] if name == 'get' and args else None
+                stats.record(category, time.perf_counter() - start, key)
+        return timed
+
+
+def init_app(app):
+    """
+    Collect datastore calls per request. Every response gets a Server-Timing
+    header; requests over RPC_BUDGET calls and requests with repeated
+    single-key gets are logged.
+    """
+    @app.before_request
+    def start_rpc_stats():
+        g.rpc_stats = RequestStats()
+
+    @app.after_request
+    def report_rpc_stats(response):
+        stats = g.pop('rpc_stats', None)
+        if stats is None:
+            return response
+        if stats.total or stats.cache:
+            response.headers.add('Server-Timing', stats.server_timing())
+        if stats.total > RPC_BUDGET:
+            logger.warning("%s %s made %d datastore calls (budget %d): %s",
+                           request.method, request.path, stats.total,
+                           RPC_BUDGET, dict(stats.calls))
+        repeated = stats.repeated_gets()
+        if repeated:
+            logger.warning("%s %s made repeated single-key gets, use "
+                           "get_multi: %s", request.method, request.path,
+                           repeated)
+        return response
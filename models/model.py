@@ -1,14 +1,70 @@
-from google.cloud import datastore
-from flask import request
+import base64
+import binascii
+import contextvars
+import itertools
+import json
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_EXCEPTION
+from datetime import datetime, timedelta, timezone
+from flask import g, has_request_context, request
+from models.storage import create_engine, InvalidCursor
+from models.instrumentation import InstrumentedEngine
+from models.entity_cache import CachedEngine, uncached_reads
+from validations.request import BadRequest
 from validations.request import validate_required, validate_task_property
 from validations.request import validate_task_list_property
 from validations.exception import RequestException
-from constants.constants import PAGE_LIMIT
+from helper.cache import TTLCache
+from helper import background
+from helper.shared_cache import create_shared_cache
+from helper.response_cache import public_cache
+from helper.conditional import entity_etag
+from constants.constants import PAGE_LIMIT, MAX_PAGE_LIMIT
 from constants.constants import TASK_REQUIRED_PROPERTIES
 from constants.constants import LIST_REQUIRED_PROPERTIES
+from constants.constants import USER_CACHE_SIZE, USER_CACHE_TTL
+from constants.constants import DATASTORE_BATCH_LIMIT, MAX_BATCH_OPERATIONS
+from constants.constants import MAX_LIST_TASK_IDS
+from constants.constants import ASYNC_DELETE_THRESHOLD
+from constants.constants import SYNC_PAGE_LIMIT, SYNC_SETTLE_TIME
+from constants.constants import SYNC_TOMBSTONE_DAYS
+from constants.constants import EXPORT_BATCH_SIZE, IMPORT_BATCH_SIZE
+from constants.constants import READ_POOL_WORKERS, REQUEST_DEADLINE
+from config.config import Config
 
+logger = logging.getLogger(__name__)
 
-client = datastore.Client()
+# Storage engine selected by Config.STORAGE_ENGINE: 'datastore' (default),
+# 'memory' or 'sqlite' (database file in Config.SQLITE_PATH). Every call is
+# accounted to the current request (see models.instrumentation). Gets are
+# cached in process and in the shared cache at Config.SHARED_CACHE_URL, if
+# any (see models.entity_cache).
+engine = CachedEngine(
+    InstrumentedEngine(
+        create_engine(getattr(Config, 'STORAGE_ENGINE', 'datastore'),
+                      getattr(Config, 'SQLITE_PATH', None))),
+    create_shared_cache(getattr(Config, 'SHARED_CACHE_URL', None)))
+
+# Ids of users known to exist in datastore. Only positive lookups are
+# cached so that a user is found right after the first login.
+known_users = TTLCache(USER_CACHE_SIZE, USER_CACHE_TTL)
+
+# Last 'updated_at' stamped by this process (see next_timestamp).
+_clock_lock = threading.Lock()
+_last_timestamp = datetime.min.replace(tzinfo=timezone.utc)
+
+# Independent reads run at the same time if the engine waits on the
+# network, or if Config.CONCURRENT_READS is set (see fetch_all).
+concurrent_reads = getattr(Config, 'CONCURRENT_READS',
+                           engine.concurrent_reads)
+
+# Threads running the independent reads of requests (see fetch_all).
+read_pool = ThreadPoolExecutor(READ_POOL_WORKERS, thread_name_prefix="read")
+
+# True in the reads run by read_pool, whose own reads are run in turn.
+_in_read_pool = contextvars.ContextVar('in_read_pool', default=False)
 
 ##############################################################################
 # Add Entity                                                                 #
@@ -29,9 +85,9 @@ def add_entity(kind, entity_info):
             a datastore Entity object contains datastore key and properties
             of an entity.
     """
-    entity = datastore.Entity(client.key(kind))
+    entity = engine.entity(engine.key(kind))
     entity.update(entity_info)
-    client.put(entity)
+    engine.put(entity)
     return entity
 
 def add_task(task_property):
@@ -44,12 +100,15 @@ def add_task(task_property):
     """
     validate_required("tasks", task_property)
     validate_task_property(task_property)
+    parse_due_date(task_property)
+    touch_new(task_property)
     return add_entity("tasks", task_property)
 
 def add_task_list(task_list_property):
     """
     Add a task list entity to datastore.
-    It also checks whether the task_list's name is unique in the datstore.
+    It also claims the task_list's name, so that the name is unique among
+    the owner's lists.
 
     Parameters:
         task_list_property : dict
@@ -57,22 +116,19 @@ def add_task_list(task_list_property):
     """
     validate_required("lists", task_list_property)
     validate_task_list_property(task_list_property)
+    touch_new(task_list_property)
 
-    # Check duplicate name
-    name = task_list_property["name"]
-    user_id = task_list_property["owner"]
-    result = get_list_same_name(name, user_id)
-    if len(result) > 0:
-        raise RequestException({
-            "code": "list_name_not_unique",
-            "description": "You already have a list with the same name."
-        }, 403)
-
-    return add_entity("lists", task_list_property)
+    with engine.transaction():
+        claim_list_name(task_list_property["owner"], task_list_property["name"])
+        task_list = add_entity("lists", task_list_property)
+    if task_list["public"]:
+        public_cache.invalidate("lists")
+    return task_list
 
 def add_user(user_info):
     """
-    Add a user entity to datastore.
+    Add a user entity to datastore. The entity is keyed by the user's id,
+    so the existence check and the insert are done in a single transaction.
     If the user id is already in the datstore, it won't add it.
 
     Parameters:
@@ -80,56 +136,327 @@ def add_user(user_info):
             key-value pairs of the user's properties.
     """
     user_id = user_info["user_id"]
-    # Check if the user_id already in datastore.
-    query = client.query(kind="users")
-    query = list(query.add_filter("user_id", "=", user_id).fetch())
-    if len(query) == 0:
-        add_entity("users", user_info)
+    if user_id in known_users:
+        return
+    key = user_key(user_id)
+    with engine.transaction():
+        if engine.get(key) is None:
+            user = engine.entity(key)
+            user.update(user_info)
+            engine.put(user)
+    known_users.set(user_id, True)
 
 
 ##############################################################################
-# Get an Entity                                                              #
+# List Names                                                                 #
 ##############################################################################
 
-def get_entity_by_name(kind, name):
+def list_name_key(user_id, name):
     """
-    Get an entity from datastore by the name property.
-    If there isn't a matching name exists on the datstore, it will return None.
+    Return the key of the claim on a list name. Claims are 'list_names'
+    entities keyed by the (owner, name) pair, so checking that a name is
+    unique is a strongly consistent key lookup instead of a query.
 
     Parameters:
-        kind : str
-            the kind of an entity
+        user_id : str
+            user's id of the App. 'sub' value of JWT
         name : str
-            the name property of an entity
-    
-    Returns:
-        query : list
-            a list contains entities has the matching name.
+            the name of a list
     """
-    query = client.query(kind=kind)
-    query = query.add_filter('user_id', '=', name).fetch()
-    return list(query)
+    return engine.key("list_names", json.dumps([user_id, name]))
 
-def get_list_same_name(name, user_id):
+def claim_list_name(user_id, name):
     """
-    Get an entity from datastore by the name property, and filter again
-    by the given user_id. This is for add/edit list to check whether the
-    name is unique.
+    Claim a list name for the user. Raise RequestException if one of the
+    user's lists already has the name. Call it in a transaction together
+    with the write of the list.
 
     Parameters:
         user_id : str
             user's id of the App. 'sub' value of JWT
         name : str
-            the name property of an entity
-    
+            the name of a list
+    """
+    key = list_name_key(user_id, name)
+    if engine.get(key) is not None:
+        raise RequestException({
+            "code": "list_name_not_unique",
+            "description": "You already have a list with the same name."
+        }, 403)
+    claim = engine.entity(key)
+    claim.update({'owner': user_id, 'name': name})
+    engine.put(claim)
+
+def release_list_name(user_id, name):
+    """
+    Release the claim on a list name, e.g. when the list is renamed.
+    """
+    engine.delete(list_name_key(user_id, name))
+
+
+##############################################################################
+# List Membership                                                            #
+##############################################################################
+
+def list_task_key(list_key, task_id):
+    """
+    Return the key of a task's membership in a list. Memberships are
+    'list_tasks' entities that are children of the list and keyed by the
+    task id, so a task is added or removed without reading or rewriting the
+    list, and the members of a list are read with an ancestor query.
+
+    Parameters:
+        list_key : google.datastore.Key
+            the key of the task list
+        task_id : int
+            the datastore id of the task
+    """
+    return engine.key("list_tasks", task_id, parent=list_key)
+
+def list_task_entity(list_key, task):
+    """
+    Return the membership entity of the task in the list.
+    """
+    member = engine.entity(list_task_key(list_key, task.key.id))
+    member.update({'id': task.key.id, 'name': task['name']})
+    return member
+
+def invalidate_public_list(list_id, feed=False):
+    """
+    Drop the cached anonymous responses of a list and its tasks, and of the
+    public lists feed if feed is True (see helper.response_cache).
+    """
+    scopes = [f"list:{list_id}"]
+    if feed:
+        scopes.append("lists")
+    public_cache.invalidate(*scopes)
+
+def get_task_and_list(task_id, list_id, user_id):
+    """
+    Get a task and a task list of the user with a single get_multi. Raise
+    RequestException like get_task_by_id and get_task_list_by_id.
+
     Returns:
-        query : list
-            a list contains entities has the matching name and user id.
+        task, task_list : google.datastore.Entity
+    """
+    entities = {entity.key.kind: entity for entity in engine.get_multi(
+        [engine.key("tasks", task_id), engine.key("lists", list_id)])}
+    for kind, name in (("tasks", "task"), ("lists", "list")):
+        entity = entities.get(kind)
+        if entity is None:
+            raise RequestException({
+                "code": "invalid_id",
+                "description": "The id does not exist."
+            }, 404)
+        if entity["owner"] != user_id:
+            raise RequestException({
+                "code": "forbidden",
+                "description": f"You are not permitted to view/modify the {name}."
+            }, 403)
+    return entities["tasks"], entities["lists"]
+
+def add_list_task(list_id, task_id, user_id):
+    """
+    Add a task to a list. The task and the list are read with one
+    get_multi, and the task's 'task_list' property and the membership
+    entity written, in one transaction, so that the task is never written
+    from a stale copy.
+
+    Parameters:
+        list_id : int
+            datastore id of the task list
+        task_id : int
+            datastore id of the task. It must not be in a list.
+        user_id : str
+            user id of the app. Both the task and the list have to be owned
+            by the user.
+    """
+    with engine.transaction():
+        task, task_list = get_task_and_list(task_id, list_id, user_id)
+        if task['task_list'] != {}:
+            raise RequestException({
+                "code": "task_list_not_empty",
+                "description": "The task is already added to a list"
+            }, 403)
+        task['task_list'] = {'id': list_id, 'name': task_list['name']}
+        touch(task)
+        engine.put_multi([task, list_task_entity(task_list.key, task)])
+    invalidate_public_list(list_id)
+
+def remove_list_task(list_id, task_id, user_id):
+    """
+    Remove a task from a list. The task and the list are read with one
+    get_multi, the task's 'task_list' property cleared and the membership
+    entity deleted in one transaction.
+
+    Parameters:
+        list_id : int
+            datastore id of the task list
+        task_id : int
+            datastore id of the task. It must be in the task list.
+        user_id : str
+            user id of the app. Both the task and the list have to be owned
+            by the user.
+    """
+    with engine.transaction():
+        task, task_list = get_task_and_list(task_id, list_id, user_id)
+        if task['task_list'] == {}:
+            raise RequestException({
+                "code": "task_list_empty",
+                "description": "The task is not in any lists."
+            }, 403)
+        if task['task_list']['id'] != list_id:
+            raise RequestException({
+                "code": "list_id_not_matching",
+                "description": "The task is not in the list."
+            }, 403)
+        task['task_list'] = {}
+        touch(task)
+        engine.put(task)
+        engine.delete(list_task_key(task_list.key, task_id))
+    invalidate_public_list(list_id)
+
+
+##############################################################################
+# Due Dates                                                                  #
+##############################################################################
+
+def parse_due_date(task_property):
+    """
+    Replace the 'due_date' string of validated task properties by a UTC
+    datetime, so that tasks are filtered and sorted by date in datastore.
+    """
+    if isinstance(task_property.get('due_date'), str):
+        task_property['due_date'] = datetime.strptime(
+            task_property['due_date'], '%Y-%m-%d').replace(tzinfo=timezone.utc)
+
+def format_task(task):
+    """
+    Replace the 'due_date' datetime of a task by its 'YYYY-MM-DD' string
+    before the task is sent, and return the task.
+    """
+    due_date = task.get('due_date')
+    # Datastore projection queries return datetimes as microseconds.
+    if type(due_date) == int:
+        due_date = datetime.fromtimestamp(due_date / 1e6, timezone.utc)
+    if isinstance(due_date, datetime):
+        task['due_date'] = due_date.date().isoformat()
+    return task
+
+
+##############################################################################
+# Concurrent Reads                                                           #
+##############################################################################
+
+def start_request_deadline():
+    """
+    Start the deadline of the current request's reads, REQUEST_DEADLINE
+    seconds from now. Registered as a before_request hook of the app.
+    """
+    g.deadline = time.monotonic() + REQUEST_DEADLINE
+
+def request_deadline():
+    """
+    Return the time.monotonic() value by which the current request's reads
+    have to finish, or None outside of a request.
+    """
+    if not has_request_context():
+        return None
+    if 'deadline' not in g:
+        start_request_deadline()
+    return g.deadline
+
+def _run_read(call):
+    _in_read_pool.set(True)
+    return call()
+
+def fetch_all(*calls):
+    """
+    Run independent reads at the same time in read_pool, so that they take
+    as long as the slowest of them rather than their sum. Each read runs in
+    a copy of the caller's context, so it sees the request, and its calls
+    are accounted to the request (see models.instrumentation).
+
+    Reads are run one after another if concurrent_reads is False, in a
+    transaction, whose state belongs to the caller's thread, and in a read
+    already run by read_pool, so that the pool never waits on itself.
+
+    If a read fails, or the request's deadline passes, the reads that have
+    not started are cancelled. The reads already running finish in the
+    background and their results are dropped.
+
+    Parameters
+        calls : callable
+            functions without arguments, e.g. lambdas, each making a read.
+    Returns
+        results : list
+            the result of each call, in the order of the calls.
     """
-    query = client.query(kind="lists")
-    query = query.add_filter('name', '=', name)
-    query = query.add_filter('owner', '=', user_id)
-    return list(query.fetch())
+    if len(calls) < 2 or not concurrent_reads or _in_read_pool.get() \
+            or engine.in_transaction():
+        return [call() for call in calls]
+    futures = [read_pool.submit(contextvars.copy_context().run, _run_read,
+                                call)
+               for call in calls]
+    deadline = request_deadline()
+    timeout = None if deadline is None \
+        else max(deadline - time.monotonic(), 0)
+    done, pending = wait(futures, timeout, return_when=FIRST_EXCEPTION)
+    for future in pending:
+        future.cancel()
+    # The error of the first failed call, as if they had run in turn.
+    for future in futures:
+        if future in done and future.exception() is not None:
+            raise future.exception()
+    if pending:
+        raise RequestException({
+            "code": "deadline_exceeded",
+            "description": "The request took too long to read its data."
+        }, 504)
+    return [future.result() for future in futures]
+
+
+##############################################################################
+# Get an Entity                                                              #
+##############################################################################
+
+def user_key(user_id):
+    """
+    Return the datastore key of a user. Users are stored under a named key
+    of their app user id ('sub' value of JWT).
+
+    Parameters:
+        user_id : str
+            user's id of the App. 'sub' value of JWT
+    """
+    return engine.key("users", user_id)
+
+def user_exists(user_id):
+    """
+    Check whether the user id is in datastore. Users found in datastore are
+    remembered for USER_CACHE_TTL seconds.
+
+    Parameters:
+        user_id : str
+            user's id of the App. 'sub' value of JWT
+    Returns:
+        exists : bool
+            True if the user is in datastore.
+    """
+    if user_id in known_users:
+        return True
+    if engine.get(user_key(user_id)) is None:
+        return False
+    known_users.set(user_id, True)
+    return True
+
+def warm_up():
+    """
+    Create the storage engine's client and open its connections, and those
+    of the shared cache, with a get of a user that does not exist. Run when
+    an instance warms up, so that its first request does not pay for them.
+    """
+    engine.get(user_key("_warmup"))
 
 def get_entity_by_id(kind, id):
     """
@@ -145,7 +472,7 @@ def get_entity_by_id(kind, id):
         entity : google.datastore.Entity
             the entity of the id from datastore
     """
-    entity = client.get(client.key(kind, id))
+    entity = engine.get(engine.key(kind, id))
     if entity is None:
         raise RequestException({
             "code": "invalid_id",
@@ -198,8 +525,8 @@ def get_task_list_by_id(task_list_id, user_id=None):
     task_list = get_entity_by_id("lists", task_list_id)
     if user_id != None and task_list["owner"] == user_id:
         return task_list
-    if task_list["public"] == True and \
-        request.endpoint == 'list_api.list_get_by_id':
+    if task_list["public"] == True and request.endpoint in \
+            ('list_api.list_get_by_id', 'list_api.list_tasks_get'):
         return task_list
 
     raise RequestException({
@@ -207,6 +534,73 @@ def get_task_list_by_id(task_list_id, user_id=None):
         "description": "You are not permitted to view/modify the list."
     }, 403)
 
+def get_tasks_by_ids(task_ids, user_id):
+    """
+    Get the tasks of the ids with get_multi calls. Like get_task_by_id,
+    only the user's tasks are returned.
+
+    Parameters
+        task_ids : list
+            datastore ids of the tasks
+        user_id : str
+            user id from the app
+    Returns:
+        tasks : list
+            the user's tasks of the ids, in the order of the ids.
+        missing : list
+            the ids that do not exist or are not the user's tasks.
+    """
+    found = get_entities_by_ids("tasks", task_ids)
+    tasks = []
+    missing = []
+    for task_id in task_ids:
+        task = found.get(task_id)
+        if task is None or task["owner"] != user_id:
+            missing.append(task_id)
+        else:
+            tasks.append(task)
+    return tasks, missing
+
+def get_task_list_with_tasks(list_id, user_id=None, limit=MAX_PAGE_LIMIT):
+    """
+    Get a task list with the checks of get_task_list_by_id, and the first
+    limit tasks of the list with one query of its memberships. The owner of
+    the list gets the tasks themselves with one get_multi; anyone else, as
+    with GET /lists/:list_id/tasks, only gets their 'id' and 'name'.
+
+    Parameters
+        list_id : int
+            datastore id of the task list
+        user_id : str
+            user id from the app. Default is None.
+        limit : int
+            maximum number of tasks. Default is MAX_PAGE_LIMIT.
+    Returns:
+        task_list : google.datastore.Entity
+            the task list
+        tasks : list
+            the tasks of the list in the order of their ids, or their
+            membership entities if the user does not own the list.
+        next_cursor : str
+            cursor of the next page of GET /lists/:list_id/tasks, or None
+            if every task is returned.
+    """
+    # The memberships are read with the list, but only returned if it
+    # passes the checks.
+    task_list, (members, next_cursor) = fetch_all(
+        lambda: get_task_list_by_id(list_id, user_id),
+        lambda: engine.query("list_tasks",
+                             ancestor=engine.key("lists", list_id),
+                             order=['__key__'], limit=limit))
+    if user_id is None or task_list["owner"] != user_id:
+        return task_list, members, next_cursor
+    found = {task.key.id: task for task in engine.get_multi(
+        [engine.key("tasks", member.key.id) for member in members])
+        if task["owner"] == user_id}
+    tasks = [found[member.key.id] for member in members
+             if member.key.id in found]
+    return task_list, tasks, next_cursor
+
 
 ##############################################################################
 # Get a Collection                                                           #
@@ -220,64 +614,301 @@ def get_users():
         query : list
             a list of user entities    
     """
-    query = client.query(kind="users")
-    query = list(query.fetch())
-    return query
+    users, _ = engine.query("users")
+    return users
 
-def get_tasks(offset, user_id):
+def query_page(kind, filters, limit, offset, cursor, ancestor=None,
+               order=(), projection=None):
     """
-    Returns list of tasks of the user_id. The list contains maximum
-    PAGE_LIMIT number of tasks starting the task at offset in datastore.
+    Fetch a page of the entities of the kind in the order, then by their
+    key, so that pages are stable. The page starts at the cursor if it is
+    given, otherwise at the offset.
 
     Parameters
+        kind : str
+            the kind of the entities
+        filters : list
+            (property, operator, value) tuples
+        limit : int
+            maximum number of entities in the page
         offset : int
-            position of a task in datastore
+            number of entities to skip. Ignored if cursor is given.
+        cursor : str
+            opaque cursor from the previous page.
+        ancestor : google.datastore.Key
+            only fetch descendants of the key. Default is None.
+        order : list
+            property names to sort by before the key. Default is ().
+        projection : list
+            only fetch these properties, or only the keys if it is empty.
+            Default is None, i.e. whole entities.
+    Returns:
+        entities : list
+            list of entities of the page
+        next_cursor : str
+            cursor of the next page. None if this is the last page.
+    """
+    try:
+        return engine.query(kind, filters=filters, ancestor=ancestor,
+                            order=list(order) + ['__key__'], limit=limit,
+                            offset=offset, cursor=cursor,
+                            keys_only=projection == [],
+                            projection=projection or ())
+    except InvalidCursor:
+        raise BadRequest({
+            "code": "invalid_cursor",
+            "description": "Cannot parse the cursor value."
+        }, 400)
+
+def get_tasks(user_id, limit=PAGE_LIMIT, offset=0, cursor=None,
+              include_total=True, completed=None, due_after=None,
+              due_before=None, list_id=None, sort=None, fields=None):
+    """
+    Returns a page of tasks of the user_id. The page contains maximum
+    limit number of tasks starting at the cursor, or at the offset if
+    there is no cursor. Tasks can be filtered and sorted; every combination
+    is served by an index of composite_indexes().
+
+    Parameters
         user_id : str
             user id of the app.
+        limit : int
+            maximum number of tasks in the page
+        offset : int
+            position of a task in datastore
+        cursor : str
+            opaque cursor from the previous page.
+        include_total : bool
+            count the tasks if True. Default is True.
+        completed : bool
+            only return tasks of this 'completed' value. Default is None.
+        due_after : datetime
+            only return tasks due on or after this date. Default is None.
+        due_before : datetime
+            only return tasks due on or before this date. Default is None.
+        list_id : int
+            only return tasks of this task list. Default is None.
+        sort : str
+            'due_date' or 'name'. Default is None, i.e. by key. Tasks
+            filtered by due date are sorted by due date.
+        fields : list
+            the properties the caller needs. Default is None, i.e. all of
+            them. Sorted queries of TASK_PROJECTION properties only fetch
+            those with a projection query; the tasks may have more.
     Returns:
         query : list
             list of task entities from datastore
         total: int
-            the total number of tasks in datastore        
+            the number of the tasks matching the filters. None if
+            include_total is False.
+        next_cursor : str
+            cursor of the next page. None if this is the last page.
     """
-    query = client.query(kind="tasks")
-    query = query.add_filter('owner', '=', user_id)
-    total = len(list(query.fetch()))
-    query = query.fetch(limit=PAGE_LIMIT, offset=offset)
-    return list(query), total
+    filters = [('owner', '=', user_id)]
+    if completed is not None:
+        filters.append(('completed', '=', completed))
+    if list_id is not None:
+        filters.append(('task_list.id', '=', list_id))
+    if due_after is not None:
+        filters.append(('due_date', '>=', due_after))
+    if due_before is not None:
+        filters.append(('due_date', '<=', due_before))
+    if due_after is not None or due_before is not None:
+        # Datastore sorts by the property of an inequality filter first.
+        if sort not in (None, 'due_date'):
+            raise BadRequest({
+                "code": "invalid_sort",
+                "description": "Tasks filtered by due date are sorted by "
+                               "due_date."
+            }, 400)
+        sort = 'due_date'
+    order = [sort] if sort else []
+    projection = None
+    if sort and fields is not None and \
+            set(fields) <= set(TASK_PROJECTION) | {'id', 'self'}:
+        # Datastore cannot project a property of an equality filter, its
+        # value is set from the filter instead.
+        equal = {name: value for name, op, value in filters if op == '='}
+        projection = [p for p in TASK_PROJECTION
+                      if p in fields and p not in equal]
+        # The order of the projection's index: see composite_indexes().
+        order += [p for p in TASK_PROJECTION
+                  if p != sort and p not in equal]
+    (tasks, next_cursor), total = fetch_all(
+        lambda: query_page("tasks", filters, limit, offset, cursor,
+                           order=order, projection=projection),
+        lambda: engine.count("tasks", filters) if include_total else None)
+    if projection is not None:
+        for task in tasks:
+            task.update({p: equal[p] for p in fields if p in equal})
+    return tasks, total, next_cursor
     
-def get_task_lists(offset, user_id=None):
+def get_task_lists(user_id=None, limit=PAGE_LIMIT, offset=0, cursor=None,
+                   include_total=True):
     """
-    Returns list of task lists of the user_id. The returned list contains
-    maximum PAGE_LIMIT number of lists starting the list at offset
-    in datastore. If user_id is None, returns a collection of public task
-    lists.
+    Returns a page of task lists of the user_id. The page contains maximum
+    limit number of lists starting at the cursor, or at the offset if
+    there is no cursor. If user_id is None, returns a collection of public
+    task lists.
 
     Parameters
-        offset : int
-            position of a task list in datastore
         user_id : str
             user id of the app. Default is None.
+        limit : int
+            maximum number of task lists in the page
+        offset : int
+            position of a task list in datastore
+        cursor : str
+            opaque cursor from the previous page.
+        include_total : bool
+            count the task lists if True. Default is True.
     Returns:
         query : list
             list of task list entities from datastore
         total: int
-            the total number of task lists in datastore        
+            the total number of task lists in datastore. None if include_total
+            is False.
+        next_cursor : str
+            cursor of the next page. None if this is the last page.
     """
-    query = client.query(kind="lists")
     if user_id is None:
-        query = query.add_filter('public', '=', True)
+        filters = [('public', '=', True)]
     else:
-        query = query.add_filter('owner', "=", user_id)     
-    total = len(list(query.fetch()))
-    query = query.fetch(limit=PAGE_LIMIT, offset=offset)
-    return list(query), total
+        filters = [('owner', '=', user_id)]
+    (task_lists, next_cursor), total = fetch_all(
+        lambda: query_page("lists", filters, limit, offset, cursor),
+        lambda: engine.count("lists", filters) if include_total else None)
+    return task_lists, total, next_cursor
+
+def get_list_tasks(list_id, user_id=None, limit=PAGE_LIMIT, offset=0,
+                   cursor=None, include_total=True):
+    """
+    Returns a page of the members of a task list with an ancestor query of
+    its 'list_tasks' entities. The list has to be owned by the user or be
+    public.
+
+    Parameters
+        list_id : int
+            datastore id of the task list
+        user_id : str
+            user id of the app. Default is None.
+        limit : int
+            maximum number of tasks in the page
+        offset : int
+            position of a task in the list
+        cursor : str
+            opaque cursor from the previous page.
+        include_total : bool
+            count the tasks of the list if True. Default is True.
+    Returns:
+        query : list
+            list of membership entities with the 'id' and 'name' of a task
+        total: int
+            the number of tasks in the list. None if include_total is False.
+        next_cursor : str
+            cursor of the next page. None if this is the last page.
+    """
+    list_key = engine.key("lists", list_id)
+    # The page is read with the list, but only returned if it passes the
+    # checks.
+    _, (tasks, next_cursor), total = fetch_all(
+        lambda: get_task_list_by_id(list_id, user_id),
+        lambda: query_page("list_tasks", [], limit, offset, cursor,
+                           ancestor=list_key),
+        lambda: engine.count("list_tasks", ancestor=list_key)
+        if include_total else None)
+    return tasks, total, next_cursor
+
+def iter_entities(kind, filters=(), batch_size=EXPORT_BATCH_SIZE):
+    """
+    Yield every entity of the kind matching the filters. Entities are
+    fetched by cursor queries of batch_size entities, so at most one batch
+    is held in memory.
+
+    Parameters
+        kind : str
+            the kind of the entities
+        filters : list
+            (property, operator, value) tuples
+        batch_size : int
+            number of entities fetched by each query
+    """
+    cursor = None
+    while True:
+        entities, cursor = engine.query(kind, filters=filters,
+                                        order=['__key__'], limit=batch_size,
+                                        cursor=cursor)
+        yield from entities
+        if cursor is None:
+            return
+
+def export_user_data(user_id):
+    """
+    Yield (kind, entity) pairs of every task list, then every task, of the
+    user. See iter_entities.
+
+    Parameters
+        user_id : str
+            user id of the app.
+    """
+    for kind in ("lists", "tasks"):
+        for entity in iter_entities(kind, [('owner', '=', user_id)]):
+            yield kind, entity
 
 
 ##############################################################################
 # Update an Entity                                                           #
 ##############################################################################
-def update_task(task_id, task_property, user_id):
+def next_timestamp():
+    """
+    Return the current UTC time, or a microsecond after the last returned
+    timestamp if the clock has not moved, so that stamps of this process
+    are strictly increasing.
+    """
+    global _last_timestamp
+    with _clock_lock:
+        _last_timestamp = max(datetime.now(timezone.utc),
+                              _last_timestamp + timedelta(microseconds=1))
+        return _last_timestamp
+
+def touch(entity):
+    """
+    Increment the 'version' of a task or a task list and stamp its
+    'updated_at' before it is written. The version is the entity's ETag
+    (see helper.conditional), and updated_at is read by get_changes.
+    Entities created before versions start at version 0.
+    """
+    entity['version'] = entity.get('version', 0) + 1
+    entity['updated_at'] = next_timestamp()
+
+def touch_new(entity):
+    """
+    Start a new task or task list at version 1 and stamp its 'updated_at'.
+    Any 'version' or 'updated_at' sent by the client is overwritten, so that
+    clients cannot forge ETags.
+    """
+    entity['version'] = 1
+    entity['updated_at'] = next_timestamp()
+
+def check_version(entity, if_match):
+    """
+    Raise RequestException if the If-Match header of the request does not
+    match the entity's ETag, i.e. the entity has changed since the client
+    read it.
+
+    Parameters:
+        entity : google.datastore.Entity
+            a task or a task list
+        if_match : werkzeug.datastructures.ETags
+            the If-Match header. Empty or None if there is none.
+    """
+    if if_match and not if_match.contains(entity_etag(entity)):
+        raise RequestException({
+            "code": "precondition_failed",
+            "description": "The entity has been modified since it was read."
+        }, 412)
+
+def update_task(task_id, task_property, user_id, if_match=None):
     """
     Update a task entity from datastore. If the request method is PUT,
     it checks whether the task_property contains all the required properties.
@@ -289,6 +920,9 @@ def update_task(task_id, task_property, user_id):
             key-value pairs of the new property values of the task
         user_id : str
             the user's id from the app
+        if_match : werkzeug.datastructures.ETags
+            the If-Match header. The update is rejected with 412 if it does
+            not match the task's ETag. Default is None.
     Returns:
         task : google.datastore.Entity
             the updated task Entity object from datastore.
@@ -296,14 +930,24 @@ def update_task(task_id, task_property, user_id):
     if request.method == 'PUT':
         validate_required("tasks", task_property)
     validate_task_property(task_property)
-    task = get_task_by_id(task_id, user_id)
-    for p in TASK_REQUIRED_PROPERTIES + ['completed']:
-        if p in task_property:
-            task[p] = task_property[p]
-    client.put(task)
+    parse_due_date(task_property)
+    with engine.transaction():
+        task = get_task_by_id(task_id, user_id)
+        check_version(task, if_match)
+        for p in TASK_REQUIRED_PROPERTIES + ['completed']:
+            if p in task_property:
+                task[p] = task_property[p]
+        touch(task)
+        engine.put(task)
+        # Keep the name of the task's membership up to date.
+        if task['task_list'] != {} and 'name' in task_property:
+            list_key = engine.key("lists", task['task_list']['id'])
+            engine.put(list_task_entity(list_key, task))
+    if task['task_list'] != {}:
+        invalidate_public_list(task['task_list']['id'])
     return task
 
-def update_task_list(list_id, task_list_property, user_id):
+def update_task_list(list_id, task_list_property, user_id, if_match=None):
     """
     Update a task list entity from datastore. If the request method is PUT,
     it checks whether the task_list property contains all the required
@@ -316,6 +960,9 @@ def update_task_list(list_id, task_list_property, user_id):
             key-value pairs of the new property values of the task list
         user_id : str
             the user's id from the app
+        if_match : werkzeug.datastructures.ETags
+            the If-Match header. The update is rejected with 412 if it does
+            not match the list's ETag. Default is None.
     Returns:
         task : google.datastore.Entity
             the updated task list Entity object from datastore.
@@ -323,81 +970,1087 @@ def update_task_list(list_id, task_list_property, user_id):
     if request.method == 'PUT':
         validate_required("lists", task_list_property)
     validate_task_list_property(task_list_property)
-    task_list = get_task_list_by_id(list_id, user_id)
-
-    # Check duplicate name
-    if 'name' in task_list_property:
-        name = task_list_property["name"]
-        user_id = task_list["owner"]
-        result = get_list_same_name(name, user_id)
-        if len(result) > 0 and result[0].key.id != list_id:
-            raise RequestException({
-                "code": "list_name_not_unique",
-                "description": "You already have a list with the same name."
-            }, 403)
+    with engine.transaction():
+        task_list = get_task_list_by_id(list_id, user_id)
+        check_version(task_list, if_match)
 
-    for p in LIST_REQUIRED_PROPERTIES:
-        if p in task_list_property:
-            task_list[p] = task_list_property[p]
-    client.put(task_list)
-    return task_list
-            
-def update_entity_rel(entity):
-    """
-    Takes an entity and update it to datastore. Helper function for the
-    relationship routes of task and task_list.
+        # Move the name claim when the list is renamed.
+        if 'name' in task_list_property and \
+                task_list_property["name"] != task_list["name"]:
+            claim_list_name(task_list["owner"], task_list_property["name"])
+            release_list_name(task_list["owner"], task_list["name"])
 
-    Parameters
-         entity : google.datastore.Entity
-            an entity from datastore. It can be either a task or a (task) list
-            entity.
-    """
-    client.put(entity)
+        was_public = task_list["public"]
+        for p in LIST_REQUIRED_PROPERTIES:
+            if p in task_list_property:
+                task_list[p] = task_list_property[p]
+        touch(task_list)
+        engine.put(task_list)
+    if was_public or task_list["public"]:
+        invalidate_public_list(list_id, feed=True)
+    return task_list
 
 
 ##############################################################################
 # Delete an Entity                                                           #
 ##############################################################################
 
-def delete_task(task_id, user_id):
+def delete_task(task_id, user_id, if_match=None):
     """
-    Delete a task entity from datastore. If there's a list related to the
-    task, it removes the list's infomation from the list's tasks property
-    before the task entity is deleted.
+    Delete a task entity from datastore. If the task is in a list, its
+    membership entity is deleted with it.
 
     Parameters:
         task_id : int
             the datastore id of the task
         user_id : str
             the user's id of the app.
+        if_match : werkzeug.datastructures.ETags
+            the If-Match header. Default is None.
     """
-    task = get_task_by_id(task_id, user_id)
-    # Remove this task from the task list.
+    with engine.transaction():
+        task = get_task_by_id(task_id, user_id)
+        check_version(task, if_match)
+        keys = [task.key]
+        # Remove this task from the task list.
+        if task['task_list'] != {}:
+            list_key = engine.key("lists", task['task_list']['id'])
+            keys.append(list_task_key(list_key, task_id))
+        engine.delete_multi(keys)
+        engine.put(tombstone(task.key, user_id))
     if task['task_list'] != {}:
-        list_id = task['task_list']['id']
-        task_list = get_task_list_by_id(list_id, user_id)
-        for t in task_list['tasks']:
-            if t['id'] == task_id:
-                task_list['tasks'].remove(t)
-                break
-        client.put(task_list)
-    client.delete(client.key("tasks", task_id))
+        invalidate_public_list(task['task_list']['id'])
 
-def delete_task_list(list_id, user_id):
+def delete_task_list(list_id, user_id, if_match=None):
     """
-    Delete the task list from datastore. Any tasks related to the list will
-    be deleted from datastore.
+    Delete the task list from datastore. Any tasks related to the list are
+    deleted in the same transaction. If the list has more than
+    ASYNC_DELETE_THRESHOLD tasks, the list is deleted right away and its
+    tasks are deleted by a background job.
 
     Parameters:
         list_id : int
             the datastore id of the task list
         user_id : str
             the user's id of the app
+        if_match : werkzeug.datastructures.ETags
+            the If-Match header. Default is None.
+    Returns:
+        job : google.datastore.Entity
+            the job deleting the tasks, or None if everything is deleted.
+    """
+    # The version is checked in the transaction deleting the list, so that
+    # a concurrent update either fails the check or is deleted with it.
+    # ASYNC_DELETE_THRESHOLD keeps the deletes and tombstones of the tasks
+    # within a single commit.
+    job = None
+    with engine.transaction():
+        task_list = get_task_list_by_id(list_id, user_id)
+        check_version(task_list, if_match)
+        member_keys, _ = engine.query("list_tasks", ancestor=task_list.key,
+                                      keys_only=True)
+        # Each task is deleted together with its membership.
+        task_keys = []
+        for member in member_keys:
+            task_keys += [engine.key("tasks", member.key.id), member.key]
+        list_keys = [task_list.key,
+                     list_name_key(task_list["owner"], task_list["name"])]
+        if len(member_keys) > ASYNC_DELETE_THRESHOLD:
+            job = add_job("delete_list_tasks", user_id, len(member_keys),
+                          {'list_id': list_id})
+            engine.delete_multi(list_keys)
+            engine.put(tombstone(task_list.key, user_id))
+        else:
+            engine.delete_multi(task_keys + list_keys)
+            put_tombstones(task_keys + list_keys, user_id)
+    if job is not None:
+        background.submit(run_job, job.key.id, delete_keys, task_keys)
+    if task_list["public"]:
+        invalidate_public_list(list_id, feed=True)
+    return job
+
+
+##############################################################################
+# Sync                                                                       #
+##############################################################################
+
+# Kinds returned by get_changes. Tombstones record deleted tasks and lists.
+SYNC_KINDS = ("tasks", "lists", "tombstones")
+
+def tombstone(key, user_id):
+    """
+    Return the tombstone of a deleted task or task list. Tombstones are
+    keyed by the kind and id of the deleted entity and are returned by
+    get_changes like the changed entities.
+
+    Parameters:
+        key : google.datastore.Key
+            the key of the deleted task or task list
+        user_id : str
+            the owner of the deleted entity
+    """
+    entity = engine.entity(engine.key("tombstones", f"{key.kind}:{key.id}"))
+    entity.update({'owner': user_id, 'kind': key.kind, 'id': key.id,
+                   'updated_at': next_timestamp()})
+    return entity
+
+def put_tombstones(keys, user_id):
+    """
+    Put the tombstones of the tasks and task lists among the deleted keys.
+    Other keys, e.g. memberships and name claims, are skipped.
+    """
+    tombstones = [tombstone(key, user_id) for key in keys
+                  if key.kind in ("tasks", "lists")]
+    if tombstones:
+        engine.put_multi(tombstones)
+
+def encode_sync_token(timestamp):
+    """
+    Return the opaque sync token of a timestamp.
+    """
+    return base64.urlsafe_b64encode(timestamp.isoformat().encode()).decode()
+
+def decode_sync_token(token):
+    """
+    Return the timestamp of a sync token made by encode_sync_token. Raise
+    BadRequest if the token cannot be parsed.
+    """
+    try:
+        timestamp = datetime.fromisoformat(
+            base64.urlsafe_b64decode(token.encode()).decode())
+    except (ValueError, binascii.Error):
+        timestamp = None
+    if timestamp is None or timestamp.tzinfo is None:
+        raise BadRequest({
+            "code": "invalid_since",
+            "description": "Cannot parse the since value."
+        }, 400)
+    return timestamp
+
+def get_changes(user_id, since=None, limit=SYNC_PAGE_LIMIT):
+    """
+    Return the tasks and task lists of the user changed, and the tombstones
+    of those deleted, after the sync token. Each kind is read with one
+    query ordered by 'updated_at', so a sync costs a few reads however many
+    entities the user has. Without a token, every task and list is returned
+    and tombstones are skipped.
+
+    Writes are stamped before they are committed, so the returned token
+    stays SYNC_SETTLE_TIME seconds behind the clock. Entities changed within
+    that time are returned by the next sync, and also by a sync without a
+    token, so that a new client sees them at once.
+
+    Stamps are only unique within a process, so a full page is cut before
+    the entities sharing its last stamp, which are returned by the next
+    sync. A page whose entities all share one stamp gets every entity of
+    that stamp.
+
+    Parameters:
+        user_id : str
+            the user's id of the app.
+        since : str
+            sync token of the previous sync. Default is None.
+        limit : int
+            maximum number of entities of each kind.
+    Returns:
+        changes : dict
+            kind -> list of changed entities, for the kinds of SYNC_KINDS.
+        token : str
+            sync token of the next sync.
+        more : bool
+            True if there are more changes after the token.
+    """
+    now = datetime.now(timezone.utc)
+    filters = [('owner', '=', user_id)]
+    kinds = SYNC_KINDS
+    if since is None:
+        kinds = tuple(kind for kind in SYNC_KINDS if kind != "tombstones")
+    else:
+        since = decode_sync_token(since)
+        # Tombstones are pruned after SYNC_TOMBSTONE_DAYS, so older tokens
+        # could miss deletions.
+        if since < now - timedelta(days=SYNC_TOMBSTONE_DAYS):
+            raise RequestException({
+                "code": "sync_token_expired",
+                "description": "The sync token has expired. Sync again "
+                               "without a token."
+            }, 410)
+        filters.append(('updated_at', '>', since))
+
+    pages = fetch_all(*[
+        lambda kind=kind: engine.query(kind, filters=filters,
+                                       order=['updated_at'], limit=limit)
+        for kind in kinds])
+    changes = {kind: entities for kind, (entities, _) in zip(kinds, pages)}
+    settled = now - timedelta(seconds=SYNC_SETTLE_TIME)
+    until = None
+    for kind in kinds:
+        # A full page may have more changes after its last one.
+        if len(changes[kind]) < limit:
+            continue
+        last = changes[kind][-1]['updated_at']
+        earlier = [entity['updated_at'] for entity in changes[kind]
+                   if entity['updated_at'] < last]
+        if earlier:
+            last = earlier[-1]
+        else:
+            changes[kind], _ = engine.query(
+                kind, filters=[('owner', '=', user_id),
+                               ('updated_at', '=', last)])
+        until = last if until is None else min(until, last)
+
+    # The cut of the full pages, None if every page has all of its changes.
+    cut = until
+    # Changes after the settle time are not final: the next sync gets them.
+    more = until is not None and until < settled
+    if until is None or until > settled:
+        until = min(max((entity['updated_at'] for kind in kinds
+                         for entity in changes[kind]), default=settled),
+                    settled)
+    if since is not None:
+        until = max(until, since)
+        cut = until
+    else:
+        # The first sync returns the changes within the settle time too, so
+        # that a new client sees its data at once. The token stays behind
+        # them, and the next sync returns them again.
+        more = cut is not None
+    if cut is not None:
+        for kind in kinds:
+            changes[kind] = [entity for entity in changes[kind]
+                             if entity['updated_at'] <= cut]
+    return changes, encode_sync_token(until), more
+
+
+##############################################################################
+# Jobs                                                                       #
+##############################################################################
+
+def add_job(job_type, user_id, total, target):
+    """
+    Add a pending job entity to datastore. Clients poll it with GET /jobs/:id.
+
+    Parameters:
+        job_type : str
+            what the job does, e.g. 'delete_list_tasks'
+        user_id : str
+            the user's id of the app. Only the user can view the job.
+        total : int
+            the number of items the job processes
+        target : dict
+            the entity the job works on
+    """
+    now = datetime.now(timezone.utc)
+    return add_entity("jobs", {
+        'type': job_type,
+        'owner': user_id,
+        'status': 'pending',
+        'target': target,
+        'total': total,
+        'processed': 0,
+        'created_at': now,
+        'updated_at': now
+    })
+
+def get_job_by_id(job_id, user_id):
+    """
+    Get a job entity by job_id. Raise RequestException when the job id is
+    invalid or the owner of the job does not match with the user_id.
+    """
+    job = get_entity_by_id("jobs", job_id)
+    if job["owner"] != user_id:
+        raise RequestException({
+            "code": "forbidden",
+            "description": "You are not permitted to view the job."
+        }, 403)
+    return job
+
+def run_job(job_id, func, *args):
+    """
+    Run func(job, *args) on a background worker and record the job's status:
+    'running' while it runs, then 'done' or 'failed'.
+    """
+    job = engine.get(engine.key("jobs", job_id))
+    job['status'] = 'running'
+    job['updated_at'] = datetime.now(timezone.utc)
+    engine.put(job)
+    try:
+        func(job, *args)
+        job['status'] = 'done'
+    except Exception as err:
+        logger.exception("Job %s failed", job_id)
+        job['status'] = 'failed'
+        job['error'] = str(err)
+    job['updated_at'] = datetime.now(timezone.utc)
+    engine.put(job)
+
+def delete_keys(job, keys):
+    """
+    Job function deleting the keys with chunked delete_multi calls. The job's
+    progress is saved after every chunk and counts the deleted tasks, not
+    their memberships.
+    """
+    for chunk in chunked(keys):
+        engine.delete_multi(chunk)
+        put_tombstones(chunk, job['owner'])
+        job['processed'] += sum(1 for key in chunk if key.kind == "tasks")
+        job['updated_at'] = datetime.now(timezone.utc)
+        engine.put(job)
+
+
+##############################################################################
+# Batch Operations                                                           #
+##############################################################################
+
+def chunked(items, size=DATASTORE_BATCH_LIMIT):
+    """
+    Split a list into lists of at most size items, so that each chunk fits
+    in a single datastore batch call.
+    """
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+def iter_chunks(items, size=DATASTORE_BATCH_LIMIT):
+    """
+    Split an iterable into lists of at most size items as it is consumed,
+    e.g. to write the entities of iter_entities in bounded batches.
+    """
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def get_entities_by_ids(kind, ids):
+    """
+    Get entities of the kind by their datastore ids with get_multi calls.
+
+    Parameters
+        kind : str
+            the 'kind' key of datastore
+        ids : list
+            the datastore ids of the entities
+    Returns
+        entities : dict
+            the datastore id -> entity of the ids that exist.
+    """
+    entities = {}
+    for chunk in chunked(list(dict.fromkeys(ids))):
+        for entity in engine.get_multi([engine.key(kind, id) for id in chunk]):
+            entities[entity.key.id] = entity
+    return entities
+
+def _error_result(code, description, status_code, **ref):
+    """
+    Result of a failed item of a bulk request. ref identifies the item,
+    e.g. index=3 or id=1234.
+    """
+    return dict(ref, status=status_code,
+                error={"code": code, "description": description})
+
+def batch_tasks(operations, user_id):
+    """
+    Create, update and delete tasks of the user in one request. Each
+    operation is validated like its single-task route, and the tasks are
+    read with get_multi and written with put_multi/delete_multi in chunks
+    of DATASTORE_BATCH_LIMIT. Operations are applied in order, so an
+    operation sees the result of the previous operations of the batch.
+
+    Parameters:
+        operations : list
+            dicts of 'op' ('create', 'update' or 'delete'), 'id' of the task
+            for update and delete, and 'task' properties for create and
+            update.
+        user_id : str
+            the user's id of the app.
+    Returns:
+        results : list
+            one dict per operation with its 'index', HTTP-like 'status', and
+            the 'task' entity or an 'error'.
+    """
+    if not isinstance(operations, list) or len(operations) == 0:
+        raise BadRequest({
+            "code": "invalid_operations",
+            "description": "'operations' must be a non-empty list."
+        }, 400)
+    if len(operations) > MAX_BATCH_OPERATIONS:
+        raise BadRequest({
+            "code": "too_many_operations",
+            "description": f"A batch cannot exceed {MAX_BATCH_OPERATIONS} operations."
+        }, 400)
+
+    ids = [op.get('id') for op in operations
+           if isinstance(op, dict) and type(op.get('id')) == int]
+    # The tasks are written back from these copies, so they are read from
+    # the engine rather than from possibly stale cache entries.
+    with uncached_reads():
+        tasks = get_entities_by_ids("tasks", ids)
+    results = []
+    written = {}
+    deleted = {}
+    renamed = set()
+    for index, op in enumerate(operations):
+        if not isinstance(op, dict) or \
+                op.get('op') not in ('create', 'update', 'delete'):
+            results.append(_error_result(
+                "invalid_operation",
+                "'op' must be one of create, update and delete.", 400,
+                index=index))
+            continue
+        task_property = op.get('task', {})
+        try:
+            if op['op'] != 'create' and type(op.get('id')) != int:
+                raise BadRequest({
+                    "code": "invalid_id",
+                    "description": "'id' must be the id of a task."
+                }, 400)
+            if op['op'] != 'delete':
+                if not isinstance(task_property, dict):
+                    raise BadRequest({
+                        "code": "invalid_task",
+                        "description": "'task' must be an object."
+                    }, 400)
+                if op['op'] == 'create':
+                    validate_required("tasks", task_property)
+                validate_task_property(task_property)
+                parse_due_date(task_property)
+        except BadRequest as err:
+            results.append({"index": index, "status": err.status_code,
+                            "error": err.error})
+            continue
+
+        if op['op'] == 'create':
+            task = engine.entity(engine.key("tasks"))
+            task.update(task_property)
+            task.update({'owner': user_id, 'completed': False,
+                         'task_list': {}})
+            touch_new(task)
+            written[id(task)] = task
+            results.append({"index": index, "status": 201, "task": task})
+            continue
+
+        task = tasks.get(op.get('id'))
+        if task is None:
+            results.append(_error_result(
+                "invalid_id", "The id does not exist.", 404, index=index))
+            continue
+        if task["owner"] != user_id:
+            results.append(_error_result(
+                "forbidden", "You are not permitted to view/modify the task.",
+                403, index=index))
+            continue
+        if op['op'] == 'update':
+            for p in TASK_REQUIRED_PROPERTIES + ['completed']:
+                if p in task_property:
+                    task[p] = task_property[p]
+            if id(task) not in written:
+                touch(task)
+            written[id(task)] = task
+            if 'name' in task_property:
+                renamed.add(id(task))
+            results.append({"index": index, "status": 200, "task": task})
+        else:
+            del tasks[task.key.id]
+            written.pop(id(task), None)
+            deleted[task.key.id] = task
+            results.append({"index": index, "status": 204})
+
+    # Remove the deleted tasks from their task lists.
+    deleted_keys = []
+    list_ids = set()
+    for task in deleted.values():
+        deleted_keys.append(task.key)
+        if task['task_list'] != {}:
+            list_ids.add(task['task_list']['id'])
+            list_key = engine.key("lists", task['task_list']['id'])
+            deleted_keys.append(list_task_key(list_key, task.key.id))
+
+    # Keep the names of the memberships of the updated tasks up to date.
+    members = []
+    for task in written.values():
+        if task['task_list'] == {}:
+            continue
+        list_ids.add(task['task_list']['id'])
+        if id(task) in renamed:
+            list_key = engine.key("lists", task['task_list']['id'])
+            members.append(list_task_entity(list_key, task))
+
+    for chunk in chunked(list(written.values()) + members):
+        engine.put_multi(chunk)
+    for chunk in chunked(deleted_keys):
+        engine.delete_multi(chunk)
+        put_tombstones(chunk, user_id)
+    for list_id in list_ids:
+        invalidate_public_list(list_id)
+    return results
+
+
+def _validate_task_ids(task_ids):
+    if not isinstance(task_ids, list) or len(task_ids) == 0 or \
+            not all(type(id) == int for id in task_ids):
+        raise BadRequest({
+            "code": "invalid_task_ids",
+            "description": "'task_ids' must be a non-empty list of task ids."
+        }, 400)
+    if len(task_ids) > MAX_LIST_TASK_IDS:
+        raise BadRequest({
+            "code": "too_many_task_ids",
+            "description": f"A request cannot exceed {MAX_LIST_TASK_IDS} task ids."
+        }, 400)
+    return list(dict.fromkeys(task_ids))
+
+def _task_result(task_id, tasks, user_id):
+    """
+    Return the error result of a task that cannot be moved, or None.
+    """
+    task = tasks.get(task_id)
+    if task is None:
+        return _error_result("invalid_id", "The id does not exist.", 404,
+                             id=task_id)
+    if task["owner"] != user_id:
+        return _error_result("forbidden",
+                             "You are not permitted to view/modify the task.",
+                             403, id=task_id)
+    return None
+
+def add_tasks_to_list(list_id, task_ids, user_id):
+    """
+    Add tasks to a list. The tasks are read with one get_multi and written
+    with their memberships in one transactional put_multi. Tasks that are missing,
+    not owned by the user or already in a list are reported and skipped.
+
+    Parameters:
+        list_id : int
+            the datastore id of the task list
+        task_ids : list
+            the datastore ids of the tasks
+        user_id : str
+            the user's id of the app.
+    Returns:
+        results : list
+            one dict per task id with its 'id', HTTP-like 'status' and an
+            'error' if the task was not added.
+    """
+    task_ids = _validate_task_ids(task_ids)
+    results = []
+    with engine.transaction():
+        task_list = get_task_list_by_id(list_id, user_id)
+        tasks = get_entities_by_ids("tasks", task_ids)
+        updated = []
+        for task_id in task_ids:
+            result = _task_result(task_id, tasks, user_id)
+            if result is None and tasks[task_id]['task_list'] != {}:
+                result = _error_result("task_list_not_empty",
+                                       "The task is already added to a list",
+                                       403, id=task_id)
+            if result is not None:
+                results.append(result)
+                continue
+            task = tasks[task_id]
+            task['task_list'] = {'id': list_id, 'name': task_list['name']}
+            touch(task)
+            updated += [task, list_task_entity(task_list.key, task)]
+            results.append({"id": task_id, "status": 204})
+        if updated:
+            engine.put_multi(updated)
+    if updated:
+        invalidate_public_list(list_id)
+    return results
+
+def remove_tasks_from_list(list_id, task_ids, user_id):
+    """
+    Remove tasks from a list. The tasks are read with one get_multi, written
+    with one put_multi and their memberships deleted with one delete_multi
+    in a transaction. Tasks that are
+    missing, not owned by the user or not in the list are reported and
+    skipped.
+
+    Parameters:
+        list_id : int
+            the datastore id of the task list
+        task_ids : list
+            the datastore ids of the tasks
+        user_id : str
+            the user's id of the app.
+    Returns:
+        results : list
+            one dict per task id with its 'id', HTTP-like 'status' and an
+            'error' if the task was not removed.
+    """
+    task_ids = _validate_task_ids(task_ids)
+    results = []
+    with engine.transaction():
+        task_list = get_task_list_by_id(list_id, user_id)
+        tasks = get_entities_by_ids("tasks", task_ids)
+        updated = []
+        for task_id in task_ids:
+            result = _task_result(task_id, tasks, user_id)
+            if result is None and tasks[task_id]['task_list'] == {}:
+                result = _error_result("task_list_empty",
+                                       "The task is not in any lists.", 403,
+                                       id=task_id)
+            elif result is None and \
+                    tasks[task_id]['task_list']['id'] != list_id:
+                result = _error_result("list_id_not_matching",
+                                       "The task is not in the list.", 403,
+                                       id=task_id)
+            if result is not None:
+                results.append(result)
+                continue
+            task = tasks[task_id]
+            task['task_list'] = {}
+            touch(task)
+            updated.append(task)
+            results.append({"id": task_id, "status": 204})
+        if updated:
+            engine.put_multi(updated)
+            engine.delete_multi([list_task_key(task_list.key, task.key.id)
+                                 for task in updated])
+    if updated:
+        invalidate_public_list(list_id)
+    return results
+
+
+##############################################################################
+# Import                                                                     #
+##############################################################################
+
+def _import_lists(pending, user_id, imported_lists, errors):
+    """
+    Write a batch of imported lists with their name claims in one
+    transaction. Lists whose name is taken, by an existing list or an
+    earlier list of the import, are rejected.
+
+    Parameters:
+        pending : list
+            (line number, source id, properties) of the lists
+        user_id : str
+            the user's id of the app.
+        imported_lists : dict
+            source id -> written list entity, or None if it was rejected.
+            Updated in place.
+        errors : list
+            error results of rejected lines. Updated in place.
+    Returns:
+        inserted : int
+            the number of lists written.
+    """
+    with engine.transaction():
+        claimed = {claim.key.flat_path for claim in engine.get_multi(
+            [list_name_key(user_id, props['name']) for _, _, props in pending])}
+        written = {}
+        claims = []
+        for line, source_id, props in pending:
+            key = list_name_key(user_id, props['name'])
+            if key.flat_path in claimed:
+                errors.append(_error_result(
+                    "list_name_not_unique",
+                    "You already have a list with the same name.", 403,
+                    line=line))
+                imported_lists[source_id] = None
+                continue
+            claimed.add(key.flat_path)
+            claim = engine.entity(key)
+            claim.update({'owner': user_id, 'name': props['name']})
+            claims.append(claim)
+            task_list = engine.entity(engine.key("lists"))
+            task_list.update(props)
+            written[line] = (source_id, task_list)
+        engine.put_multi(claims + [task_list for _, task_list
+                                   in written.values()])
+    for source_id, task_list in written.values():
+        if source_id is not None:
+            imported_lists[source_id] = task_list
+    if any(task_list['public'] for _, task_list in written.values()):
+        public_cache.invalidate("lists")
+    return len(written)
+
+def _import_tasks(pending, user_id, imported_lists, errors):
+    """
+    Write a batch of imported tasks with chunked put_multi calls, then the
+    memberships of the tasks in a list. Lists referenced by the tasks are
+    resolved from the lists of the import, then from the user's existing
+    lists with one get_multi.
+
+    Parameters:
+        pending : list
+            (line number, source list id or None, properties) of the tasks
+        user_id : str
+            the user's id of the app.
+        imported_lists : dict
+            source id -> list entity of the lists of the import
+        errors : list
+            error results of rejected lines. Updated in place.
+    Returns:
+        inserted : int
+            the number of tasks written.
+    """
+    existing = get_entities_by_ids("lists", [
+        list_id for _, list_id, _ in pending
+        if list_id is not None and list_id not in imported_lists])
+    tasks = []
+    for line, list_id, props in pending:
+        task = engine.entity(engine.key("tasks"))
+        task.update(props)
+        task['task_list'] = {}
+        if list_id is not None:
+            task_list = imported_lists[list_id] \
+                if list_id in imported_lists else existing.get(list_id)
+            if task_list is None or task_list['owner'] != user_id:
+                errors.append(_error_result(
+                    "invalid_list", "The list of the task was not imported "
+                    "and is not one of your lists.", 404, line=line))
+                continue
+            task['task_list'] = {'id': task_list.key.id,
+                                 'name': task_list['name']}
+        touch_new(task)
+        tasks.append(task)
+    for chunk in chunked(tasks):
+        engine.put_multi(chunk)
+    members = [list_task_entity(engine.key("lists", task['task_list']['id']),
+                                task)
+               for task in tasks if task['task_list'] != {}]
+    for chunk in chunked(members):
+        engine.put_multi(chunk)
+    for list_id in {task['task_list']['id'] for task in tasks
+                    if task['task_list'] != {}}:
+        invalidate_public_list(list_id)
+    return len(tasks)
+
+def import_records(records, user_id, batch_size=IMPORT_BATCH_SIZE):
+    """
+    Import task lists and tasks of the user from parsed NDJSON lines, e.g.
+    the output of GET /export. Each record is an object with a 'kind' of
+    'lists' or 'tasks' and the properties of the entity, validated like
+    POST /lists and POST /tasks. Records are written in batches of
+    batch_size, so the import holds one batch in memory.
+
+    A list's 'id' is its id in the source. A task's 'task_list' {'id': ...}
+    refers to a list of the import by that id, or else to an existing list
+    of the user. Lists have to come before their tasks, like in the export.
+
+    Parameters:
+        records : iterable
+            (line number, record) pairs. record is None if the line could
+            not be parsed (see helper.ndjson.iter_ndjson).
+        user_id : str
+            the user's id of the app.
+        batch_size : int
+            number of records written at a time
+    Returns:
+        summary : dict
+            'inserted' numbers of 'lists' and 'tasks', the number of
+            'rejected' lines and their 'errors' with the 'line' number.
+    """
+    inserted = {'lists': 0, 'tasks': 0}
+    errors = []
+    imported_lists = {}
+    pending_lists = []
+    pending_tasks = []
+    for line, record in records:
+        if not isinstance(record, dict):
+            errors.append(_error_result(
+                "invalid_record", "The line is not a JSON object.", 400,
+                line=line))
+            continue
+        kind = record.get('kind')
+        try:
+            if kind == 'lists':
+                props = {p: record[p] for p in LIST_REQUIRED_PROPERTIES
+                         if p in record}
+                validate_required("lists", props)
+                validate_task_list_property(props)
+            elif kind == 'tasks':
+                props = {p: record[p] for p in TASK_REQUIRED_PROPERTIES
+                         + ['completed'] if p in record}
+                validate_required("tasks", props)
+                validate_task_property(props)
+                parse_due_date(props)
+                task_list = record.get('task_list') or {}
+                list_id = task_list.get('id') \
+                    if isinstance(task_list, dict) else None
+                if task_list and type(list_id) != int:
+                    raise BadRequest({
+                        "code": "invalid_task_list",
+                        "description": "'task_list' must be an object with "
+                                       "the 'id' of a list."
+                    }, 400)
+            else:
+                raise BadRequest({
+                    "code": "invalid_kind",
+                    "description": "'kind' must be 'lists' or 'tasks'."
+                }, 400)
+        except BadRequest as err:
+            errors.append({"line": line, "status": err.status_code,
+                           "error": err.error})
+            continue
+
+        props['owner'] = user_id
+        if kind == 'lists':
+            touch_new(props)
+            source_id = record.get('id') if type(record.get('id')) == int \
+                else None
+            pending_lists.append((line, source_id, props))
+            if len(pending_lists) >= batch_size:
+                inserted['lists'] += _import_lists(
+                    pending_lists, user_id, imported_lists, errors)
+                pending_lists = []
+            continue
+        props.setdefault('completed', False)
+        # Write the lists first, so that the task can refer to them.
+        if list_id is not None and any(list_id == source_id
+                                       for _, source_id, _ in pending_lists):
+            inserted['lists'] += _import_lists(
+                pending_lists, user_id, imported_lists, errors)
+            pending_lists = []
+        pending_tasks.append((line, list_id, props))
+        if len(pending_tasks) >= batch_size:
+            inserted['tasks'] += _import_tasks(
+                pending_tasks, user_id, imported_lists, errors)
+            pending_tasks = []
+    if pending_lists:
+        inserted['lists'] += _import_lists(pending_lists, user_id,
+                                           imported_lists, errors)
+    if pending_tasks:
+        inserted['tasks'] += _import_tasks(pending_tasks, user_id,
+                                           imported_lists, errors)
+    errors.sort(key=lambda error: error['line'])
+    return {'inserted': inserted, 'rejected': len(errors), 'errors': errors}
+
+
+##############################################################################
+# Indexes                                                                    #
+##############################################################################
+
+# Equality filters and sort orders of GET /tasks. Every combination of the
+# filters, with each sort order, has a composite index. TASK_PROJECTION are
+# the properties sorted queries can fetch with a projection query.
+TASK_EQUALITY_FILTERS = ('completed', 'task_list.id')
+TASK_SORT_ORDERS = ('due_date', 'name')
+TASK_PROJECTION = ('completed', 'due_date', 'name')
+
+def composite_indexes():
+    """
+    Return the composite indexes of the app's queries as (kind, properties)
+    pairs: the filters and sorts of get_tasks, and the 'updated_at' order of
+    get_changes. Queries by key, or with only equality filters, are served
+    by the built-in indexes.
+
+    A projection has to be in the index after the sort order, so projection
+    queries of get_tasks are sorted by the other TASK_PROJECTION properties
+    after the sort order, and have indexes of their own.
+    """
+    indexes = []
+    for n in range(len(TASK_EQUALITY_FILTERS) + 1):
+        for filters in itertools.combinations(TASK_EQUALITY_FILTERS, n):
+            for sort in TASK_SORT_ORDERS:
+                indexes.append(("tasks", ['owner', *filters, sort]))
+                indexes.append(("tasks", ['owner', *filters, sort] + [
+                    p for p in TASK_PROJECTION
+                    if p != sort and p not in filters]))
+    for kind in SYNC_KINDS:
+        indexes.append((kind, ['owner', 'updated_at']))
+    return indexes
+
+def index_yaml():
+    """
+    Return the index.yaml of composite_indexes() for
+    'gcloud datastore indexes create'.
+    """
+    lines = ["# Generated by 'flask --app main generate-indexes'. "
+             "Do not edit.", "indexes:"]
+    for kind, properties in composite_indexes():
+        lines += ["", f"- kind: {kind}", "  properties:"]
+        lines += [f"  - name: {name}" for name in properties]
+    return "\n".join(lines) + "\n"
+
+
+##############################################################################
+# Migration                                                                  #
+##############################################################################
+
+def migrate_user_keys(batch_size=DATASTORE_BATCH_LIMIT):
+    """
+    Move user entities stored under numeric ids to named keys of their
+    'user_id' property. Users are read by cursor queries and migrated
+    batch_size at a time. Duplicated users of the same user_id are merged
+    into the first one, or into the named user if it exists already, e.g.
+    when the migration is run again.
+
+    Parameters:
+        batch_size : int
+            number of users migrated at a time
+    Returns:
+        migrated : int
+            the number of numeric-id user entities that were migrated.
+    """
+    migrated = 0
+    seen = set()
+    old_users = (user for user in iter_entities("users")
+                 if user.key.id is not None)
+    for chunk in iter_chunks(old_users, batch_size):
+        user_ids = {user["user_id"] for user in chunk} - seen
+        existing = engine.get_multi([user_key(id) for id in user_ids])
+        seen.update(user.key.name for user in existing)
+        new_users = []
+        for old_user in chunk:
+            user_id = old_user["user_id"]
+            if user_id in seen:
+                continue
+            seen.add(user_id)
+            user = engine.entity(user_key(user_id))
+            user.update(old_user)
+            new_users.append(user)
+        engine.put_multi(new_users)
+        engine.delete_multi([user.key for user in chunk])
+        migrated += len(chunk)
+    return migrated
+
+def backfill_list_names(batch_size=DATASTORE_BATCH_LIMIT):
+    """
+    Claim the names of lists created before list names were claimed. Lists
+    are read by cursor queries and their names claimed batch_size at a time.
+
+    Parameters:
+        batch_size : int
+            number of lists claimed at a time
+    Returns:
+        claimed : int
+            the number of list names claimed.
+    """
+    claimed = set()
+    for chunk in iter_chunks(iter_entities("lists"), batch_size):
+        claims = {}
+        for task_list in chunk:
+            key = list_name_key(task_list["owner"], task_list["name"])
+            if key.flat_path in claimed:
+                continue
+            claim = engine.entity(key)
+            claim.update({'owner': task_list["owner"], 'name': task_list["name"]})
+            claims[key.flat_path] = claim
+        if claims:
+            engine.put_multi(list(claims.values()))
+        claimed.update(claims)
+    return len(claimed)
+
+def migrate_list_tasks(batch_size=DATASTORE_BATCH_LIMIT):
+    """
+    Move the members embedded in the 'tasks' property of lists created
+    before memberships were stored as 'list_tasks' entities. Tasks that do
+    not exist or are not owned by the list's owner are dropped. Lists are
+    read by cursor queries and migrated batch_size at a time: their
+    memberships are put first, then the lists are touched and put without
+    the 'tasks' property, so the migration can be run again if it is
+    interrupted.
+
+    Parameters:
+        batch_size : int
+            number of lists migrated at a time
+    Returns:
+        migrated : int
+            the number of lists migrated.
+    """
+    migrated = 0
+    old_lists = (task_list for task_list in iter_entities("lists")
+                 if 'tasks' in task_list)
+    for chunk in iter_chunks(old_lists, batch_size):
+        embedded = {task_list.key.id: [
+            task.get('id') for task in task_list.pop('tasks')
+            if isinstance(task, dict) and type(task.get('id')) == int]
+            for task_list in chunk}
+        tasks = get_entities_by_ids("tasks", [
+            task_id for task_ids in embedded.values() for task_id in task_ids])
+        members = []
+        for task_list in chunk:
+            # Only the owner's tasks become members: 'tasks' could be sent
+            # by clients when lists were created.
+            for task_id in embedded[task_list.key.id]:
+                task = tasks.get(task_id)
+                if task is None or task['owner'] != task_list['owner']:
+                    continue
+                members.append(list_task_entity(task_list.key, task))
+            # A new version and stamp, so that ETags and sync see the change.
+            touch(task_list)
+        for members_chunk in chunked(members):
+            engine.put_multi(members_chunk)
+        engine.put_multi(chunk)
+        for task_list in chunk:
+            if task_list.get('public'):
+                invalidate_public_list(task_list.key.id)
+        migrated += len(chunk)
+    return migrated
+
+def backfill_updated_at(batch_size=DATASTORE_BATCH_LIMIT):
+    """
+    Stamp 'updated_at' on the tasks and lists created before it was
+    stamped, so that they are returned by get_changes. Entities are read by
+    cursor queries and written batch_size at a time.
+
+    Parameters:
+        batch_size : int
+            number of entities written at a time
+    Returns:
+        stamped : int
+            the number of entities stamped.
+    """
+    stamped = 0
+    for kind in ("tasks", "lists"):
+        old_entities = (entity for entity in iter_entities(kind)
+                        if 'updated_at' not in entity)
+        for chunk in iter_chunks(old_entities, batch_size):
+            for entity in chunk:
+                entity['updated_at'] = next_timestamp()
+            engine.put_multi(chunk)
+            stamped += len(chunk)
+    return stamped
+
+def prune_tombstones(batch_size=DATASTORE_BATCH_LIMIT):
+    """
+    Delete the tombstones older than SYNC_TOMBSTONE_DAYS. Sync tokens that
+    old are rejected by get_changes. Tombstones are read by cursor queries
+    and deleted batch_size at a time.
+
+    Parameters:
+        batch_size : int
+            number of tombstones deleted at a time
+    Returns:
+        pruned : int
+            the number of tombstones deleted.
+    """
+    cutoff = datetime.now(timezone.utc) - timedelta(days=SYNC_TOMBSTONE_DAYS)
+    pruned = 0
+    cursor = None
+    while True:
+        tombstones, cursor = engine.query(
+            "tombstones", filters=[('updated_at', '<', cutoff)],
+            order=['updated_at'], limit=batch_size, cursor=cursor,
+            keys_only=True)
+        engine.delete_multi([entity.key for entity in tombstones])
+        pruned += len(tombstones)
+        if cursor is None:
+            return pruned
+
+def migrate_due_dates(batch_size=DATASTORE_BATCH_LIMIT):
+    """
+    Convert the 'due_date' strings of tasks created before due dates were
+    stored as datetimes. Tasks are read by cursor queries and written
+    batch_size at a time.
+
+    Parameters:
+        batch_size : int
+            number of tasks written at a time
+    Returns:
+        migrated : int
+            the number of tasks migrated.
     """
-    task_list = get_task_list_by_id(list_id, user_id)
-    # Remove all tasks
-    tasks = task_list['tasks']
-    for task in tasks:
-        task_id = task['id']
-        client.delete(client.key("tasks", task_id))
-    client.delete(client.key("lists", list_id))
+    migrated = 0
+    old_tasks = (task for task in iter_entities("tasks")
+                 if isinstance(task.get('due_date'), str))
+    for chunk in iter_chunks(old_tasks, batch_size):
+        for task in chunk:
+            parse_due_date(task)
+        engine.put_multi(chunk)
+        migrated += len(chunk)
+    return migrated
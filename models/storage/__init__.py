@@ -0,0 +1,29 @@
+from models.storage.base import Engine, Entity, Key, InvalidCursor
+
+ENGINES = ('datastore', 'memory', 'sqlite')
+
+
+def create_engine(name='datastore', sqlite_path=None):
+    """
+    Create the storage engine of the name. Engines are imported lazily so
+    that the local engines do not require google-cloud-datastore.
+
+    Parameters
+        name : str
+            'datastore', 'memory' or 'sqlite'
+        sqlite_path : str
+            database file of the sqlite engine
+    Returns
+        engine : models.storage.Engine
+    """
+    if name == 'datastore':
+        from models.storage.datastore_engine import DatastoreEngine
+        return DatastoreEngine()
+    if name == 'memory':
+        from models.storage.memory_engine import MemoryEngine
+        return MemoryEngine()
+    if name == 'sqlite':
+        from models.storage.sqlite_engine import SQLiteEngine
+        return SQLiteEngine(sqlite_path or 'tasks.db')
+    raise ValueError(f"Unknown storage engine {name!r}, "
+                     f"expected one of {', '.join(ENGINES)}.")
@@ -0,0 +1,296 @@
+import base64
+import json
+from datetime import datetime
+
+
+class InvalidCursor(ValueError):
+    """
+    Raised when a query cursor cannot be decoded by the engine.
+    """
+
+
+class Key:
+    """
+    Key of an entity for the local engines. It mirrors the attributes of
+    google.cloud.datastore.Key used by the app: kind, id, name, id_or_name,
+    parent and flat_path.
+    """
+    __slots__ = ('kind', 'id', 'name', 'parent')
+
+    def __init__(self, kind, id_or_name=None, parent=None):
+        self.kind = kind
+        self.id = id_or_name if isinstance(id_or_name, int) else None
+        self.name = id_or_name if isinstance(id_or_name, str) else None
+        self.parent = parent
+
+    @property
+    def id_or_name(self):
+        return self.id if self.id is not None else self.name
+
+    @property
+    def is_partial(self):
+        return self.id_or_name is None
+
+    @property
+    def flat_path(self):
+        path = self.parent.flat_path if self.parent is not None else ()
+        if self.is_partial:
+            return path + (self.kind,)
+        return path + (self.kind, self.id_or_name)
+
+    def completed_key(self, id_or_name):
+        return Key(self.kind, id_or_name, self.parent)
+
+    def __eq__(self, other):
+        return isinstance(other, Key) and self.flat_path == other.flat_path
+
+    def __hash__(self):
+        return hash(self.flat_path)
+
+    def __repr__(self):
+        return f"<Key {self.flat_path}>"
+
+
+class Entity(dict):
+    """
+    Entity of the local engines. A dict of the entity's properties with
+    the entity's key, like google.cloud.datastore.Entity.
+    """
+
+    def __init__(self, key=None, exclude_from_indexes=()):
+        super().__init__()
+        self.key = key
+        self.exclude_from_indexes = set(exclude_from_indexes)
+
+
+def key_from_path(flat_path):
+    """
+    Build a Key from a flat path (kind, id_or_name, kind, id_or_name, ...).
+    """
+    key = None
+    for i in range(0, len(flat_path), 2):
+        key = Key(flat_path[i], flat_path[i + 1], key)
+    return key
+
+
+class Engine:
+    """
+    Interface of a storage engine. models.model only talks to the
+    datastore through these methods.
+
+    Filters are (property, operator, value) tuples with the operators
+    '=', '!=', '<', '<=', '>', '>=' and 'IN'. Embedded properties are
+    addressed with dots, e.g. 'task_list.id'. Orders are property names,
+    or '__key__', with a '-' prefix for descending order.
+    """
+    # True if reads wait on the network, so that independent reads gain
+    # from running at the same time (see models.model.fetch_all).
+    concurrent_reads = False
+
+    def key(self, kind, id_or_name=None, parent=None):
+        """
+        Return a key of the kind. The key is partial if id_or_name is None,
+        and an id is allocated when the entity is put.
+        """
+        raise NotImplementedError
+
+    def entity(self, key, exclude_from_indexes=()):
+        """
+        Return a new, empty entity of the key.
+        """
+        raise NotImplementedError
+
+    def get(self, key):
+        """
+        Return the entity of the key, or None if it does not exist.
+        """
+        raise NotImplementedError
+
+    def get_multi(self, keys):
+        """
+        Return the existing entities of the keys. Missing keys are skipped.
+        """
+        raise NotImplementedError
+
+    def put(self, entity):
+        """
+        Insert or update an entity. A partial key is completed in place.
+        """
+        raise NotImplementedError
+
+    def put_multi(self, entities):
+        raise NotImplementedError
+
+    def delete(self, key):
+        raise NotImplementedError
+
+    def delete_multi(self, keys):
+        raise NotImplementedError
+
+    def query(self, kind, filters=(), ancestor=None, order=('__key__',),
+              limit=None, offset=0, cursor=None, keys_only=False,
+              projection=()):
+        """
+        Run a query and return a page of entities.
+
+        Parameters
+            kind : str
+                the kind of the entities
+            filters : list
+                (property, operator, value) tuples
+            ancestor : Key
+                only return descendants of the key
+            order : list
+                property names to sort by, '-' prefix for descending order
+            limit : int
+                maximum number of entities, None for all of them
+            offset : int
+                number of entities to skip
+            cursor : str
+                opaque cursor returned by the previous page
+            keys_only : bool
+                return entities without properties
+            projection : list
+                only return these properties
+        Returns
+            entities : list
+                the entities of the page
+            next_cursor : str
+                cursor of the next page. None if the page is not full.
+        """
+        raise NotImplementedError
+
+    def count(self, kind, filters=(), ancestor=None):
+        """
+        Return the number of entities matching the filters.
+        """
+        raise NotImplementedError
+
+    def transaction(self):
+        """
+        Return a context manager running the enclosed operations in a
+        transaction. Transactions do not nest, an inner transaction joins
+        the outer one.
+        """
+        raise NotImplementedError
+
+
+##############################################################################
+# Helpers shared by the local engines                                       #
+##############################################################################
+
+def get_property(props, name):
+    """
+    Return the value of a (dotted) property, or raise KeyError.
+    """
+    value = props
+    for part in name.split('.'):
+        if not isinstance(value, dict):
+            raise KeyError(name)
+        value = value[part]
+    return value
+
+def value_order(value):
+    """
+    Sort key of a property value. Values of different types are ordered by
+    type the way datastore orders them.
+    """
+    if value is None:
+        return (0, 0)
+    if isinstance(value, bool):
+        return (1, value)
+    if isinstance(value, (int, float)):
+        return (2, value)
+    if isinstance(value, str):
+        return (3, value)
+    if isinstance(value, datetime):
+        return (4, value.isoformat())
+    return (5, json.dumps(value, sort_keys=True, default=str))
+
+def key_order(key):
+    """
+    Sort key of an entity key. Ids come before names like in datastore.
+    """
+    order = []
+    for i in range(0, len(key.flat_path), 2):
+        id_or_name = key.flat_path[i + 1]
+        order.append((key.flat_path[i],
+                      (0, id_or_name, '') if isinstance(id_or_name, int)
+                      else (1, 0, id_or_name)))
+    return tuple(order)
+
+def compare(prop, op, value):
+    """
+    Evaluate a filter operator against a property value. A list property
+    matches if any of its values matches.
+    """
+    if op == 'IN':
+        return any(compare(prop, '=', v) for v in value)
+    if isinstance(prop, list):
+        return any(compare(p, op, value) for p in prop)
+    left, right = value_order(prop), value_order(value)
+    if op == '=':
+        return left == right
+    if op == '!=':
+        return left != right
+    if left[0] != right[0]:
+        return False
+    if op == '<':
+        return left < right
+    if op == '<=':
+        return left <= right
+    if op == '>':
+        return left > right
+    if op == '>=':
+        return left >= right
+    raise ValueError(f"Unsupported filter operator {op}.")
+
+def matches(props, filters):
+    """
+    Check whether the properties satisfy every filter. Entities without a
+    filtered property never match, like in datastore.
+    """
+    for name, op, value in filters:
+        try:
+            prop = get_property(props, name)
+        except KeyError:
+            return False
+        if not compare(prop, op, value):
+            return False
+    return True
+
+def parse_order(order):
+    """
+    Return (property, descending) pairs of an order list.
+    """
+    return [(o[1:], True) if o.startswith('-') else (o, False) for o in order]
+
+def encode_value(value):
+    if isinstance(value, datetime):
+        return {'$dt': value.isoformat()}
+    return value
+
+def decode_value(value):
+    if isinstance(value, dict) and '$dt' in value:
+        return datetime.fromisoformat(value['$dt'])
+    return value
+
+def encode_cursor(values):
+    """
+    Encode a list of JSON values into an opaque url-safe cursor.
+    """
+    data = json.dumps([encode_value(v) for v in values]).encode()
+    return base64.urlsafe_b64encode(data).decode()
+
+def decode_cursor(cursor):
+    """
+    Decode a cursor made by encode_cursor. Raise InvalidCursor if the
+    cursor is malformed.
+    """
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        if not isinstance(values, list):
+            raise InvalidCursor(cursor)
+        return [decode_value(v) for v in values]
+    except (ValueError, TypeError):
+        raise InvalidCursor(cursor)
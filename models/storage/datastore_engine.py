@@ -0,0 +1,97 @@
+import threading
+from contextlib import nullcontext
+from models.storage.base import Engine, InvalidCursor
+
+
+class DatastoreEngine(Engine):
+    """
+    Storage engine on Google Cloud Datastore. google.cloud.datastore is
+    imported and the client created on first use, so that they do not slow
+    down the start of an instance.
+    """
+    concurrent_reads = True
+
+    def __init__(self, client=None):
+        self._client = client
+        self._lock = threading.Lock()
+
+    @property
+    def client(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    from google.cloud import datastore
+                    self._client = datastore.Client()
+        return self._client
+
+    def key(self, kind, id_or_name=None, parent=None):
+        if id_or_name is None:
+            return self.client.key(kind, parent=parent)
+        return self.client.key(kind, id_or_name, parent=parent)
+
+    def entity(self, key, exclude_from_indexes=()):
+        from google.cloud import datastore
+        return datastore.Entity(key, exclude_from_indexes=exclude_from_indexes)
+
+    def get(self, key):
+        return self.client.get(key)
+
+    def get_multi(self, keys):
+        return self.client.get_multi(list(keys))
+
+    def put(self, entity):
+        self.client.put(entity)
+
+    def put_multi(self, entities):
+        self.client.put_multi(list(entities))
+
+    def delete(self, key):
+        self.client.delete(key)
+
+    def delete_multi(self, keys):
+        self.client.delete_multi(list(keys))
+
+    def _query(self, kind, filters=(), ancestor=None, order=(),
+               projection=()):
+        query = self.client.query(kind=kind, ancestor=ancestor,
+                                  projection=list(projection))
+        for name, op, value in filters:
+            query.add_filter(name, op, value)
+        query.order = list(order)
+        return query
+
+    def query(self, kind, filters=(), ancestor=None, order=('__key__',),
+              limit=None, offset=0, cursor=None, keys_only=False,
+              projection=()):
+        from google.api_core.exceptions import InvalidArgument
+        query = self._query(kind, filters, ancestor, order, projection)
+        if keys_only:
+            query.keys_only()
+        if limit is None:
+            return list(query.fetch(offset=offset, start_cursor=cursor)), None
+        try:
+            iterator = query.fetch(limit=limit, offset=offset,
+                                   start_cursor=cursor)
+            # A batch can end before the limit while more results are left
+            # (NOT_FINISHED), so read batches until the limit or the end.
+            entities = list(iterator)
+        except (ValueError, InvalidArgument):
+            if cursor is None:
+                raise
+            raise InvalidCursor(cursor)
+        # The token is None once datastore reports NO_MORE_RESULTS.
+        next_cursor = iterator.next_page_token
+        if not entities or next_cursor is None:
+            return entities, None
+        return entities, next_cursor.decode()
+
+    def count(self, kind, filters=(), ancestor=None):
+        # Keys-only, so that no entity is downloaded to count them.
+        query = self._query(kind, filters, ancestor)
+        query.keys_only()
+        return sum(1 for _ in query.fetch())
+
+    def transaction(self):
+        if self.client.current_transaction is not None:
+            return nullcontext()
+        return self.client.transaction()
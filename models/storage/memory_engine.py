@@ -0,0 +1,192 @@
+import copy
+import itertools
+import threading
+from functools import cmp_to_key
+from models.storage.base import Engine, Entity, Key, InvalidCursor
+from models.storage.base import get_property, value_order, key_order
+from models.storage.base import matches, parse_order
+from models.storage.base import encode_cursor, decode_cursor
+
+
+class MemoryEngine(Engine):
+    """
+    In-process storage engine. Entities are kept in dicts indexed by kind
+    and key, with secondary hash indexes on INDEXED_PROPERTIES for equality
+    filters and on the keys' ancestors for ancestor queries. Used for load tests and single-process deployments; nothing
+    is persisted.
+    """
+    INDEXED_PROPERTIES = ('owner', 'public', 'name')
+    ANCESTOR = '__ancestor__'
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        # kind -> {flat_path: (key, properties)}
+        self._entities = {}
+        # (kind, property) -> {value_order(value): set of flat_path}
+        # (kind, ANCESTOR) -> {ancestor's flat_path: set of flat_path}
+        self._indexes = {}
+        self._ids = itertools.count(1)
+
+    def key(self, kind, id_or_name=None, parent=None):
+        return Key(kind, id_or_name, parent)
+
+    def entity(self, key, exclude_from_indexes=()):
+        return Entity(key, exclude_from_indexes)
+
+    def _load(self, key, props, keys_only=False, projection=()):
+        entity = Entity(key)
+        if keys_only:
+            return entity
+        if projection:
+            entity.update({p: copy.deepcopy(props[p])
+                           for p in projection if p in props})
+        else:
+            entity.update(copy.deepcopy(props))
+        return entity
+
+    def get(self, key):
+        row = self._entities.get(key.kind, {}).get(key.flat_path)
+        if row is None:
+            return None
+        return self._load(*row)
+
+    def get_multi(self, keys):
+        entities = []
+        for key in keys:
+            entity = self.get(key)
+            if entity is not None:
+                entities.append(entity)
+        return entities
+
+    def _index_values(self, key, props):
+        for name in self.INDEXED_PROPERTIES:
+            value = props.get(name)
+            if isinstance(value, (str, int, float, bool)):
+                yield name, value_order(value)
+        parent = key.parent
+        while parent is not None:
+            yield self.ANCESTOR, parent.flat_path
+            parent = parent.parent
+
+    def put(self, entity):
+        with self._lock:
+            if entity.key.is_partial:
+                entity.key = entity.key.completed_key(next(self._ids))
+            key = entity.key
+            rows = self._entities.setdefault(key.kind, {})
+            self._unindex(key, rows.get(key.flat_path))
+            props = copy.deepcopy(dict(entity))
+            rows[key.flat_path] = (key, props)
+            for name, value in self._index_values(key, props):
+                index = self._indexes.setdefault((key.kind, name), {})
+                index.setdefault(value, set()).add(key.flat_path)
+
+    def put_multi(self, entities):
+        with self._lock:
+            for entity in entities:
+                self.put(entity)
+
+    def _unindex(self, key, row):
+        if row is None:
+            return
+        for name, value in self._index_values(key, row[1]):
+            paths = self._indexes[(key.kind, name)][value]
+            paths.discard(key.flat_path)
+            if not paths:
+                del self._indexes[(key.kind, name)][value]
+
+    def delete(self, key):
+        with self._lock:
+            row = self._entities.get(key.kind, {}).pop(key.flat_path, None)
+            self._unindex(key, row)
+
+    def delete_multi(self, keys):
+        with self._lock:
+            for key in keys:
+                self.delete(key)
+
+    def _candidates(self, kind, filters, ancestor):
+        """
+        Return the rows of the kind, narrowed down by the smallest secondary
+        index of the ancestor and the equality filters.
+        """
+        rows = self._entities.get(kind, {})
+        best = None
+        if ancestor is not None:
+            best = self._indexes.get((kind, self.ANCESTOR), {}) \
+                .get(ancestor.flat_path, set())
+        for name, op, value in filters:
+            if op != '=' or name not in self.INDEXED_PROPERTIES:
+                continue
+            paths = self._indexes.get((kind, name), {}) \
+                .get(value_order(value), set())
+            if best is None or len(paths) < len(best):
+                best = paths
+        if best is None:
+            return list(rows.values())
+        return [rows[path] for path in best]
+
+    def _select(self, kind, filters, ancestor):
+        with self._lock:
+            rows = self._candidates(kind, filters, ancestor)
+        if ancestor is not None:
+            prefix = ancestor.flat_path
+            rows = [row for row in rows
+                    if row[0].flat_path[:len(prefix)] == prefix]
+        return [row for row in rows if matches(row[1], filters)]
+
+    def query(self, kind, filters=(), ancestor=None, order=('__key__',),
+              limit=None, offset=0, cursor=None, keys_only=False,
+              projection=()):
+        rows = self._select(kind, filters, ancestor)
+        orders = parse_order(order)
+        # Entities without a sort property are left out, like in datastore.
+        ordered = []
+        for key, props in rows:
+            try:
+                values = [key_order(key) if name == '__key__'
+                          else value_order(get_property(props, name))
+                          for name, _ in orders]
+            except KeyError:
+                continue
+            ordered.append((values + [key_order(key)], key, props))
+
+        def compare_rows(a, b):
+            for i, (_, descending) in enumerate(orders + [('__key__', False)]):
+                if a[i] != b[i]:
+                    result = -1 if a[i] < b[i] else 1
+                    return -result if descending else result
+            return 0
+
+        ordered.sort(key=cmp_to_key(lambda a, b: compare_rows(a[0], b[0])))
+        if cursor is not None:
+            after = _tuplify(decode_cursor(cursor))
+            if len(after) != len(orders) + 1:
+                raise InvalidCursor(cursor)
+            try:
+                ordered = [row for row in ordered
+                           if compare_rows(row[0], after) > 0]
+            except TypeError:
+                raise InvalidCursor(cursor)
+        ordered = ordered[offset:]
+        if limit is not None:
+            ordered = ordered[:limit]
+        entities = [self._load(key, props, keys_only, projection)
+                    for _, key, props in ordered]
+        next_cursor = None
+        if limit is not None and len(ordered) == limit and ordered:
+            next_cursor = encode_cursor(ordered[-1][0])
+        return entities, next_cursor
+
+    def count(self, kind, filters=(), ancestor=None):
+        return len(self._select(kind, filters, ancestor))
+
+    def transaction(self):
+        # Transactions hold the engine lock, so they are serialized.
+        return self._lock
+
+
+def _tuplify(value):
+    if isinstance(value, list):
+        return tuple(_tuplify(v) for v in value)
+    return value
@@ -0,0 +1,309 @@
+import json
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from models.storage.base import Engine, Entity, Key, InvalidCursor
+from models.storage.base import key_from_path, parse_order
+from models.storage.base import encode_cursor, decode_cursor
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entities (
+    path TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    parent TEXT NOT NULL,
+    key_id INTEGER NOT NULL,
+    key_name TEXT NOT NULL,
+    owner,
+    public,
+    name,
+    data TEXT NOT NULL,
+    dates TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS entities_kind ON entities (kind, parent, key_id, key_name);
+CREATE INDEX IF NOT EXISTS entities_owner ON entities (kind, owner);
+CREATE INDEX IF NOT EXISTS entities_public ON entities (kind, public);
+CREATE INDEX IF NOT EXISTS entities_name ON entities (kind, name);
+CREATE TABLE IF NOT EXISTS sequences (
+    kind TEXT PRIMARY KEY,
+    next_id INTEGER NOT NULL
+);
+"""
+
+OPERATORS = {'=': '=', '!=': '!=', '<': '<', '<=': '<=', '>': '>', '>=': '>='}
+
+
+class SQLiteEngine(Engine):
+    """
+    Storage engine on a single SQLite database in WAL mode. Properties are
+    stored as JSON, and 'owner', 'public' and 'name' are copied to indexed
+    columns. Filters, orders and cursors are evaluated by SQLite; cursors
+    are keyset cursors, so deep pages are as cheap as the first one.
+
+    Datetime properties are stored as ISO 8601 strings, which sort in time
+    order as long as they share a timezone, and are restored on read.
+    """
+    INDEXED_PROPERTIES = ('owner', 'public', 'name')
+
+    def __init__(self, path):
+        self._database = path
+        self._local = threading.local()
+        with self._connection() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+
+    def _connection(self):
+        """
+        Return the connection of the current thread.
+        """
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self._database, isolation_level=None,
+                                   check_same_thread=False)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=5000")
+            self._local.conn = conn
+            self._local.depth = 0
+        return conn
+
+    @contextmanager
+    def transaction(self):
+        conn = self._connection()
+        if self._local.depth:
+            self._local.depth += 1
+            try:
+                yield
+            finally:
+                self._local.depth -= 1
+            return
+        conn.execute("BEGIN IMMEDIATE")
+        self._local.depth = 1
+        try:
+            yield
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        else:
+            conn.execute("COMMIT")
+        finally:
+            self._local.depth = 0
+
+    def key(self, kind, id_or_name=None, parent=None):
+        return Key(kind, id_or_name, parent)
+
+    def entity(self, key, exclude_from_indexes=()):
+        return Entity(key, exclude_from_indexes)
+
+    ##########################################################################
+    # Serialization                                                          #
+    ##########################################################################
+
+    @staticmethod
+    def _dump(props):
+        dates = []
+
+        def convert(value, path):
+            if isinstance(value, datetime):
+                dates.append(path)
+                return value.isoformat()
+            if isinstance(value, dict):
+                return {k: convert(v, path + [k]) for k, v in value.items()}
+            if isinstance(value, list):
+                return [convert(v, path + [i]) for i, v in enumerate(value)]
+            return value
+
+        data = convert(dict(props), [])
+        return json.dumps(data), json.dumps(dates)
+
+    @staticmethod
+    def _restore(data, dates):
+        props = json.loads(data)
+        for path in json.loads(dates):
+            value = props
+            for part in path[:-1]:
+                value = value[part]
+            value[path[-1]] = datetime.fromisoformat(value[path[-1]])
+        return props
+
+    def _load(self, path, data, dates, keys_only=False, projection=()):
+        entity = Entity(key_from_path(json.loads(path)))
+        if keys_only:
+            return entity
+        props = self._restore(data, dates)
+        if projection:
+            props = {p: props[p] for p in projection if p in props}
+        entity.update(props)
+        return entity
+
+    @staticmethod
+    def _path(key):
+        return json.dumps(key.flat_path)
+
+    @staticmethod
+    def _parent(key):
+        return json.dumps(key.parent.flat_path) if key.parent else ''
+
+    ##########################################################################
+    # Get, put and delete                                                    #
+    ##########################################################################
+
+    def get(self, key):
+        row = self._connection().execute(
+            "SELECT path, data, dates FROM entities WHERE path = ?",
+            (self._path(key),)).fetchone()
+        return self._load(*row) if row else None
+
+    def get_multi(self, keys):
+        entities = []
+        keys = list(keys)
+        # Stay below SQLite's limit of host parameters per statement.
+        for i in range(0, len(keys), 500):
+            paths = [self._path(key) for key in keys[i:i + 500]]
+            rows = self._connection().execute(
+                "SELECT path, data, dates FROM entities WHERE path IN (%s)"
+                % ",".join("?" * len(paths)), paths).fetchall()
+            found = {row[0]: row for row in rows}
+            entities.extend(self._load(*found[path])
+                            for path in paths if path in found)
+        return entities
+
+    def _allocate_id(self, conn, kind):
+        row = conn.execute("SELECT next_id FROM sequences WHERE kind = ?",
+                           (kind,)).fetchone()
+        next_id = row[0] if row else 1
+        conn.execute("INSERT OR REPLACE INTO sequences VALUES (?, ?)",
+                     (kind, next_id + 1))
+        return next_id
+
+    def _indexed(self, props, name):
+        value = props.get(name)
+        if isinstance(value, (str, int, float, bool)):
+            return value
+        return None
+
+    def put(self, entity):
+        self.put_multi([entity])
+
+    def put_multi(self, entities):
+        conn = self._connection()
+        with self.transaction():
+            for entity in entities:
+                if entity.key.is_partial:
+                    entity.key = entity.key.completed_key(
+                        self._allocate_id(conn, entity.key.kind))
+                key = entity.key
+                data, dates = self._dump(entity)
+                conn.execute(
+                    "INSERT OR REPLACE INTO entities VALUES "
+                    "(?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (self._path(key), key.kind, self._parent(key),
+                     key.id or 0, key.name or '',
+                     *(self._indexed(entity, p)
+                       for p in self.INDEXED_PROPERTIES),
+                     data, dates))
+
+    def delete(self, key):
+        self.delete_multi([key])
+
+    def delete_multi(self, keys):
+        conn = self._connection()
+        with self.transaction():
+            conn.executemany("DELETE FROM entities WHERE path = ?",
+                             [(self._path(key),) for key in keys])
+
+    ##########################################################################
+    # Queries                                                                #
+    ##########################################################################
+
+    def _expression(self, name):
+        """
+        Return the SQL expression of a property.
+        """
+        if name in self.INDEXED_PROPERTIES:
+            return name
+        return "json_extract(data, '$.%s')" % name.replace("'", "''")
+
+    @staticmethod
+    def _param(value):
+        return value.isoformat() if isinstance(value, datetime) else value
+
+    def _where(self, kind, filters, ancestor):
+        clauses = ["kind = ?"]
+        params = [kind]
+        if ancestor is not None:
+            prefix = json.dumps(ancestor.flat_path)[:-1]
+            clauses.append("(parent = ? OR parent LIKE ? ESCAPE '\\')")
+            params.append(json.dumps(ancestor.flat_path))
+            params.append(prefix.replace('\\', '\\\\').replace('%', '\\%')
+                          .replace('_', '\\_') + ',%')
+        for name, op, value in filters:
+            expression = self._expression(name)
+            if op == 'IN':
+                clauses.append("%s IN (%s)" % (expression,
+                                               ",".join("?" * len(value))))
+                params.extend(self._param(v) for v in value)
+            elif op in OPERATORS:
+                clauses.append("%s %s ?" % (expression, OPERATORS[op]))
+                params.append(self._param(value))
+            else:
+                raise ValueError(f"Unsupported filter operator {op}.")
+        return clauses, params
+
+    def query(self, kind, filters=(), ancestor=None, order=('__key__',),
+              limit=None, offset=0, cursor=None, keys_only=False,
+              projection=()):
+        clauses, params = self._where(kind, filters, ancestor)
+        # Sort columns: the ordered properties followed by the key.
+        columns = []
+        key_descending = False
+        for name, descending in parse_order(order):
+            if name == '__key__':
+                # Keys are unique, so later orders cannot change the order.
+                key_descending = descending
+                break
+            expression = self._expression(name)
+            clauses.append("%s IS NOT NULL" % expression)
+            columns.append((expression, descending, name))
+        columns += [(column, key_descending, None)
+                    for column in ("parent", "key_id", "key_name")]
+
+        if cursor is not None:
+            after = decode_cursor(cursor)
+            if len(after) != len(columns):
+                raise InvalidCursor(cursor)
+            # (c1, c2, ...) > (v1, v2, ...) with per-column direction.
+            terms = []
+            for i, (expression, descending, _) in enumerate(columns):
+                equal = ["%s = ?" % columns[j][0] for j in range(i)]
+                terms.append("(%s)" % " AND ".join(
+                    equal + ["%s %s ?" % (expression,
+                                          '<' if descending else '>')]))
+                params.extend(self._param(after[j]) for j in range(i + 1))
+            clauses.append("(%s)" % " OR ".join(terms))
+
+        sql = "SELECT path, data, dates, %s FROM entities WHERE %s ORDER BY %s" % (
+            ", ".join(c[0] for c in columns),
+            " AND ".join(clauses),
+            ", ".join("%s%s" % (c[0], " DESC" if c[1] else "")
+                      for c in columns))
+        if limit is not None or offset:
+            sql += " LIMIT ? OFFSET ?"
+            params += [limit if limit is not None else -1, offset]
+        try:
+            rows = self._connection().execute(sql, params).fetchall()
+        except sqlite3.Error:
+            if cursor is not None:
+                raise InvalidCursor(cursor)
+            raise
+        entities = [self._load(*row[:3], keys_only, projection)
+                    for row in rows]
+        next_cursor = None
+        if limit is not None and rows and len(rows) == limit:
+            next_cursor = encode_cursor(list(rows[-1][3:]))
+        return entities, next_cursor
+
+    def count(self, kind, filters=(), ancestor=None):
+        clauses, params = self._where(kind, filters, ancestor)
+        return self._connection().execute(
+            "SELECT COUNT(*) FROM entities WHERE %s" % " AND ".join(clauses),
+            params).fetchone()[0]
@@ -0,0 +1,16 @@
+"""
+Helpers of the API tests. See conftest.py for the fixtures.
+"""
+
+
+def add_task(client, headers, name="task", **props):
+    res = client.post("/tasks", headers=headers, json=dict({
+        "name": name, "description": "d", "due_date": "2024-01-01"}, **props))
+    assert res.status_code == 201, res.get_json()
+    return res.get_json()["id"]
+
+def add_list(client, headers, name="list", public=False):
+    res = client.post("/lists", headers=headers, json={
+        "name": name, "description": "d", "public": public})
+    assert res.status_code == 201, res.get_json()
+    return res.get_json()["id"]
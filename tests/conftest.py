@@ -0,0 +1,45 @@
+import itertools
+import pytest
+
+_subs = itertools.count()
+
+
+@pytest.fixture(scope="session")
+def api(tmp_path_factory):
+    """
+    The app on the memory engine with tokens signed by a local key set, as
+    in benchmarks.loadtest. Returns (app, models.model, signer).
+    """
+    pytest.importorskip("config.config",
+                        reason="config/config.py is required, see README")
+    from benchmarks.loadtest import build_app
+    return build_app("memory", str(tmp_path_factory.mktemp("db") / "test.db"))
+
+
+@pytest.fixture
+def client(api):
+    app, model, _ = api
+    model.engine.clear()
+    return app.test_client()
+
+
+@pytest.fixture
+def make_user(api):
+    """
+    Return a function adding a new user and returning its request headers.
+    Every test works on its own users, so tests do not see each other's
+    tasks and lists.
+    """
+    _, model, signer = api
+
+    def make():
+        sub = f"test-user-{next(_subs)}"
+        model.add_user({'user_id': sub, 'name': sub})
+        return {"Authorization": "Bearer " + signer.token(sub),
+                "Accept": "application/json"}
+    return make
+
+
+@pytest.fixture
+def headers(make_user):
+    return make_user()
@@ -0,0 +1,62 @@
+from tests.api import add_task, add_list
+
+
+def batch(client, headers, *operations):
+    res = client.post("/tasks:batch", headers=headers,
+                      json={"operations": list(operations)})
+    assert res.status_code == 200, res.get_json()
+    return res.get_json()["results"]
+
+def test_operations_are_applied_in_order(client, headers):
+    task_id = add_task(client, headers, name="before")
+    created, updated, deleted, gone = batch(
+        client, headers,
+        {"op": "create", "task": {"name": "new", "description": "d",
+                                  "due_date": "2024-02-01"}},
+        {"op": "update", "id": task_id, "task": {"name": "after"}},
+        {"op": "delete", "id": task_id},
+        {"op": "update", "id": task_id, "task": {"name": "too late"}})
+    assert created["status"] == 201
+    assert created["task"]["due_date"] == "2024-02-01"
+    assert updated["status"] == 200
+    assert updated["task"]["name"] == "after"
+    assert deleted == {"index": 2, "status": 204}
+    assert gone["status"] == 404
+    assert gone["error"]["code"] == "invalid_id"
+    assert client.get(f"/tasks/{task_id}", headers=headers).status_code == 404
+    task = client.get(f"/tasks/{created['task']['id']}", headers=headers)
+    assert task.get_json()["name"] == "new"
+
+def test_failed_operations_do_not_fail_the_batch(client, headers, make_user):
+    other_task = add_task(client, make_user())
+    results = batch(
+        client, headers,
+        {"op": "rename"},
+        {"op": "update", "id": "1", "task": {}},
+        {"op": "create", "task": {"name": "no description"}},
+        {"op": "update", "id": other_task, "task": {"name": "mine"}},
+        {"op": "delete", "id": 999999})
+    assert [(r["index"], r["status"], r["error"]["code"]) for r in results] \
+        == [(0, 400, "invalid_operation"), (1, 400, "invalid_id"),
+            (2, 400, "required_property_missing"), (3, 403, "forbidden"),
+            (4, 404, "invalid_id")]
+    assert client.get(f"/tasks/{other_task}",
+                      headers=headers).status_code == 403
+
+def test_invalid_batches(client, headers):
+    for body in ({}, {"operations": []}, {"operations": "create"},
+                 {"operations": [{"op": "delete", "id": 1}] * 1000}):
+        res = client.post("/tasks:batch", headers=headers, json=body)
+        assert res.status_code == 400
+
+def test_batch_updates_the_lists_of_the_tasks(client, headers):
+    list_id = add_list(client, headers, public=True)
+    renamed, deleted = add_task(client, headers), add_task(client, headers)
+    for task_id in (renamed, deleted):
+        client.patch(f"/lists/{list_id}/tasks/{task_id}", headers=headers)
+    batch(client, headers,
+          {"op": "update", "id": renamed, "task": {"name": "renamed"}},
+          {"op": "delete", "id": deleted})
+    tasks = client.get(f"/lists/{list_id}/tasks", headers={
+        "Accept": "application/json"}).get_json()["tasks"]
+    assert [(t["id"], t["name"]) for t in tasks] == [(renamed, "renamed")]
@@ -0,0 +1,54 @@
+import pytest
+
+from tests.api import add_task, add_list
+
+
+@pytest.mark.parametrize("kind", ["tasks", "lists"])
+def test_if_none_match(client, headers, kind):
+    id = (add_task if kind == "tasks" else add_list)(client, headers)
+    res = client.get(f"/{kind}/{id}", headers=headers)
+    etag = res.headers["ETag"]
+    res = client.get(f"/{kind}/{id}",
+                     headers=dict(headers, **{"If-None-Match": etag}))
+    assert res.status_code == 304
+    assert res.headers["ETag"] == etag
+    client.patch(f"/{kind}/{id}", headers=headers, json={"name": "renamed"})
+    res = client.get(f"/{kind}/{id}",
+                     headers=dict(headers, **{"If-None-Match": etag}))
+    assert res.status_code == 200
+    assert res.headers["ETag"] != etag
+
+@pytest.mark.parametrize("kind", ["tasks", "lists"])
+def test_if_match(client, headers, kind):
+    id = (add_task if kind == "tasks" else add_list)(client, headers)
+    etag = client.get(f"/{kind}/{id}", headers=headers).headers["ETag"]
+    res = client.patch(f"/{kind}/{id}", json={"name": "first"},
+                       headers=dict(headers, **{"If-Match": etag}))
+    assert res.status_code == 200
+    new_etag = res.headers["ETag"]
+    for method in (client.patch, client.delete):
+        res = method(f"/{kind}/{id}", json={"name": "second"},
+                     headers=dict(headers, **{"If-Match": etag}))
+        assert res.status_code == 412
+    assert client.get(f"/{kind}/{id}", headers=headers).get_json()[
+        "name"] == "first"
+    res = client.delete(f"/{kind}/{id}",
+                        headers=dict(headers, **{"If-Match": new_etag}))
+    assert res.status_code == 204
+    assert client.get(f"/{kind}/{id}", headers=headers).status_code == 404
+
+def test_list_delete_checks_the_version_in_its_transaction(
+        api, client, headers, monkeypatch):
+    _, model, _ = api
+    list_id, task_id = add_list(client, headers), add_task(client, headers)
+    client.patch(f"/lists/{list_id}/tasks/{task_id}", headers=headers)
+    etag = client.get(f"/lists/{list_id}", headers=headers).headers["ETag"]
+    check_version = model.check_version
+    def check_in_transaction(entity, if_match):
+        assert model.engine.in_transaction()
+        check_version(entity, if_match)
+    monkeypatch.setattr(model, "check_version", check_in_transaction)
+    res = client.delete(f"/lists/{list_id}",
+                        headers=dict(headers, **{"If-Match": etag}))
+    assert res.status_code == 204
+    assert client.get(f"/tasks/{task_id}", headers=headers).status_code == 404
@@ -0,0 +1,61 @@
+import pytest
+
+datastore = pytest.importorskip("google.cloud.datastore")
+from google.auth.credentials import AnonymousCredentials
+from google.cloud.datastore_v1.types import datastore as datastore_pb
+from google.cloud.datastore_v1.types import entity as entity_pb
+from google.cloud.datastore_v1.types import query as query_pb
+from models.storage.datastore_engine import DatastoreEngine
+
+MORE_RESULTS = query_pb.QueryResultBatch.MoreResultsType
+
+
+class FakeApi:
+    """
+    Answers runQuery with the given (ids, more_results, end_cursor)
+    batches and records the requests.
+    """
+
+    def __init__(self, *batches):
+        self.batches = list(batches)
+        self.requests = []
+
+    def run_query(self, request, **kwargs):
+        self.requests.append(request)
+        ids, more_results, end_cursor = self.batches.pop(0)
+        results = [query_pb.EntityResult(entity=entity_pb.Entity(
+            key=entity_pb.Key(
+                partition_id=entity_pb.PartitionId(project_id="test"),
+                path=[entity_pb.Key.PathElement(kind="tasks", id=i)])))
+            for i in ids]
+        return datastore_pb.RunQueryResponse(batch=query_pb.QueryResultBatch(
+            entity_results=results, more_results=more_results,
+            end_cursor=end_cursor,
+            entity_result_type=query_pb.EntityResult.ResultType.FULL))
+
+
+def engine(api):
+    client = datastore.Client(project="test",
+                              credentials=AnonymousCredentials())
+    client._datastore_api_internal = api
+    return DatastoreEngine(client)
+
+
+def test_short_batches_are_read_up_to_the_limit():
+    api = FakeApi(([1, 2], MORE_RESULTS.NOT_FINISHED, b"first"),
+                  ([3, 4, 5], MORE_RESULTS.MORE_RESULTS_AFTER_LIMIT, b"second"))
+    entities, cursor = engine(api).query("tasks", limit=5)
+    assert [e.key.id for e in entities] == [1, 2, 3, 4, 5]
+    assert [r["query"].limit for r in api.requests] == [5, 3]
+    assert cursor == "c2Vjb25k"
+
+def test_no_cursor_after_the_last_results():
+    api = FakeApi(([1, 2], MORE_RESULTS.NOT_FINISHED, b"first"),
+                  ([3], MORE_RESULTS.NO_MORE_RESULTS, b"second"))
+    entities, cursor = engine(api).query("tasks", limit=5)
+    assert [e.key.id for e in entities] == [1, 2, 3]
+    assert cursor is None
+
+def test_empty_page_has_no_cursor():
+    api = FakeApi(([], MORE_RESULTS.MORE_RESULTS_AFTER_LIMIT, b"end"))
+    assert engine(api).query("tasks", limit=5) == ([], None)
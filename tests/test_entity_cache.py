@@ -0,0 +1,118 @@
+import copy
+import pytest
+from helper.shared_cache import SharedCache
+from models.entity_cache import CachedEngine
+from models.storage import create_engine
+
+
+class FakeClient:
+    """
+    In-process stand-in of a memcached or redis client. Calls raise
+    OSError while 'down' is set.
+    """
+
+    def __init__(self):
+        self.values = {}
+        self.down = False
+
+    def _check(self):
+        if self.down:
+            raise OSError("connection refused")
+
+    def get(self, key):
+        self._check()
+        return self.values.get(key)
+
+    def set(self, key, value, ttl):
+        self._check()
+        self.values[key] = value
+
+    def add(self, key, value, ttl):
+        self._check()
+        if key in self.values:
+            return False
+        self.values[key] = value
+        return True
+
+    def delete(self, key):
+        self._check()
+        self.values.pop(key, None)
+
+
+@pytest.fixture
+def client():
+    return FakeClient()
+
+
+@pytest.fixture
+def instances(client):
+    """
+    Two instances on the same storage with their own local tier and a
+    shared tier on the same server.
+    """
+    engine = create_engine("memory")
+    task = engine.entity(engine.key("tasks", 1))
+    task.update(name="old")
+    engine.put(task)
+    return [CachedEngine(engine, SharedCache(client, retry_interval=0),
+                         local_ttl=0) for _ in range(2)]
+
+
+def test_read_before_a_write_is_not_cached(instances):
+    a, b = instances
+    key = a.key("tasks", 1)
+    # a reads the entity, b writes it, then a's read fills the cache.
+    generation = a._generation
+    old = copy.deepcopy(a.engine.get(key))
+    task = b.get(key)
+    task['name'] = "new"
+    b.put(task)
+    a._fill([old], generation)
+    assert a.get(key)['name'] == "new"
+    assert b.get(key)['name'] == "new"
+
+def test_reads_after_a_write_fill_the_shared_tier_again(instances, client):
+    a, b = instances
+    key = a.key("tasks", 1)
+    task = a.get(key)
+    task['name'] = "new"
+    a.put(task)
+    # The marker of the write keeps the key out of the shared tier.
+    assert b.get(key)['name'] == "new"
+    assert b.stats()["shared"]["hits"] == 0
+    client.values.clear()
+    b.get(key)
+    assert a.get(key)['name'] == "new"
+    assert a.stats()["shared"]["hits"] == 1
+
+def test_failed_invalidations_are_sent_again(client):
+    shared = SharedCache(client, retry_interval=0)
+    shared.add("k", b"old", 60)
+    client.down = True
+    shared.delete("k")
+    client.down = False
+    # The old value is neither read nor kept until the delete went through.
+    assert shared.get("k") is None
+    assert "k" not in client.values
+    assert shared.add("k", b"new", 60)
+    assert shared.get("k") == b"new"
+
+def test_failed_invalidations_skip_the_server(client):
+    shared = SharedCache(client, retry_interval=60)
+    shared.add("k", b"old", 60)
+    client.down = True
+    shared.invalidate("k", b"-", 10)
+    client.down = False
+    assert shared.get("k") is None
+    assert not shared.add("k", b"new", 60)
+    assert client.values["k"] == b"old"
+
+def test_too_many_failed_invalidations_skip_the_server(client):
+    shared = SharedCache(client, retry_interval=0, max_pending=2)
+    shared.add("k", b"old", 60)
+    client.down = True
+    for key in ("a", "b", "k"):
+        shared.delete(key)
+    client.down = False
+    assert shared.get("k") is None
+    assert client.values["k"] == b"old"
@@ -0,0 +1,66 @@
+import gzip
+import json
+
+from tests.api import add_task, add_list
+
+NDJSON = "application/x-ndjson"
+
+
+def export(client, headers, **extra):
+    res = client.get("/export", headers=dict(headers, Accept=NDJSON, **extra))
+    assert res.status_code == 200
+    assert res.mimetype == NDJSON
+    return res.data
+
+def comparable(body):
+    # Ids, owners and versions are those of the importing user.
+    records = []
+    for line in body.decode().splitlines():
+        record = json.loads(line)
+        for p in ("id", "owner", "version", "updated_at"):
+            record.pop(p)
+        if record.get("task_list"):
+            record["task_list"].pop("id")
+        records.append(record)
+    return records
+
+def test_export_import_round_trip(client, headers, make_user):
+    list_id = add_list(client, headers, name="trip", public=True)
+    listed = add_task(client, headers, name="listed", due_date="2024-03-01")
+    client.patch(f"/lists/{list_id}/tasks/{listed}", headers=headers)
+    add_task(client, headers, name="unlisted", completed=True)
+    body = export(client, headers)
+
+    other = make_user()
+    res = client.post("/import", data=body,
+                      headers=dict(other, **{"Content-Type": NDJSON}))
+    assert res.status_code == 200
+    assert res.get_json()["inserted"] == {"lists": 1, "tasks": 2}
+    assert res.get_json()["rejected"] == 0
+    imported = export(client, other)
+    assert comparable(imported) == comparable(body)
+
+    # The tasks of the imported list are its members.
+    list_record, *_ = [json.loads(line) for line in imported.splitlines()]
+    tasks = client.get(f"/lists/{list_record['id']}/tasks",
+                       headers=other).get_json()["tasks"]
+    assert [t["name"] for t in tasks] == ["listed"]
+
+def test_gzipped_round_trip(client, headers, make_user):
+    add_task(client, headers, name="zipped")
+    res = client.get("/export", headers=dict(
+        headers, Accept=NDJSON, **{"Accept-Encoding": "gzip"}))
+    assert res.headers["Content-Encoding"] == "gzip"
+    body = res.data
+    other = make_user()
+    res = client.post("/import", data=body, headers=dict(other, **{
+        "Content-Type": NDJSON, "Content-Encoding": "gzip"}))
+    assert res.get_json()["inserted"] == {"lists": 0, "tasks": 1}
+    assert comparable(export(client, other)) == \
+        comparable(gzip.decompress(body))
+
+def test_media_types(client, headers):
+    assert client.get("/export", headers=headers).status_code == 406
+    res = client.post("/import", data="{}", headers=dict(
+        headers, **{"Content-Type": "application/json"}))
+    assert res.status_code == 415
@@ -0,0 +1,24 @@
+from models.instrumentation import RequestStats
+
+
+def test_server_timing_pluralizes_counts():
+    stats = RequestStats()
+    stats.record('read', 0.001)
+    for _ in range(2):
+        stats.record('query', 0.002)
+    stats.record_cache(1, 2)
+    assert stats.server_timing() == (
+        'ds-read;dur=1.00;desc="1 read", '
+        'ds-query;dur=4.00;desc="2 queries", '
+        'cache;desc="1 hit, 2 misses"')
+
+def test_server_timing_singular_counts():
+    stats = RequestStats()
+    stats.record('query', 0.001)
+    stats.record('write', 0.001)
+    stats.record('write', 0.001)
+    stats.record_cache(2, 1)
+    assert stats.server_timing() == (
+        'ds-write;dur=2.00;desc="2 writes", '
+        'ds-query;dur=1.00;desc="1 query", '
+        'cache;desc="2 hits, 1 miss"')
@@ -0,0 +1,46 @@
+import pytest
+
+from tests.api import add_task, add_list
+
+
+@pytest.fixture
+def run_now(api, monkeypatch):
+    # Delete the tasks of lists above 2 tasks with a job run right away.
+    _, model, _ = api
+    monkeypatch.setattr(model, "ASYNC_DELETE_THRESHOLD", 2)
+    monkeypatch.setattr(model.background, "submit",
+                        lambda func, *args: func(*args))
+
+def test_delete_a_large_list_with_a_job(run_now, client, headers, make_user):
+    list_id = add_list(client, headers)
+    task_ids = [add_task(client, headers) for _ in range(3)]
+    for task_id in task_ids:
+        client.patch(f"/lists/{list_id}/tasks/{task_id}", headers=headers)
+    res = client.delete(f"/lists/{list_id}", headers=headers)
+    assert res.status_code == 202
+    job = res.get_json()
+    assert res.headers["Location"].endswith(f"/jobs/{job['id']}")
+    assert job["type"] == "delete_list_tasks"
+    assert job["target"] == {"list_id": list_id}
+    # The total counts the tasks, not their memberships.
+    assert job["total"] == 3
+
+    res = client.get(f"/jobs/{job['id']}", headers=headers)
+    assert res.status_code == 200
+    job = res.get_json()
+    assert job["status"] == "done"
+    assert job["processed"] == job["total"] == 3
+    for task_id in task_ids:
+        assert client.get(f"/tasks/{task_id}",
+                          headers=headers).status_code == 404
+    assert client.get(f"/jobs/{job['id']}",
+                      headers=make_user()).status_code == 403
+    assert client.get("/jobs/999999", headers=headers).status_code == 404
+
+def test_small_lists_are_deleted_right_away(run_now, client, headers):
+    list_id = add_list(client, headers)
+    task_id = add_task(client, headers)
+    client.patch(f"/lists/{list_id}/tasks/{task_id}", headers=headers)
+    res = client.delete(f"/lists/{list_id}", headers=headers)
+    assert res.status_code == 204
+    assert client.get(f"/tasks/{task_id}", headers=headers).status_code == 404
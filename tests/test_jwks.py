@@ -0,0 +1,108 @@
+import json
+import pytest
+from validations.jwks import JWKSKeyStore, JWKSError, file_fetcher
+
+
+def write_jwks(path, *kids):
+    keys = [{"kty": "RSA", "kid": kid, "use": "sig", "n": "n-" + kid,
+             "e": "AQAB"} for kid in kids]
+    path.write_text(json.dumps({"keys": keys}))
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def jwks(tmp_path):
+    path = tmp_path / "jwks.json"
+    write_jwks(path, "a")
+    return path
+
+
+def counting(fetcher):
+    def fetch():
+        fetch.calls += 1
+        return fetcher()
+    fetch.calls = 0
+    return fetch
+
+
+def test_key_set_is_cached_for_ttl(jwks):
+    clock = Clock()
+    fetch = counting(file_fetcher(jwks))
+    store = JWKSKeyStore(fetch, ttl=60, min_refresh_interval=10, clock=clock)
+    assert store.get_key("a")["n"] == "n-a"
+    clock.now += 59
+    assert store.get_key("a")["n"] == "n-a"
+    assert fetch.calls == 1
+
+    write_jwks(jwks, "b")
+    clock.now += 1
+    assert store.get_key("b")["n"] == "n-b"
+    assert fetch.calls == 2
+
+def test_unknown_kid_refreshes_at_most_once_per_interval(jwks):
+    clock = Clock()
+    fetch = counting(file_fetcher(jwks))
+    store = JWKSKeyStore(fetch, ttl=3600, min_refresh_interval=10,
+                         clock=clock)
+    store.prime()
+    write_jwks(jwks, "a", "b")
+    # The key set was just fetched, so the unknown kid does not refresh it.
+    assert store.get_key("b") is None
+    assert fetch.calls == 1
+
+    clock.now += 10
+    assert store.get_key("b")["n"] == "n-b"
+    assert fetch.calls == 2
+    for _ in range(5):
+        assert store.get_key("forged") is None
+    assert fetch.calls == 2
+
+def test_stale_keys_are_served_when_refresh_fails(jwks, tmp_path):
+    clock = Clock()
+    store = JWKSKeyStore(file_fetcher(jwks), ttl=60, min_refresh_interval=10,
+                         clock=clock)
+    store.prime()
+    fetch = counting(file_fetcher(tmp_path / "missing.json"))
+    store._fetcher = fetch
+    clock.now += 60
+    assert store.get_key("a")["n"] == "n-a"
+    assert fetch.calls == 1
+    # The failed refresh is retried after min_refresh_interval.
+    clock.now += 9
+    assert store.get_key("a")["n"] == "n-a"
+    assert fetch.calls == 1
+    clock.now += 1
+    assert store.get_key("a")["n"] == "n-a"
+    assert fetch.calls == 2
+
+def test_missing_key_set_raises(tmp_path):
+    store = JWKSKeyStore(file_fetcher(tmp_path / "missing.json"))
+    with pytest.raises(JWKSError):
+        store.get_key("a")
+
+def test_set_fetcher_drops_cached_keys(jwks, tmp_path):
+    store = JWKSKeyStore(file_fetcher(jwks), clock=Clock())
+    assert store.get_key("a") is not None
+    other = tmp_path / "other.json"
+    write_jwks(other, "b")
+    store.set_fetcher(file_fetcher(other))
+    assert store.get_key("a") is None
+    assert store.get_key("b")["n"] == "n-b"
+
+def test_only_rsa_keys_with_kid_are_indexed(tmp_path):
+    path = tmp_path / "jwks.json"
+    path.write_text(json.dumps({"keys": [
+        {"kty": "EC", "kid": "ec", "crv": "P-256", "x": "x", "y": "y"},
+        {"kty": "RSA", "n": "n", "e": "AQAB"},
+        {"kty": "RSA", "kid": "rsa", "n": "n", "e": "AQAB"}
+    ]}))
+    store = JWKSKeyStore(file_fetcher(path), clock=Clock())
+    store.prime()
+    assert list(store._keys) == ["rsa"]
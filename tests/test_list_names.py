@@ -0,0 +1,43 @@
+from tests.api import add_list
+from tests.test_migrations import put
+
+
+def test_list_names_are_unique_per_user(client, headers, make_user):
+    add_list(client, headers, name="groceries")
+    res = client.post("/lists", headers=headers, json={
+        "name": "groceries", "description": "d", "public": False})
+    assert res.status_code == 403
+    assert res.get_json()["code"] == "list_name_not_unique"
+    # Other users may use the same name.
+    add_list(client, make_user(), name="groceries")
+
+def test_rename_moves_the_claim(client, headers):
+    list_id = add_list(client, headers, name="old name")
+    add_list(client, headers, name="taken")
+    res = client.patch(f"/lists/{list_id}", headers=headers,
+                       json={"name": "taken"})
+    assert res.get_json()["code"] == "list_name_not_unique"
+    res = client.patch(f"/lists/{list_id}", headers=headers,
+                       json={"name": "new name"})
+    assert res.status_code == 200, res.get_json()
+    add_list(client, headers, name="old name")
+    res = client.post("/lists", headers=headers, json={
+        "name": "new name", "description": "d", "public": False})
+    assert res.get_json()["code"] == "list_name_not_unique"
+
+def test_delete_releases_the_name(client, headers):
+    list_id = add_list(client, headers, name="short lived")
+    res = client.delete(f"/lists/{list_id}", headers=headers)
+    assert res.status_code in (200, 204), res.get_json()
+    add_list(client, headers, name="short lived")
+
+def test_backfill_list_names(api):
+    _, model, _ = api
+    for i in range(5):
+        put(model, "lists", name=f"unclaimed {i % 3}", owner="backfill-names",
+            public=False)
+    # Lists of other tests are claimed as well.
+    assert model.backfill_list_names(batch_size=2) >= 3
+    for i in range(3):
+        key = model.list_name_key("backfill-names", f"unclaimed {i}")
+        assert model.engine.get(key)["owner"] == "backfill-names"
@@ -0,0 +1,37 @@
+from tests.api import add_task, add_list
+
+
+def test_add_and_remove_a_task(api, client, headers):
+    _, model, _ = api
+    task_id, list_id = add_task(client, headers), add_list(client, headers)
+    model.engine.engine.start()
+    res = client.patch(f"/lists/{list_id}/tasks/{task_id}", headers=headers)
+    # The task and the list are read together.
+    assert model.engine.engine.stop()["get_multi"] == 1
+    assert res.status_code == 204
+    task = client.get(f"/tasks/{task_id}", headers=headers).get_json()
+    assert task["task_list"]["id"] == list_id
+    res = client.get(f"/lists/{list_id}/tasks", headers=headers).get_json()
+    assert [t["id"] for t in res["tasks"]] == [task_id]
+
+    res = client.patch(f"/lists/{list_id}/tasks/{task_id}", headers=headers)
+    assert res.status_code == 403
+    assert res.get_json()["code"] == "task_list_not_empty"
+    res = client.delete(f"/lists/{list_id}/tasks/{task_id}", headers=headers)
+    assert res.status_code == 204
+    res = client.delete(f"/lists/{list_id}/tasks/{task_id}", headers=headers)
+    assert res.get_json()["code"] == "task_list_empty"
+    assert client.get(f"/lists/{list_id}/tasks",
+                      headers=headers).get_json()["tasks"] == []
+
+def test_tasks_and_lists_of_other_users(client, headers, make_user):
+    other = make_user()
+    task_id, list_id = add_task(client, headers), add_list(client, headers)
+    other_task, other_list = add_task(client, other), add_list(client, other)
+    for url in (f"/lists/{other_list}/tasks/{task_id}",
+                f"/lists/{list_id}/tasks/{other_task}"):
+        assert client.patch(url, headers=headers).status_code == 403
+    assert client.patch(f"/lists/{list_id}/tasks/999999",
+                        headers=headers).status_code == 404
+    assert client.patch(f"/lists/999999/tasks/{task_id}",
+                        headers=headers).status_code == 404
@@ -0,0 +1,84 @@
+from datetime import datetime, timezone
+
+STAMP = datetime(2020, 1, 1, tzinfo=timezone.utc)
+
+
+def put(model, entity_kind, **props):
+    entity = model.engine.entity(model.engine.key(entity_kind))
+    entity.update(props)
+    model.engine.put(entity)
+    return entity
+
+
+def test_migrate_list_tasks(api):
+    _, model, _ = api
+    mine = put(model, "tasks", name="mine", owner="migrating-owner")
+    other = put(model, "tasks", name="other", owner="someone-else")
+    task_lists = [put(model, "lists", name=f"old {i}", owner="migrating-owner",
+                      public=False, version=3, updated_at=STAMP,
+                      tasks=[{'id': mine.key.id}, {'id': other.key.id},
+                             {'id': "x"}, "junk"])
+                  for i in range(3)]
+    assert model.migrate_list_tasks(batch_size=2) == 3
+    for task_list in task_lists:
+        migrated = model.engine.get(task_list.key)
+        assert 'tasks' not in migrated
+        assert migrated['version'] == 4
+        assert migrated['updated_at'] > STAMP
+        members, _ = model.engine.query("list_tasks",
+                                        ancestor=task_list.key)
+        assert [m.key.id for m in members] == [mine.key.id]
+    assert model.migrate_list_tasks() == 0
+
+def test_migrate_user_keys_merges_duplicates_across_batches(api):
+    _, model, _ = api
+    old_users = [put(model, "users", user_id=f"numeric-user-{i % 2}",
+                     name=f"copy {i}") for i in range(5)]
+    assert model.migrate_user_keys(batch_size=2) == 5
+    for old_user in old_users:
+        assert model.engine.get(old_user.key) is None
+    for i in range(2):
+        user = model.engine.get(model.user_key(f"numeric-user-{i}"))
+        assert user['name'] == f"copy {i}"
+    assert model.migrate_user_keys() == 0
+
+def test_migrate_user_keys_keeps_existing_users(api):
+    _, model, _ = api
+    model.add_user({'user_id': "numeric-user-existing", 'name': "current"})
+    put(model, "users", user_id="numeric-user-existing", name="old")
+    assert model.migrate_user_keys() == 1
+    user = model.engine.get(model.user_key("numeric-user-existing"))
+    assert user['name'] == "current"
+
+def test_backfill_updated_at(api):
+    _, model, _ = api
+    old = [put(model, "tasks", name="unstamped", owner="backfill-owner")
+           for _ in range(3)]
+    # Entities of other tests may be stamped as well.
+    assert model.backfill_updated_at(batch_size=2) >= 3
+    for task in old:
+        assert model.engine.get(task.key)['updated_at'] > STAMP
+    assert model.backfill_updated_at() == 0
+
+def test_prune_tombstones(api):
+    _, model, _ = api
+    old = [put(model, "tombstones", owner="pruning-owner", kind="tasks", id=i,
+               updated_at=STAMP) for i in range(5)]
+    recent = put(model, "tombstones", owner="pruning-owner", kind="tasks",
+                 id=9, updated_at=datetime.now(timezone.utc))
+    assert model.prune_tombstones(batch_size=2) >= 5
+    assert model.engine.get_multi([t.key for t in old]) == []
+    assert model.engine.get(recent.key) is not None
+
+def test_migrate_due_dates(api):
+    _, model, _ = api
+    old = [put(model, "tasks", name="old", owner="due-owner",
+               due_date=f"2020-01-0{i + 1}") for i in range(3)]
+    current = put(model, "tasks", name="current", owner="due-owner",
+                  due_date=STAMP)
+    assert model.migrate_due_dates(batch_size=2) == 3
+    for i, task in enumerate(old):
+        assert model.engine.get(task.key)['due_date'] == datetime(
+            2020, 1, i + 1, tzinfo=timezone.utc)
+    assert model.engine.get(current.key)['due_date'] == STAMP
+    assert model.migrate_due_dates() == 0
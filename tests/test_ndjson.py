@@ -0,0 +1,65 @@
+import gzip
+import io
+import json
+import zlib
+from datetime import datetime, timezone
+from helper.ndjson import iter_ndjson, ndjson_stream
+
+
+def parse(data, **kwargs):
+    return list(iter_ndjson(io.BytesIO(data), **kwargs))
+
+
+def test_lines_are_numbered_and_blank_lines_skipped():
+    data = b'{"a": 1}\n\n  \n{"b": 2}\n'
+    assert parse(data) == [(1, {"a": 1}), (4, {"b": 2})]
+
+def test_last_line_without_newline_is_parsed():
+    assert parse(b'{"a": 1}\n{"b": 2}') == [(1, {"a": 1}), (2, {"b": 2})]
+
+def test_invalid_json_lines_are_none():
+    data = b'{"a": 1}\nnot json\n{"b": \n[1]\n'
+    assert parse(data) == [(1, {"a": 1}), (2, None), (3, None), (4, [1])]
+
+def test_lines_split_across_reads():
+    data = b'{"name": "a long enough line"}\n' * 3
+    assert parse(data, read_size=4) == \
+        [(n, {"name": "a long enough line"}) for n in (1, 2, 3)]
+
+def test_too_long_lines_are_none():
+    long_line = json.dumps({"x": "y" * 100}).encode()
+    data = b'{"a": 1}\n' + long_line + b'\n{"b": 2}\n' + long_line
+    assert parse(data, read_size=8, max_line_length=50) == \
+        [(1, {"a": 1}), (2, None), (3, {"b": 2}), (4, None)]
+
+def test_gzipped_stream():
+    data = gzip.compress(b'{"a": 1}\n{"b": 2}\n')
+    assert parse(data, gzipped=True, read_size=5) == \
+        [(1, {"a": 1}), (2, {"b": 2})]
+
+def test_corrupted_gzip_stream_ends_with_none():
+    data = gzip.compress(b'{"a": 1}\n' * 100)
+    data = data[:20] + b"\x00" * 10 + data[30:]
+    records = parse(data, gzipped=True)
+    assert records[-1][1] is None
+    assert all(value == {"a": 1} for _, value in records[:-1])
+
+def test_stream_round_trip():
+    records = [{"kind": "tasks", "id": i, "name": f"task {i}"}
+               for i in range(50)]
+    for gzipped in (False, True):
+        data = b"".join(ndjson_stream(iter(records), gzipped, chunk_size=64))
+        assert [r for _, r in parse(data, gzipped=gzipped)] == records
+
+def test_stream_chunks_are_decompressible_as_received():
+    records = [{"id": i} for i in range(50)]
+    chunks = list(ndjson_stream(iter(records), gzipped=True, chunk_size=64))
+    assert len(chunks) > 1
+    decompressor = zlib.decompressobj(wbits=31)
+    first = decompressor.decompress(chunks[0])
+    assert first.startswith(b'{"id": 0}\n') and first.endswith(b"\n")
+
+def test_datetimes_keep_microseconds():
+    when = datetime(2024, 1, 1, 12, 0, 0, 123456, tzinfo=timezone.utc)
+    data = b"".join(ndjson_stream([{"updated_at": when}]))
+    assert parse(data) == [(1, {"updated_at": when.isoformat()})]
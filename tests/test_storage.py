@@ -0,0 +1,155 @@
+import random
+from datetime import datetime, timedelta, timezone
+import pytest
+from models.storage import create_engine, InvalidCursor
+
+BASE = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+# Queries the models run, checked for the same results on every local
+# engine: (kind, filters, ancestor id of a list, order).
+QUERIES = [
+    ("tasks", [], None, ['__key__']),
+    ("tasks", [('owner', '=', 'u1')], None, ['__key__']),
+    ("tasks", [('owner', '=', 'u1'), ('completed', '=', False)], None,
+     ['due_date']),
+    ("tasks", [('owner', '=', 'u2')], None, ['-due_date']),
+    ("tasks", [('owner', '=', 'u1'), ('due_date', '>=', BASE),
+               ('due_date', '<', BASE + timedelta(days=5))], None,
+     ['due_date']),
+    ("tasks", [('task_list.id', '=', 1)], None, ['__key__']),
+    ("tasks", [('owner', 'IN', ['u2', 'u3'])], None, ['name']),
+    ("tasks", [('completed', '!=', True)], None, ['-updated_at']),
+    ("tasks", [('owner', '=', 'u1')], None, ['updated_at']),
+    ("lists", [('public', '=', True)], None, ['name']),
+    ("lists", [('owner', '=', 'u1')], None, ['-name']),
+    ("list_tasks", [], 1, ['__key__']),
+    ("list_tasks", [], 2, ['-__key__']),
+]
+
+
+def populate(engine):
+    rng = random.Random(0)
+    for i in range(1, 4):
+        task_list = engine.entity(engine.key("lists", i))
+        task_list.update(name=f"list {i}", owner=f"u{i % 2 + 1}",
+                         public=i != 2, description="d")
+        engine.put(task_list)
+    for i in range(1, 41):
+        task = engine.entity(engine.key("tasks", i))
+        task.update(
+            name=f"task {rng.randint(0, 9)}", owner=f"u{i % 3 + 1}",
+            completed=rng.random() < 0.5,
+            due_date=BASE + timedelta(days=rng.randint(-5, 10)),
+            # Updates at the same instant, like a batch write.
+            updated_at=BASE + timedelta(seconds=rng.randint(0, 5)),
+            version=1)
+        if i % 4:
+            task['task_list'] = {'id': i % 4}
+            member = engine.entity(engine.key(
+                "list_tasks", i, parent=engine.key("lists", i % 4)))
+            member.update(added_at=task['updated_at'])
+            engine.put(member)
+        engine.put(task)
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def engine(request, tmp_path):
+    engine = create_engine(request.param, str(tmp_path / "test.db"))
+    populate(engine)
+    return engine
+
+
+@pytest.fixture(scope="module")
+def reference():
+    engine = create_engine("memory")
+    populate(engine)
+    return engine
+
+
+def run(engine, kind, filters, ancestor, order, **kwargs):
+    if ancestor is not None:
+        ancestor = engine.key("lists", ancestor)
+    return engine.query(kind, filters=filters, ancestor=ancestor,
+                        order=order, **kwargs)
+
+def rows(entities):
+    return [(e.key.flat_path, dict(e)) for e in entities]
+
+def pages(engine, query, limit):
+    """
+    Return the entities of every page of the query.
+    """
+    entities, cursor = run(engine, *query, limit=limit)
+    result = list(entities)
+    while cursor is not None:
+        entities, cursor = run(engine, *query, limit=limit, cursor=cursor)
+        result += entities
+    return result
+
+
+@pytest.mark.parametrize("query", QUERIES)
+def test_query_results_match(engine, reference, query):
+    expected = rows(run(reference, *query)[0])
+    assert expected
+    assert rows(run(engine, *query)[0]) == expected
+    kind, filters, ancestor, _ = query
+    if ancestor is not None:
+        ancestor = engine.key("lists", ancestor)
+    assert engine.count(kind, filters, ancestor) == len(expected)
+
+@pytest.mark.parametrize("query", QUERIES)
+@pytest.mark.parametrize("limit", [1, 3, 7])
+def test_cursor_pages_cover_the_query(engine, reference, query, limit):
+    expected = rows(run(reference, *query)[0])
+    assert rows(pages(engine, query, limit)) == expected
+
+def test_limit_and_offset(engine, reference):
+    query = QUERIES[2]
+    expected = rows(run(reference, *query)[0])
+    entities, cursor = run(engine, *query, limit=3, offset=2)
+    assert rows(entities) == expected[2:5]
+    assert cursor is not None
+    entities, cursor = run(engine, *query, limit=100)
+    assert len(entities) == len(expected) and cursor is None
+
+def test_keys_only_and_projection(engine, reference):
+    query = QUERIES[1]
+    expected = run(reference, *query)[0]
+    keys = run(engine, *query, keys_only=True)[0]
+    assert [e.key for e in keys] == [e.key for e in expected]
+    assert all(dict(e) == {} for e in keys)
+    projected = run(engine, *query, projection=['name', 'completed'])[0]
+    assert [dict(e) for e in projected] == \
+        [{'name': e['name'], 'completed': e['completed']} for e in expected]
+
+def test_datetimes_round_trip(engine):
+    task = engine.get(engine.key("tasks", 1))
+    assert task['updated_at'].tzinfo is not None
+    assert engine.get(engine.key("tasks", 1)) == task
+
+def test_put_and_delete(engine):
+    note = engine.entity(engine.key("notes"))
+    note.update(name="new", owner="u9")
+    engine.put(note)
+    assert not note.key.is_partial
+    assert engine.query("notes", filters=[('owner', '=', 'u9')])[0] == [note]
+    assert engine.get_multi([engine.key("tasks", 1), note.key]) == \
+        [engine.get(engine.key("tasks", 1)), note]
+    engine.delete(note.key)
+    assert engine.get(note.key) is None
+    assert engine.get_multi([note.key]) == []
+
+@pytest.mark.parametrize("cursor", [
+    "not a cursor", "W10=", "WzEsIDJd",
+    # [{"$dt": "x"}] and [{"$dt": 1}, 2]
+    "W3siJGR0IjogIngifV0=", "W3siJGR0IjogMX0sIDJd"])
+def test_invalid_cursor(engine, cursor):
+    with pytest.raises(InvalidCursor):
+        engine.query("tasks", order=['due_date'], limit=3, cursor=cursor)
+
+@pytest.mark.parametrize("cursor", ["W3siJGR0IjogIngifV0=",
+                                    "W3siJGR0IjogMX0sIDJd"])
+def test_invalid_cursor_is_a_bad_request(client, headers, cursor):
+    res = client.get("/tasks?cursor=" + cursor, headers=headers)
+    assert res.status_code == 400
+    assert res.get_json()["code"] == "invalid_cursor"
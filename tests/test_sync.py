@@ -0,0 +1,66 @@
+import base64
+from datetime import datetime, timedelta, timezone
+import pytest
+from tests.api import add_task
+
+
+def token_time(token):
+    return datetime.fromisoformat(base64.urlsafe_b64decode(token).decode())
+
+
+@pytest.fixture
+def settled(api, monkeypatch):
+    """
+    No settle time, so that changes are returned as soon as they are made.
+    """
+    _, model, _ = api
+    monkeypatch.setattr(model, "SYNC_SETTLE_TIME", 0)
+
+
+def test_first_sync_returns_recent_changes(client, headers):
+    task_id = add_task(client, headers)
+    res = client.get("/sync", headers=headers).get_json()
+    assert [task["id"] for task in res["tasks"]] == [task_id]
+    assert res["more"] is False
+    # The token stays behind the settle time...
+    assert token_time(res["token"]) < datetime.now(timezone.utc) - \
+        timedelta(seconds=4)
+    # ...and changes within it are not returned by an incremental sync yet.
+    res = client.get("/sync?since=" + res["token"], headers=headers).get_json()
+    assert res["tasks"] == [] and res["more"] is False
+
+def test_incremental_sync_and_tombstones(client, headers, settled):
+    kept, deleted = add_task(client, headers), add_task(client, headers)
+    token = client.get("/sync", headers=headers).get_json()["token"]
+    res = client.get("/sync?since=" + token, headers=headers).get_json()
+    assert res["tasks"] == [] and res["deleted"] == []
+
+    client.patch(f"/tasks/{kept}", headers=headers, json={"completed": True})
+    client.delete(f"/tasks/{deleted}", headers=headers)
+    res = client.get("/sync?since=" + token, headers=headers).get_json()
+    assert [task["id"] for task in res["tasks"]] == [kept]
+    assert res["tasks"][0]["completed"] is True
+    assert res["deleted"] == [{"kind": "tasks", "id": deleted}]
+
+def test_pages_are_cut_before_ties(api, client, headers):
+    _, model, _ = api
+    task_ids = [add_task(client, headers, name=f"task {i}") for i in range(5)]
+    start = datetime.now(timezone.utc) - timedelta(hours=1)
+    stamps = [start, start + timedelta(seconds=1), start + timedelta(seconds=1),
+              start + timedelta(seconds=1), start + timedelta(seconds=2)]
+    for task_id, stamp in zip(task_ids, stamps):
+        task = model.engine.get(model.engine.key("tasks", task_id))
+        task['updated_at'] = stamp
+        model.engine.put(task)
+
+    pages = []
+    url = "/sync?limit=2"
+    while True:
+        res = client.get(url, headers=headers).get_json()
+        pages.append(sorted(task["id"] for task in res["tasks"]))
+        if not res["more"]:
+            break
+        url = res["next"]
+    # The first page is cut before the tie, and the tie is returned whole
+    # although it is longer than the limit.
+    assert pages == [task_ids[:1], task_ids[1:4], task_ids[4:]]
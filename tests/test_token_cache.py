@@ -0,0 +1,59 @@
+from validations.token_cache import VerifiedTokenCache
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_claims_are_cached_until_exp():
+    clock = Clock()
+    cache = VerifiedTokenCache(clock=clock)
+    claims = {"sub": "user", "exp": clock.now + 60}
+    cache.put("token", claims)
+    assert cache.get("token") == claims
+    clock.now += 60
+    assert cache.get("token") is None
+    assert cache.stats()["size"] == 0
+
+def test_tokens_without_valid_exp_are_not_cached():
+    clock = Clock()
+    cache = VerifiedTokenCache(clock=clock)
+    cache.put("no-exp", {"sub": "user"})
+    cache.put("text-exp", {"sub": "user", "exp": "2000"})
+    cache.put("expired", {"sub": "user", "exp": clock.now})
+    for token in ("no-exp", "text-exp", "expired"):
+        assert cache.get(token) is None
+    assert cache.stats()["size"] == 0
+
+def test_least_recently_used_token_is_evicted():
+    clock = Clock()
+    cache = VerifiedTokenCache(maxsize=2, clock=clock)
+    for token in ("a", "b"):
+        cache.put(token, {"sub": token, "exp": clock.now + 60})
+    assert cache.get("a") is not None
+    cache.put("c", {"sub": "c", "exp": clock.now + 60})
+    assert cache.get("b") is None
+    assert cache.get("a")["sub"] == "a"
+    assert cache.get("c")["sub"] == "c"
+
+def test_raw_tokens_are_not_kept():
+    cache = VerifiedTokenCache(clock=Clock())
+    cache.put("secret-token", {"exp": 2000})
+    assert all(isinstance(k, bytes) and b"secret" not in k
+               for k in cache._entries)
+
+def test_stats_count_hits_and_misses():
+    clock = Clock()
+    cache = VerifiedTokenCache(maxsize=10, clock=clock)
+    cache.get("a")
+    cache.put("a", {"exp": clock.now + 60})
+    cache.get("a")
+    cache.get("a")
+    assert cache.stats() == {"hits": 2, "misses": 1, "hit_ratio": 2 / 3,
+                             "size": 1, "maxsize": 10}
+    cache.clear()
+    assert cache.stats()["hits"] == 0
@@ -1,10 +1,9 @@
-import json
 from functools import wraps
-from urllib.request import urlopen
-from jose import jwt
-from flask import request, session
-from flask import make_response, _request_ctx_stack
+from flask import g, request
+from flask import make_response
 import models.model as model
+from validations.jwks import JWKSKeyStore, JWKSError, url_fetcher
+from validations.token_cache import VerifiedTokenCache
 from config.config import Config
 
 AUTH0_DOMAIN = Config.AUTH0_DOMAIN
@@ -12,6 +11,14 @@ API_AUDIENCE = Config.AUTH0_CLIENT_ID
 ALLOWED_ENDPOINTS = Config.AUTH_ALLOWED_ENDPOINTS
 ALGORITHMS = ["RS256"]
 
+# Process-wide cache of Auth0's signing keys. Use jwks_store.set_fetcher()
+# to verify tokens against another key set, e.g. a local jwks.json file.
+jwks_store = JWKSKeyStore(
+    url_fetcher("https://" + AUTH0_DOMAIN + "/.well-known/jwks.json"))
+
+# Verified claims of recently seen bearer tokens, see token_cache.stats().
+token_cache = VerifiedTokenCache()
+
 ########################### BEGIN CITED CODE ################################
 # The following code is not my own.                                         #
 # SOURCE: https://auth0.com/docs/quickstart/backend/python/01-authorization #
@@ -29,84 +36,97 @@ class AuthError(Exception):
 def handle_auth_error(err):  
     return make_response(err.error, err.status_code)
 
+def get_token(auth):
+    """
+    Return the token of a "Bearer <token>" authorization header. Malformed
+    headers are rejected here, before any key lookup or signature check.
+    """
+    parts = auth.split()
+    if len(parts) != 2 or parts[0].lower() != "bearer":
+        raise AuthError({"code": "invalid_header",
+                         "description": "Authorization header must be Bearer Token"}, 401)
+    token = parts[1]
+    # A JWS in compact serialization has exactly three segments.
+    if token.count(".") != 2:
+        raise AuthError({"code": "invalid_header",
+                         "description": "Unable to parse authentication token."}, 401)
+    return token
+
+def verify_token(token):
+    """
+    Verify the token's signature and claims, and return its payload.
+    Payloads of tokens that have been verified before are served from
+    token_cache until the token expires.
+    """
+    payload = token_cache.get(token)
+    if payload is not None:
+        return payload
+    # Imported on first use, it takes a good part of the app's start.
+    from jose import jwt
+    try:
+        unverified_header = jwt.get_unverified_header(token)
+    except Exception:
+        raise AuthError({"code": "invalid_header",
+                         "description": "Unable to parse authentication token."}, 401)
+    try:
+        rsa_key = jwks_store.get_key(unverified_header.get("kid"))
+    except JWKSError:
+        raise AuthError({"code": "jwks_unavailable",
+                         "description": "Unable to fetch the signing keys."}, 503)
+    if not rsa_key:
+        raise AuthError({"code": "invalid_header",
+                         "description": "Unable to find appropriate key"}, 401)
+    try:
+        payload = jwt.decode(
+            token,
+            rsa_key,
+            algorithms=ALGORITHMS,
+            audience=API_AUDIENCE,
+            issuer="https://" + AUTH0_DOMAIN + "/"
+        )
+    except jwt.ExpiredSignatureError:
+        raise AuthError({"code": "token_expired",
+                         "description": "token is expired"}, 401)
+    except jwt.JWTClaimsError:
+        raise AuthError({"code": "invalid_claims",
+                         "description": "incorrect claims, please check the audience and issuer"}, 401)
+    except Exception:
+        raise AuthError({"code": "invalid_header",
+                         "description": "Unable to parse authentication token."}, 401)
+    token_cache.put(token, payload)
+    return payload
+
+def warm_up():
+    """
+    Fetch the signing keys and import jose, so that the first token of an
+    instance is verified as fast as the next ones.
+    """
+    jwks_store.prime()
+    import jose.jwt
+
 def requires_auth(func):
     @wraps(func)
     def decorated(*args, **kwargs):
         auth = request.headers.get("Authorization", None)
-        if not auth:
-            if request.endpoint in ALLOWED_ENDPOINTS:
-                return func(*args, **kwargs)
-            raise AuthError({"code": "authorization_header_missing",
-                             "description": "Authorization header is expected"}, 401)
-        # Authorization must be in the "Bearer Token" format.
-        parts = auth.split()
-        if parts[0].lower() != "bearer":
-            if request.endpoint in ALLOWED_ENDPOINTS:
-                return func(*args, **kwargs)
-            raise AuthError({"code": "invalid_header",
-                             "description": "Authorization header must be Bearer Token"}, 401)
-        if len(parts) != 2:
-            if request.endpoint in ALLOWED_ENDPOINTS:
-                return func(*args, **kwargs)
-            raise AuthError({"code": "invalid_header",
-                             "description": "Authorization header must be Bearer Token"}, 401)        
-        token = parts[1]
-        jsonurl = urlopen("https://"+ AUTH0_DOMAIN + "/.well-known/jwks.json")
-        jwks = json.loads(jsonurl.read())
         try:
-            unverified_header = jwt.get_unverified_header(token)
-        except Exception:
-            if request.endpoint in ALLOWED_ENDPOINTS:
-                return func(*args, **kwargs)
-            raise AuthError({"code": "invalid_header",
-                             "description": "Unable to parse authentication token."}, 401)            
-        rsa_key = {}
-        for key in jwks["keys"]:
-            if key["kid"] == unverified_header["kid"]:
-                rsa_key = {
-                    "kty": key["kty"],
-                    "kid": key["kid"],
-                    "use": key["use"],
-                    "n": key["n"],
-                    "e": key["e"]
-                }
-        if rsa_key:
-            try:
-                payload = jwt.decode(
-                    token,
-                    rsa_key,
-                    algorithms=ALGORITHMS,
-                    audience=API_AUDIENCE,
-                    issuer="https://" + AUTH0_DOMAIN + "/"
-                )
-            except jwt.ExpiredSignatureError:
-                if request.endpoint in ALLOWED_ENDPOINTS:
-                    return func(*args, **kwargs)
-                raise AuthError({"code": "token_expired",
-                                 "description": "token is expired"}, 401)
-            except jwt.JWTClaimsError:
-                if request.endpoint in ALLOWED_ENDPOINTS:
-                    return func(*args, **kwargs)
-                raise AuthError({"code": "invalid_claims",
-                                 "description": "incorrect claims, please check the audience and issuer"}, 401)
-            except Exception:
-                if request.endpoint in ALLOWED_ENDPOINTS:
-                    return func(*args, **kwargs)
-                raise AuthError({"code": "invalid_header",
-                                 "description": "Unable to parse authentication token."}, 401)
+            if not auth:
+                raise AuthError({"code": "authorization_header_missing",
+                                 "description": "Authorization header is expected"}, 401)
+            payload = verify_token(get_token(auth))
             # Confrim the user_id is in datastore.
-            if len(model.get_entity_by_name("users", payload['sub'])) != 1:
-                if request.endpoint in ALLOWED_ENDPOINTS:
-                    return func(*args, **kwargs)
+            if not model.user_exists(payload['sub']):
                 raise AuthError({"code": "invalid_user_id",
                                  "description": "The user id is not in datastore."}, 401)
-            session['user_id'] = payload['sub']
-            _request_ctx_stack.top.curernt_user = payload
-            return func(*args, **kwargs)
-        if request.endpoint in ALLOWED_ENDPOINTS:
-            return func(*args, **kwargs)
-        raise AuthError({"code": "invalid_header",
-                         "description": "Unable to find appropriate key"}, 401)   
+        except AuthError:
+            # Endpoints in ALLOWED_ENDPOINTS are served without a user.
+            if request.endpoint in ALLOWED_ENDPOINTS:
+                return func(*args, **kwargs)
+            raise
+        # The identity only lives for the request, API responses never set
+        # a session cookie.
+        g.user_id = payload['sub']
+        g.current_user = payload
+        return func(*args, **kwargs)
     return decorated
 
 ############################ END CITED CODE ################################
\ No newline at end of file
@@ -0,0 +1,161 @@
+import json
+import logging
+import threading
+import time
+from urllib.request import urlopen
+from constants.constants import JWKS_CACHE_TTL, JWKS_MIN_REFRESH_INTERVAL
+from constants.constants import JWKS_FETCH_TIMEOUT
+
+logger = logging.getLogger(__name__)
+
+
+class JWKSError(Exception):
+    """
+    Raised when the key set cannot be fetched and there is no cached copy
+    to fall back to.
+    """
+
+
+def url_fetcher(url, timeout=JWKS_FETCH_TIMEOUT):
+    """
+    Return a fetcher that downloads the JWKS document from the url.
+
+    Parameters
+        url : str
+            the jwks.json url of the authorization server
+        timeout : int
+            seconds to wait for the authorization server
+    """
+    def fetch():
+        with urlopen(url, timeout=timeout) as res:
+            return json.loads(res.read())
+    return fetch
+
+def file_fetcher(path):
+    """
+    Return a fetcher that reads the JWKS document from a local file.
+    Used for testing and load testing against a locally signed key set.
+
+    Parameters
+        path : str
+            path of a jwks.json file
+    """
+    def fetch():
+        with open(path) as f:
+            return json.load(f)
+    return fetch
+
+
+class JWKSKeyStore:
+    """
+    Process-wide store of the authorization server's signing keys indexed
+    by 'kid'.
+
+    - The key set is cached for 'ttl' seconds.
+    - An unknown 'kid' triggers a single refresh, at most once every
+      'min_refresh_interval' seconds, so that forged kids cannot be used to
+      hammer the authorization server.
+    - When the key set expires, one caller refreshes it while the others keep
+      using the stale copy. If the refresh fails, the stale copy is served
+      and the refresh is retried after 'min_refresh_interval' seconds.
+    """
+
+    def __init__(self, fetcher, ttl=JWKS_CACHE_TTL,
+                 min_refresh_interval=JWKS_MIN_REFRESH_INTERVAL,
+                 clock=time.monotonic):
+        self._fetcher = fetcher
+        self._ttl = ttl
+        self._min_refresh_interval = min_refresh_interval
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._keys = None
+        self._expires_at = 0
+        self._last_refresh = None
+
+    def set_fetcher(self, fetcher):
+        """
+        Replace the fetcher and drop any cached keys.
+
+        Parameters
+            fetcher : callable
+                a function without arguments returning the JWKS document
+        """
+        with self._lock:
+            self._fetcher = fetcher
+            self._keys = None
+            self._expires_at = 0
+            self._last_refresh = None
+
+    def prime(self):
+        """
+        Fetch the key set unless a fresh copy is cached, e.g. when an
+        instance warms up. Raises JWKSError when it cannot be fetched.
+        """
+        now = self._clock()
+        if self._keys is None or now >= self._expires_at:
+            self._refresh(now, blocking=True)
+
+    def get_key(self, kid):
+        """
+        Return the RSA key of the kid or None when the authorization server
+        does not know the kid. Raises JWKSError when no key set is available.
+
+        Parameters
+            kid : str
+                'kid' value of the token header
+        Returns
+            rsa_key : dict
+                the key in the format expected by jose.jwt.decode
+        """
+        now = self._clock()
+        if self._keys is None or now >= self._expires_at:
+            self._refresh(now, blocking=self._keys is None)
+        key = self._keys.get(kid)
+        if key is None and self._can_refresh(now):
+            self._refresh(now, blocking=True, force=True)
+            key = self._keys.get(kid)
+        return key
+
+    def _can_refresh(self, now):
+        return self._last_refresh is None or \
+            now - self._last_refresh >= self._min_refresh_interval
+
+    def _refresh(self, now, blocking, force=False):
+        if not self._lock.acquire(blocking=blocking):
+            # Another request is refreshing, keep serving the stale keys.
+            return
+        try:
+            # The key set may have been refreshed while waiting for the lock.
+            if self._keys is not None and (
+                    (not force and now < self._expires_at) or
+                    (force and not self._can_refresh(now))):
+                return
+            self._last_refresh = now
+            try:
+                jwks = self._fetcher()
+            except Exception as err:
+                if self._keys is None:
+                    raise JWKSError(str(err)) from err
+                logger.warning("JWKS refresh failed, serving stale keys: %s",
+                               err)
+                self._expires_at = now + self._min_refresh_interval
+                return
+            self._keys = self._index(jwks)
+            self._expires_at = now + self._ttl
+        finally:
+            self._lock.release()
+
+    @staticmethod
+    def _index(jwks):
+        keys = {}
+        for key in jwks.get("keys", []):
+            if key.get("kty") != "RSA" or "kid" not in key:
+                continue
+            keys[key["kid"]] = {
+                "kty": key["kty"],
+                "kid": key["kid"],
+                "use": key.get("use"),
+                "n": key["n"],
+                "e": key["e"]
+            }
+        return keys
@@ -37,7 +37,7 @@ def validate_required(kind, property):
     # For PUT /tasks/:task_id. The 'completed' property is not in constants.py
     if request.endpoint == 'task_api.task_patch_put' and \
         request.method == "PUT":
-        required_property.append("completed")
+        required_property = required_property + ["completed"]
 
     for p in required_property:
         if p not in property:
@@ -63,14 +63,15 @@ def validate_task_property(task_property):
         # Check due_date
         try:
             datetime.strptime(task_property['due_date'], '%Y-%m-%d')
-        except ValueError:
+        except (ValueError, TypeError):
             raise BadRequest({
                 "code": "invalid_due_date",
                 "description": "Cannot parse the due_date."
             }, 400)            
 
-    # Check completed - for task_patch_put route only.
-    if request.endpoint == 'task_api.task_patch_put' and \
+    # Check completed - for the routes updating tasks only.
+    if request.endpoint in ('task_api.task_patch_put', 'task_api.task_batch',
+                            'import_api.import_post') and \
         'completed' in task_property and \
         type(task_property['completed']) != bool:
         raise BadRequest({
@@ -91,7 +92,8 @@ def validate_task_list_property(list_property):
     """
     # Check name
     if 'name' in list_property and \
-        len(list_property['name']) > MAX_LIST_NAME_LEN:
+        (not isinstance(list_property['name'], str) or
+         len(list_property['name']) > MAX_LIST_NAME_LEN):
         raise BadRequest({
             "code": "invalid_list_name",
             "description": f"The list name exceeds {MAX_LIST_NAME_LEN} characters."
@@ -0,0 +1,89 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from constants.constants import TOKEN_CACHE_SIZE
+
+
+class VerifiedTokenCache:
+    """
+    Bounded LRU cache of verified JWT claims. Entries are keyed by the
+    SHA-256 digest of the token, so raw tokens are never kept in memory,
+    and are evicted once the token's 'exp' has passed.
+    """
+
+    def __init__(self, maxsize=TOKEN_CACHE_SIZE, clock=time.time):
+        self._maxsize = maxsize
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _digest(token):
+        return hashlib.sha256(token.encode()).digest()
+
+    def get(self, token):
+        """
+        Return the cached claims of the token, or None if the token has not
+        been verified yet or has expired.
+
+        Parameters
+            token : str
+                the bearer token
+        """
+        digest = self._digest(token)
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is not None:
+                exp, claims = entry
+                if exp > self._clock():
+                    self._entries.move_to_end(digest)
+                    self.hits += 1
+                    return claims
+                del self._entries[digest]
+            self.misses += 1
+            return None
+
+    def put(self, token, claims):
+        """
+        Cache the verified claims of the token until its 'exp'. Tokens
+        without a numeric 'exp' are not cached.
+
+        Parameters
+            token : str
+                the bearer token
+            claims : dict
+                the payload returned by jose.jwt.decode
+        """
+        exp = claims.get("exp")
+        if not isinstance(exp, (int, float)) or exp <= self._clock():
+            return
+        digest = self._digest(token)
+        with self._lock:
+            self._entries[digest] = (exp, claims)
+            self._entries.move_to_end(digest)
+            while len(self._entries) > self._maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        """
+        Returns hit and miss counters of the cache. Every hit is an RS256
+        signature verification that has been skipped.
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "size": len(self._entries),
+                "maxsize": self._maxsize
+            }